@@ -0,0 +1,118 @@
+"""
+Benchmark of the SUMO backends (traci vs libsumo) for the calib pipeline
+
+Calibrates the first --vehicles vehicles of one detector-day on data/map/Hornsgatan.net.xml once per backend,
+each backend in its own Python process, and reports vehicles calibrated per minute.
+
+Command (from the repository root):
+    python -m benchmarks.bench_backend --date 2020-01-01 --detector w2e_out --vehicles 20 --iteration 20
+
+Input:
+    data/transform_raw_data/test_radar_data_out.csv (output of --pipeline import_data)
+Working files are written to data/benchmark/
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+BENCH_DIR = "data/benchmark/"
+
+
+def prepare_day(date, source="data/transform_raw_data/test_radar_data_out.csv"):
+    """
+    Write the daily split file for date to BENCH_DIR, the same format as --pipeline import_data produces
+    """
+    pathin = f"{BENCH_DIR}daily_splitted_data/"
+    os.makedirs(pathin, exist_ok=True)
+    data = pd.read_csv(source)
+    day = pd.to_datetime(data["time_detector_real"], unit="s").dt.date.astype(str)
+    data[day == date].to_csv(f"{pathin}data_{date}.csv", index=False)
+    return pathin
+
+
+def calib_config(backend, date, detector, vehicles, iteration, pathin):
+    """
+    Calib config for one benchmark run, intermediate and output folders per backend
+    """
+    path = f"{BENCH_DIR}intermediate_{backend}/"
+    pathout = f"{BENCH_DIR}calibration_data_{backend}/"
+    os.makedirs(path, exist_ok=True)
+    os.makedirs(pathout, exist_ok=True)
+    return {
+        "date": date,
+        "detector": detector,
+        "path": path,
+        "pathout": pathout,
+        "pathin": pathin,
+        "iteration": iteration,
+        "init_number": vehicles,
+        "network_file": "data/map/Hornsgatan.net.xml",
+        "base_estimator": "GP",
+        "acq_func": "LCB",
+        "n_initial_points": 5,
+        "no_speed": False,
+        "name": f"bench_{backend}",
+        "backend": backend,
+    }
+
+
+def run_worker(config):
+    """
+    Run the calib DAG in this process and return the timing
+    """
+    from hamilton import driver
+    from src.pipeline import features_calib
+    from src.tools import sumo_backend
+
+    sumo_backend.select(config["backend"])
+    dr = driver.Builder().with_config(config).with_modules(features_calib).build()
+
+    start = time.perf_counter()
+    dr.execute(["calibrated_data"])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "backend": config["backend"],
+        "vehicles": config["init_number"],
+        "iteration": config["iteration"],
+        "seconds": round(elapsed, 2),
+        "vehicles_per_minute": round(60 * config["init_number"] / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark traci vs libsumo for the calib pipeline")
+    parser.add_argument("--date", type=str, default="2020-01-01")
+    parser.add_argument("--detector", type=str, default="w2e_out")
+    parser.add_argument("--vehicles", type=int, default=20, help="Number of vehicles to calibrate")
+    parser.add_argument("--iteration", type=int, default=20, help="Optimizer iterations per vehicle")
+    parser.add_argument("--backends", nargs="+", default=["traci", "libsumo"])
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    pathin = prepare_day(args.date)
+    results = []
+    for backend in args.backends:
+        config = calib_config(backend, args.date, args.detector, args.vehicles, args.iteration, pathin)
+        # One process per backend: libsumo and traci must not share a process
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_backend", "--worker", json.dumps(config)],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    table = pd.DataFrame(results)
+    table["speedup"] = (table["vehicles_per_minute"] / table["vehicles_per_minute"].iloc[0]).round(2)
+    print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
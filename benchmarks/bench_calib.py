@@ -0,0 +1,220 @@
+"""
+Calibration throughput benchmark on seeded synthetic detector days
+
+For every detector and density a synthetic detector-day is generated (seeded, so every commit sees the same
+workload), features_calib.calibrated_data is run end to end in its own Python process and the throughput
+is reported:
+    - vehicles_per_sec:          calibrated vehicles per second of wall-clock
+    - simulated_s_per_sec:       simulated seconds per second of wall-clock, counted as the time advanced by every
+                                 simulationStep() call (a look-ahead jump counts all its seconds)
+    - traci_calls_per_vehicle:   TraCI calls that reach SUMO per calibrated vehicle, counted per method on every
+                                 domain and connection of src.tools.sumo_backend (sumo_calls(): subscription result
+                                 reads are local and left out)
+    - peak_rss_mb:               peak resident memory of the Python process (includes SUMO with --backend libsumo)
+The workloads are seeded, the optimizer is not: expect a few percent of run-to-run noise.
+
+Command (from the repository root):
+    python -m benchmarks.bench_calib --vehicles 20 --densities 120 600 --iteration 10 --backend libsumo
+    python -m benchmarks.bench_calib --baseline data/benchmark/bench_calib_<commit>.json
+
+Results are written to data/benchmark/bench_calib_<commit>.json (--output to change), --baseline adds the
+ratio to an earlier result file for the same workloads.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = "data/benchmark/"
+
+DETECTORS = ["e2w_in", "e2w_out", "w2e_in", "w2e_out"]
+
+# Speed at the detector in km/h (mean, std) on 2020-01-01 of data/transform_raw_data/test_radar_data_out.csv, rounded
+# to 0.1 (see speed_stats()). Fixed here, so every commit and machine generates the same workloads.
+SPEED_STATS = {
+    "e2w_in": (33.7, 7.9),
+    "e2w_out": (32.0, 10.5),
+    "w2e_in": (31.2, 6.7),
+    "w2e_out": (26.5, 13.5),
+}
+
+# 2020-01-01 06:00 UTC, synthetic days start at the morning rush
+DAY_START = 1577858400
+
+
+def speed_stats(path="data/transform_raw_data/test_radar_data_out.csv", date="2020-01-01"):
+    """
+    Mean and std of the speeds of every detector on one date of a transform_raw_data file, as in SPEED_STATS:
+        python -c "from benchmarks.bench_calib import speed_stats; print(speed_stats())"
+    """
+    data = pd.read_csv(path)
+    data = data[pd.to_datetime(data["time_detector_real"], unit="s").dt.date.astype(str) == date]
+    stats = data.groupby("detector_id")["speed_detector_real"].agg(["mean", "std"]).round(1)
+    return {detector: (float(row["mean"]), float(row["std"])) for detector, row in stats.iterrows()}
+
+
+def synthetic_day(detector, vehicles, density, seed=0):
+    """
+    Seeded synthetic detector data, the same columns as data/daily_splitted_data
+
+    Args:
+        detector: Detector ID
+        vehicles: Number of vehicles
+        density: Mean number of vehicles per hour (exponential headways, at least 1 s)
+        seed: Random seed
+
+    Returns:
+        DataFrame with detector_id, time_detector_real, speed_detector_real (km/h) and date
+    """
+    rng = np.random.default_rng([seed, DETECTORS.index(detector), int(density)])
+    headways = np.maximum(1, np.round(rng.exponential(3600 / density, vehicles)))
+    mean, std = SPEED_STATS[detector]
+    return pd.DataFrame({
+        "detector_id": detector,
+        "time_detector_real": (DAY_START + np.cumsum(headways)).astype(int),
+        "speed_detector_real": np.clip(np.round(rng.normal(mean, std, vehicles)), 5, 90).astype(int),
+        "date": "2020-01-01",
+    })
+
+
+def workload_name(detector, vehicles, density, seed):
+    return f"synth-{detector}-{vehicles}-{int(density)}-{seed}"
+
+
+def calib_config(detector, vehicles, density, iteration, seed, backend="traci"):
+    """
+    Write the synthetic day and return the calib config of one workload
+    """
+    name = workload_name(detector, vehicles, density, seed)
+    pathin = f"{BENCH_DIR}synthetic/"
+    path = f"{BENCH_DIR}intermediate_{name}/"
+    pathout = f"{BENCH_DIR}calibration_data_{name}/"
+    for folder in (pathin, path, pathout):
+        os.makedirs(folder, exist_ok=True)
+    synthetic_day(detector, vehicles, density, seed).to_csv(f"{pathin}data_{name}.csv", index=False)
+    return {
+        "date": name,
+        "detector": detector,
+        "path": path,
+        "pathout": pathout,
+        "pathin": pathin,
+        "iteration": iteration,
+        "init_number": vehicles,
+        "network_file": "data/map/Hornsgatan.net.xml",
+        "base_estimator": "GP",
+        "acq_func": "LCB",
+        "n_initial_points": 5,
+        "no_speed": False,
+        "name": name,
+        "density": density,
+        "seed": seed,
+        "backend": backend,
+    }
+
+
+def run_worker(config):
+    """
+    Run the calib DAG in this process and return the measurements
+    """
+    import resource
+    from hamilton import driver
+    from src.pipeline import features_calib
+    from src.tools import sumo_backend
+
+    sumo_backend.select(config["backend"])
+    dr = driver.Builder().with_config(config).with_modules(features_calib).build()
+
+    sumo_backend.count_calls()
+    sumo_backend.reset_call_counts()
+    start = time.perf_counter()
+    dr.execute(["calibrated_data"])
+    elapsed = time.perf_counter() - start
+    traci_calls = sumo_backend.sumo_calls()
+    simulated = sumo_backend.simulated_seconds()
+
+    # ru_maxrss is in kB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    vehicles = config["init_number"]
+    return {
+        "workload": config["name"],
+        "detector": config["detector"],
+        "vehicles": vehicles,
+        "density": config["density"],
+        "iteration": config["iteration"],
+        "seed": config["seed"],
+        "backend": config["backend"],
+        "seconds": round(elapsed, 2),
+        "vehicles_per_sec": round(vehicles / elapsed, 4),
+        "simulated_s": round(simulated, 1),
+        "simulated_s_per_sec": round(simulated / elapsed, 1),
+        "traci_calls": traci_calls,
+        "traci_calls_per_vehicle": round(traci_calls / vehicles, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(table, baseline_file):
+    """
+    Add the ratio to the results of an earlier run for the same workloads
+    """
+    with open(baseline_file) as file:
+        baseline = pd.DataFrame(json.load(file)["results"]).set_index("workload")
+    for column in ("vehicles_per_sec", "simulated_s_per_sec", "traci_calls_per_vehicle", "peak_rss_mb"):
+        table[f"{column}_ratio"] = (table[column] / table["workload"].map(baseline[column])).round(2)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibration throughput on seeded synthetic detector days")
+    parser.add_argument("--detectors", nargs="+", default=DETECTORS, choices=DETECTORS)
+    parser.add_argument("--vehicles", type=int, default=20, help="Vehicles per synthetic day")
+    parser.add_argument("--densities", nargs="+", type=float, default=[120, 600], help="Vehicles per hour")
+    parser.add_argument("--iteration", type=int, default=10, help="Optimizer iterations per vehicle")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", type=str, default="traci", choices=["traci", "libsumo"])
+    parser.add_argument("--output", type=str, default=None, help="Result file (default: per commit)")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier result file to compare with")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    commit = git_commit()
+    results = []
+    for detector in args.detectors:
+        for density in args.densities:
+            config = calib_config(detector, args.vehicles, density, args.iteration, args.seed, args.backend)
+            # One process per workload, so the peak RSS belongs to a single run
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_calib", "--worker", json.dumps(config)],
+                                 capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    output = args.output or f"{BENCH_DIR}bench_calib_{commit}.json"
+    with open(output, "w") as file:
+        json.dump({"commit": commit, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, file, indent=2)
+
+    table = pd.DataFrame(results)
+    if args.baseline:
+        table = compare(table, args.baseline)
+    print(table.drop(columns=["seed", "simulated_s", "traci_calls"]).to_string(index=False))
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
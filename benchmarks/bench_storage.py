@@ -0,0 +1,152 @@
+"""
+CSV against Parquet storage of the import_data outputs
+
+A transform_raw_data file (detector_id, time_detector_real, speed_detector_real) is written in both formats, as
+the pipelines do it with storage: csv / parquet (see src.tools.storage):
+    - transform:   {name}_out.csv / {name}_out.parquet, read whole
+    - day:         data_{date}.csv / data_{date}.parquet/ of every date, read whole
+    - detector:    one detector of every date, read as features_calib.raw_data does it (csv: parse the day file and
+                   filter, parquet: the columns of the calib pipeline from the detector partition)
+and reported per stage and format:
+    - size_mb:     size on disk (all files of the stage)
+    - write_s:     time to write
+    - parse_s:     time to read, best of --repeat runs
+--scale repeats the rows to get a larger workload (more rows per date, same dates).
+
+Command (from the repository root, needs pyarrow):
+    python -m benchmarks.bench_storage
+    python -m benchmarks.bench_storage --input data/transform_raw_data/test_radar_data_out.csv --scale 10
+
+Results are written to data/benchmark/bench_storage_<commit>.json (--output to change).
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from benchmarks.bench_calib import BENCH_DIR, DETECTORS, git_commit
+from src.pipeline import features_calib
+from src.tools import storage
+
+STORAGE_DIR = f"{BENCH_DIR}storage/"
+
+
+def size_mb(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1e6
+
+
+def best_of(function, repeat):
+    """
+    Shortest wall-clock of repeat calls
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def write_stages(data, pathout, storage_format):
+    """
+    Write the transform file and the day files in one format, as features_import_data does
+
+    Returns:
+        Dictionary of stage -> (paths, write seconds), list of dates
+    """
+    os.makedirs(pathout, exist_ok=True)
+    transform_path = f"{pathout}bench_out.{storage_format}"
+    if storage_format == "parquet":
+        transform_s = timed(lambda: storage.write_frame(data, transform_path))
+    else:
+        transform_s = timed(lambda: data.to_csv(transform_path, index=False))
+
+    time_real = pd.to_datetime(data["time_detector_real"], unit="s")
+    data = data.assign(day=time_real.dt.day_name(), date=time_real.dt.date)
+    day_paths, day_s = [], 0.0
+    for date, group in data.groupby("date"):
+        path = f"{pathout}data_{date}.{storage_format}"
+        if storage_format == "parquet":
+            day_s += timed(lambda: storage.write_day(group, path))
+        else:
+            day_s += timed(lambda: group.to_csv(path, index=False))
+        day_paths.append(path)
+    return {"transform": ([transform_path], transform_s), "day": (day_paths, day_s)}, sorted(data["date"].unique())
+
+
+def run(data, repeat):
+    """
+    Sizes, write and parse times of every stage in both formats
+
+    Returns:
+        List of result rows
+    """
+    results = []
+    for storage_format in storage.FORMATS:
+        pathout = f"{STORAGE_DIR}{storage_format}/"
+        shutil.rmtree(pathout, ignore_errors=True)
+        stages, dates = write_stages(data, pathout, storage_format)
+        read = storage.read_frame if storage_format == "parquet" else pd.read_csv
+        read_day = storage.read_day if storage_format == "parquet" else pd.read_csv
+        detectors = [detector for detector in DETECTORS if detector in set(data["detector_id"].dropna())]
+        parse = {
+            "transform": lambda: [read(path) for path in stages["transform"][0]],
+            "day": lambda: [read_day(path) for path in stages["day"][0]],
+            "detector": lambda: [features_calib.raw_data(pathout, str(date), detector, storage_format)
+                                 for date in dates for detector in detectors],
+        }
+        for stage in ("transform", "day", "detector"):
+            paths, write_s = stages["day" if stage == "detector" else stage]
+            results.append({
+                "stage": stage,
+                "storage": storage_format,
+                "files": len(paths),
+                "size_mb": round(sum(size_mb(path) for path in paths), 2),
+                "write_s": round(write_s, 3),
+                "parse_s": round(best_of(parse[stage], repeat), 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV against Parquet storage of the import_data outputs")
+    parser.add_argument("--input", type=str, default="data/transform_raw_data/test_radar_data_out.csv",
+                        help="transform_raw_data csv file")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat the rows of the input")
+    parser.add_argument("--repeat", type=int, default=3, help="Parse runs per stage, the best one is reported")
+    parser.add_argument("--output", type=str, default=None, help="Result file (default: per commit)")
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.input)
+    data = pd.concat([data] * args.scale, ignore_index=True)
+    results = run(data, args.repeat)
+
+    commit = git_commit()
+    output = args.output or f"{BENCH_DIR}bench_storage_{commit}.json"
+    with open(output, "w") as file:
+        json.dump({"commit": commit, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "input": args.input,
+                   "rows": len(data), "results": results}, file, indent=2)
+
+    table = pd.DataFrame(results)
+    csv_rows = table[table["storage"] == "csv"].set_index("stage")
+    for column in ("size_mb", "parse_s"):
+        table[f"{column}_vs_csv"] = (table[column] / table["stage"].map(csv_rows[column])).round(2)
+    print(f"{len(data)} rows of {args.input}")
+    print(table.to_string(index=False))
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
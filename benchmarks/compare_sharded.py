@@ -0,0 +1,102 @@
+"""
+Check of the sharded calibration against the serial run
+
+The same calib config is run serially (n_shards: 1) and sharded, every run in its own process and folder as in
+sweep_calib. The stitched results are compared with the serial ones:
+    - vehicles:                  the sharded run has every vehicle of the serial run once
+    - depart_chain:              the departs of the stitched file increase, also across the seams
+    - time_sim_max_diff:         largest |time_detector_sim sharded - serial| of a vehicle in s
+    - time_sim_diff_share:       share of vehicles differing by more than shard_tolerance
+    - rmse_time / rmse_speed:    accuracy of both runs (see sweep_calib.accuracy)
+The optimizer is not seeded, so single vehicles differ between any two runs, also two serial ones. The check
+fails (exit code 1) if a vehicle is missing or doubled, the depart chain is broken, or rmse_time of the sharded run
+is more than shard_tolerance above the serial one.
+
+Command (from the repository root):
+    python -m benchmarks.compare_sharded --config config/calib_example.yaml --init-number 40 --n-shards 4
+
+The runs are written to data/benchmark/sweep_sharded_<name>/, the comparison to its compare.csv.
+"""
+import argparse
+import glob
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import yaml
+
+from benchmarks.sweep_calib import SWEEP_DIR, combinations, run
+
+SHARD_TOLERANCE = 1.0
+
+
+def compare(serial_dir, sharded_dir, tolerance=SHARD_TOLERANCE):
+    """
+    Compare the stitched results of a sharded run with the serial results of the same vehicles
+
+    Args:
+        serial_dir: Output folder of the serial run
+        sharded_dir: Output folder of the sharded run
+        tolerance: Allowed deviation of time_detector_sim in s
+
+    Returns:
+        Dictionary of the checks
+    """
+    serial = pd.read_csv(glob.glob(f"{serial_dir}calibrated_data_*.csv")[0]).set_index("veh_id")
+    sharded = pd.read_csv(glob.glob(f"{sharded_dir}calibrated_data_*.csv")[0])
+    same_vehicles = sharded["veh_id"].is_unique and set(sharded["veh_id"]) == set(serial.index)
+    diff = (sharded.set_index("veh_id")["time_detector_sim"] - serial["time_detector_sim"]).abs().dropna()
+    return {
+        "vehicles": same_vehicles,
+        "depart_chain": bool(sharded["depart"].is_monotonic_increasing and sharded["depart"].is_unique),
+        "time_sim_max_diff": round(float(diff.max()), 3) if len(diff) else 0.0,
+        "time_sim_diff_share": round(float((diff > tolerance).mean()), 3) if len(diff) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check of the sharded calibration against the serial run")
+    parser.add_argument("--config", type=str, required=True, help="Calib config")
+    parser.add_argument("--n-shards", type=int, default=4, help="Shards of the sharded run")
+    parser.add_argument("--init-number", type=int, default=None, help="Vehicles per run (overrides the config)")
+    parser.add_argument("--backend", type=str, default=None, choices=["traci", "libsumo"])
+    parser.add_argument("--name", type=str, default=None, help="Name of the check (default: date and time)")
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        base = yaml.safe_load(file)
+    if args.init_number is not None:
+        base["init_number"] = args.init_number
+    tolerance = base.get("shard_tolerance", SHARD_TOLERANCE)
+
+    check_dir = f"{SWEEP_DIR}sweep_sharded_{args.name or time.strftime('%Y%m%d-%H%M%S')}/"
+    configs = combinations(base, {"n_shards": [1, args.n_shards]}, check_dir)
+    print(f"Serial and {args.n_shards}-shard run of {base['init_number']} vehicles in {check_dir}")
+    # Both runs are subprocesses, the threads only wait for them
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        rows = list(executor.map(lambda combination: run(*combination, backend=args.backend), configs))
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False))
+    if any(row["status"] != "ok" for row in rows):
+        print("A run failed, see its calib.log")
+        return 1
+
+    (_, serial), (_, sharded) = configs
+    checks = compare(serial["pathout"], sharded["pathout"], tolerance)
+    checks["rmse_time_serial"], checks["rmse_time_sharded"] = rows[0]["rmse_time"], rows[1]["rmse_time"]
+    checks["rmse_speed_serial"], checks["rmse_speed_sharded"] = rows[0]["rmse_speed"], rows[1]["rmse_speed"]
+    pd.DataFrame([checks]).to_csv(f"{check_dir}compare.csv", index=False)
+    print(pd.Series(checks).to_string())
+
+    failed = [name for name, ok in [
+        ("vehicles", checks["vehicles"]),
+        ("depart_chain", checks["depart_chain"]),
+        ("rmse_time", checks["rmse_time_sharded"] <= checks["rmse_time_serial"] + tolerance),
+    ] if not ok]
+    print(f"Failed: {', '.join(failed)}" if failed else "Sharded run matches the serial run")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
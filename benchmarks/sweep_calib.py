@@ -0,0 +1,171 @@
+"""
+Hyperparameter sweep of the calib pipeline
+
+Every combination of a parameter grid is run as its own calib pipeline (python main.py --pipeline calib) with its
+own intermediate and output folder, several at a time. The results are summarised in one table:
+    - rmse_time / mae_time:      delta_time of calibrated_data_{postfix}.csv in s
+    - rmse_speed / mae_speed:    delta_speed in m/s
+    - within_tolerance:          share of vehicles with |delta_time| <= 1 s and |delta_speed| <= 1 m/s
+    - mean_iterations:           mean stop_iteration (SUMO runs per vehicle)
+    - wall_s:                    wall-clock of the run, optimizer_s / simulation_s from its timing sidecar
+Keep init_number small (e.g. 20) so that a sweep finishes in minutes.
+
+Command (from the repository root):
+    python -m benchmarks.sweep_calib --config config/calib_example.yaml --init-number 20 \\
+        --param base_estimator=GP,RF --param acq_func=LCB,EI --param iteration=20,40
+    python -m benchmarks.sweep_calib --config config/calib_example.yaml --grid sweep.yaml --workers 4
+
+A --grid file maps every parameter to a list of values, --param adds or replaces one parameter. The runs are
+written to data/benchmark/sweep_<name>/<combination>/, the table to data/benchmark/sweep_<name>/sweep.csv.
+"""
+import argparse
+import glob
+import itertools
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+SWEEP_DIR = "data/benchmark/"
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# Tolerances of within_tolerance
+TIME_TOLERANCE = 1.0
+SPEED_TOLERANCE = 1.0
+
+
+def parameter_grid(grid_file=None, params=()):
+    """
+    Parameter grid from a YAML file and KEY=V1,V2 options
+
+    Returns:
+        Dictionary of parameter -> list of values (parsed as YAML, so 40 is an int and true a bool)
+    """
+    grid = {}
+    if grid_file:
+        with open(grid_file) as file:
+            grid = {key: values if isinstance(values, list) else [values]
+                    for key, values in yaml.safe_load(file).items()}
+    for param in params:
+        key, _, values = param.partition("=")
+        grid[key] = [yaml.safe_load(value) for value in values.split(",")]
+    return grid
+
+
+def combinations(base, grid, sweep_dir):
+    """
+    Configs of all combinations of the grid, every one with its own folders
+
+    Args:
+        base: Base calib config
+        grid: Dictionary of parameter -> list of values
+        sweep_dir: Folder of the sweep
+
+    Returns:
+        List of (parameters, config)
+    """
+    configs = []
+    for values in itertools.product(*grid.values()):
+        params = dict(zip(grid.keys(), values))
+        name = "_".join(str(value) for value in values)
+        run_dir = f"{sweep_dir}{name}/"
+        config = {**base, **params, "name": name, "path": f"{run_dir}intermediate/", "pathout": f"{run_dir}output/"}
+        for folder in (config["path"], config["pathout"]):
+            os.makedirs(folder, exist_ok=True)
+        with open(f"{run_dir}config.yaml", "w") as file:
+            yaml.safe_dump(config, file, sort_keys=False)
+        configs.append((params, config))
+    return configs
+
+
+def run(params, config, backend=None):
+    """
+    Run the calib pipeline of one combination in its own process and measure it
+
+    Returns:
+        Row of the sweep table
+    """
+    run_dir = os.path.dirname(config["path"].rstrip("/")) + "/"
+    command = [sys.executable, MAIN, "--pipeline", "calib", "--config", f"{run_dir}config.yaml"]
+    if backend:
+        command += ["--backend", backend]
+    start = time.perf_counter()
+    with open(f"{run_dir}calib.log", "w") as log:
+        returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+    row = {**params, "name": config["name"], "status": "ok" if returncode == 0 else f"failed ({returncode})",
+           "wall_s": round(time.perf_counter() - start, 1)}
+    if returncode == 0:
+        row.update(accuracy(config["pathout"]))
+    return row
+
+
+def accuracy(pathout):
+    """
+    Accuracy and time split of a finished run, from the files in its output folder
+    """
+    results = pd.read_csv(glob.glob(f"{pathout}calibrated_data_*.csv")[0])
+    within = (results["delta_time"].abs() <= TIME_TOLERANCE) & (results["delta_speed"].abs() <= SPEED_TOLERANCE)
+    row = {
+        "vehicles": len(results),
+        "rmse_time": round(float(np.sqrt((results["delta_time"] ** 2).mean())), 3),
+        "mae_time": round(float(results["delta_time"].abs().mean()), 3),
+        "rmse_speed": round(float(np.sqrt((results["delta_speed"] ** 2).mean())), 3),
+        "mae_speed": round(float(results["delta_speed"].abs().mean()), 3),
+        "within_tolerance": round(float(within.mean()), 3),
+        "mean_iterations": round(float(results["stop_iteration"].mean()), 1),
+    }
+    timing = glob.glob(f"{pathout}timing_*.csv")
+    if timing:
+        phases = pd.read_csv(timing[0])
+        phases = phases[phases["scope"] == "iteration"]
+        row["optimizer_s"] = round(float(phases[["ask_s", "tell_s"]].sum().sum()), 1)
+        row["simulation_s"] = round(float(phases[["load_state_s", "save_state_s", "step_s", "fcd_s"]].sum().sum()), 1)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep of the calib pipeline")
+    parser.add_argument("--config", type=str, required=True, help="Base calib config")
+    parser.add_argument("--grid", type=str, default=None, help="YAML file with a list of values per parameter")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=V1,V2",
+                        help="Values of one parameter, replaces the grid file entry")
+    parser.add_argument("--init-number", type=int, default=None, help="Vehicles per run (overrides the config)")
+    parser.add_argument("--workers", type=int, default=0, help="Concurrent runs (default: one per CPU)")
+    parser.add_argument("--backend", type=str, default=None, choices=["traci", "libsumo"])
+    parser.add_argument("--name", type=str, default=None, help="Sweep name (default: date and time)")
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        base = yaml.safe_load(file)
+    if args.init_number is not None:
+        base["init_number"] = args.init_number
+    grid = parameter_grid(args.grid, args.param)
+    if not grid:
+        parser.error("No parameters to sweep, use --grid or --param")
+
+    sweep_dir = f"{SWEEP_DIR}sweep_{args.name or time.strftime('%Y%m%d-%H%M%S')}/"
+    configs = combinations(base, grid, sweep_dir)
+    workers = min(args.workers or os.cpu_count(), len(configs))
+    print(f"Sweep of {len(configs)} combinations ({base['init_number']} vehicles each) on {workers} workers "
+          f"in {sweep_dir}")
+
+    # Every run is a subprocess, the threads only wait for them
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(lambda combination: run(*combination, backend=args.backend), configs))
+
+    table = pd.DataFrame(rows)
+    if "rmse_time" in table:
+        table = table.sort_values("rmse_time", na_position="last")
+    table.to_csv(f"{sweep_dir}sweep.csv", index=False)
+    print(table.to_string(index=False))
+    print(f"Table written to {sweep_dir}sweep.csv")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
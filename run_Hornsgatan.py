@@ -4,6 +4,7 @@ import argparse
 import yaml
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 """ Script to run the pipelines in Hornsgatan
 
@@ -21,6 +22,9 @@ Command:
     - - Running only a single pipelines
     python run_Hornsgatan.py --config config/config-TEST.yaml --simulation_name TEST --init_number 1000 --verbose --only_run_import_data (or --only_run_calib or --only_run_sim)
 
+    - - Calibrating all detectors at once, one calib process (and one SUMO instance) per detector
+    python run_Hornsgatan.py --config config/config-TEST.yaml --simulation_name TEST --init_number 0 --only_run_calib --parallel_calib
+
 Prerequisites:
     1. Ensure required timestamps are in folder "config['hornsgatan_home']/data/raw_data" with format "timestamps-TEST.csv"
     2. Ensure the config "config-TEST.yaml" has the following entries:
@@ -44,6 +48,8 @@ Example of a config.yaml
     date: "2020-01-02"  # Date to consider. Calib and sim are run with only data from this date. Other dates, if provided in input timestamps, are ignored.
     no_speed: false  # If "true", skips using speed in calibration, if "false", uses deviation in measured and simulated of both speed and time 
     calib_with_fcd: "True"  # If "True", calib pipeline outputs an fcd at the end. If "False", fcd is not produced. Fcd in calib may be useful for comparing with fcd from sim
+    storage: "csv"  # Optional. "parquet" hands the data between the pipelines over as Parquet (needs pyarrow)
+    incremental: false  # Optional. If true, import_data imports only new or changed days of the timestamps file (see src/tools/manifest.py)
 
 """
 
@@ -89,13 +95,16 @@ def create_yaml_file(data, path_to_file):
 
 def move_all_files_from_folder_to_folder(folder_from, folder_to):
     """
-    Move ALL files from folder_from to folder_to
+    Move ALL files (and Parquet dataset folders) from folder_from to folder_to
     """
     if not os.path.exists(folder_to):
         os.makedirs(folder_to)
 
     for cur_file in os.listdir(folder_from):
-        if os.path.isfile(os.path.join(folder_from, cur_file)) and cur_file[0] != '.':
+        is_dataset = os.path.isdir(os.path.join(folder_from, cur_file)) and cur_file.endswith('.parquet')
+        if (os.path.isfile(os.path.join(folder_from, cur_file)) or is_dataset) and cur_file[0] != '.':
+            if is_dataset and os.path.isdir(os.path.join(folder_to, cur_file)):
+                shutil.rmtree(os.path.join(folder_to, cur_file))
             shutil.move(os.path.join(folder_from, cur_file), os.path.join(folder_to, cur_file))
 
     return 0
@@ -112,6 +121,19 @@ def delete_all_files_in_folder(folder):
     return 0
 
 
+def calibrate_detector(cur_detector, config_calib_path, calib_with_fcd, hornsgatan_home, verbose):
+    """
+    Run --pipeline calib for a single detector. Raises if the run fails (see run_command_on_bash)
+    """
+    print(f"Processing detector: {cur_detector}")
+    command_to_run = f"python main.py --pipeline calib --config {config_calib_path}"
+    if calib_with_fcd:
+        command_to_run += ' --fcd'  # Add --fcd option to calib if required
+    run_command_on_bash(command_to_run, hornsgatan_home, verbose)
+
+    return cur_detector
+
+
 def main():
     parser = argparse.ArgumentParser(description="Running Hornsgatan")
     parser.add_argument('--simulation_name', help='Name of folder to store simulation', required=True)
@@ -122,6 +144,10 @@ def main():
     parser.add_argument('--only_run_calib', action='store_true', help='Run only calib pipeline')
     parser.add_argument('--only_run_sim', action='store_true', help='Run only sim pipeline')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
+    parser.add_argument('--parallel_calib', action='store_true',
+                        help='Calibrate all detectors in detector_list at the same time, one calib process per detector')
+    parser.add_argument('--n_workers', type=int, default=None,
+                        help='Number of concurrent calib processes for --parallel_calib. Defaults to one per detector')
 
     args, _ = parser.parse_known_args()
 
@@ -141,12 +167,16 @@ def main():
     date = config['date']
     no_speed = config['no_speed']
     calib_with_fcd = eval(config['calib_with_fcd'])
+    storage = config.get('storage', 'csv')
+    incremental = config.get('incremental', False)
 
     only_run_import_data = args.only_run_import_data
     only_run_calib = args.only_run_calib
     only_run_sim = args.only_run_sim
 
     verbose = args.verbose
+    parallel_calib = args.parallel_calib
+    n_workers = args.n_workers if args.n_workers else len(detector_list)
 
     if not os.path.exists(hornsgatan_config):
         os.makedirs(hornsgatan_config)
@@ -167,8 +197,15 @@ def main():
         config_import_data = {
             'dataFilename': f'timestamps-{simulation_name}',
             'sensorFilename': "sensor_info",
-            'minimumLenData': config['minimumLenData']  # Reduce if timestamps-TEST.csv contains fewer than 10000 vehicles in one 24h day
+            'minimumLenData': config['minimumLenData'],  # Reduce if timestamps-TEST.csv contains fewer than 10000 vehicles in one 24h day
+            'storage': storage,
         }
+        if incremental:
+            # The days stay in the folder of the simulation with their manifest, nothing is moved or deleted
+            config_import_data.update({
+                'incremental': True,
+                'dailyPath': f"data/daily_splitted_data/{simulation_name}/",
+            })
         config_import_data_path = os.path.join(hornsgatan_config, f'import_data-{simulation_name}.yaml')
         create_yaml_file(config_import_data, config_import_data_path)
 
@@ -176,14 +213,21 @@ def main():
         command_to_run = f"python main.py --pipeline import_data --config {config_import_data_path}"
         run_command_on_bash(command_to_run, hornsgatan_home, verbose)
 
-        # Move files in folder "Hornsgatan/data/daily_splitted_data/" to "Hornsgatan/data/daily_splitted_data/{simulation_name}/"
-        folder_from = os.path.join(hornsgatan_home, 'data', 'daily_splitted_data')
-        folder_to = os.path.join(hornsgatan_home, 'data', 'daily_splitted_data', simulation_name)
-        move_all_files_from_folder_to_folder(folder_from, folder_to)
+        if incremental:
+            if hornsgatan_home not in sys.path:
+                sys.path.insert(0, hornsgatan_home)
+            from src.tools.manifest import Manifest
+            manifest = Manifest(os.path.join(hornsgatan_home, 'data', 'daily_splitted_data', simulation_name))
+            print(f"Days written by import run {manifest.run}: {manifest.new_days()}")
+        else:
+            # Move files in folder "Hornsgatan/data/daily_splitted_data/" to "Hornsgatan/data/daily_splitted_data/{simulation_name}/"
+            folder_from = os.path.join(hornsgatan_home, 'data', 'daily_splitted_data')
+            folder_to = os.path.join(hornsgatan_home, 'data', 'daily_splitted_data', simulation_name)
+            move_all_files_from_folder_to_folder(folder_from, folder_to)
 
-        # Delete all files in folder "Hornsgatan/data/transform_raw_data/"
-        folder_with_files_to_delete = os.path.join(hornsgatan_home, 'data', 'transform_raw_data')
-        delete_all_files_in_folder(folder_with_files_to_delete)
+            # Delete all files in folder "Hornsgatan/data/transform_raw_data/"
+            folder_with_files_to_delete = os.path.join(hornsgatan_home, 'data', 'transform_raw_data')
+            delete_all_files_in_folder(folder_with_files_to_delete)
 
     if not (only_run_import_data or only_run_sim):
 
@@ -197,15 +241,20 @@ def main():
         folder_to_create = os.path.join(hornsgatan_home, 'data', 'calibration_data', simulation_name)
         os.makedirs(folder_to_create, exist_ok=True)
 
-        # Iterate through detector list
+        intermediate_dir = os.path.join(hornsgatan_home, 'data', 'calibration_intermediate_data')
+
+        # Create one config file per detector. In parallel mode every detector also gets its own
+        # intermediate folder, so that the concurrent SUMO instances never share state files
+        config_calib_paths = {}
         for cur_detector in detector_list:
-            print(f"Processing detector: {cur_detector}")
+            path_intermediate = f"data/calibration_intermediate_data/{cur_detector}/" if parallel_calib \
+                else "data/calibration_intermediate_data/"
+            os.makedirs(os.path.join(hornsgatan_home, path_intermediate), exist_ok=True)
 
-            # Create config file for calib
             config_calib = {
                 'date': date,  # MODIFY.
                 'detector': cur_detector,  # MODIFY.
-                'path': "data/calibration_intermediate_data/",
+                'path': path_intermediate,
                 'pathout': f"data/calibration_data/{simulation_name}/",
                 'pathin': f"data/daily_splitted_data/{simulation_name}/",
                 'iteration': 50,
@@ -216,21 +265,43 @@ def main():
                 'n_initial_points': 5,
                 'no_speed': no_speed,  # MODIFY. false -> loss is calculated using deviation from radar speed; true -> loss is calculated using deviation from speed limit
                 'name': "GP_LCB_50_5",
+                'storage': storage,
             }
-            config_calib_path = os.path.join(hornsgatan_config, f'calib-{simulation_name}.yaml')
+            config_calib_path = os.path.join(hornsgatan_config, f'calib-{simulation_name}-{cur_detector}.yaml')
             create_yaml_file(config_calib, config_calib_path)
-
-            # Run pipeline for calib
-            command_to_run = f"python main.py --pipeline calib --config {config_calib_path}"
-            if calib_with_fcd:
-                command_to_run += ' --fcd'  # Add --fcd option to calib if required
-            run_command_on_bash(command_to_run, hornsgatan_home, verbose)
-
-            # Move contents of folder "Hornsgatan/data/calibration_intermediate_data/" to
+            config_calib_paths[cur_detector] = config_calib_path
+
+        if parallel_calib:
+            # Detectors are calibrated independently (one lane each, no lane changes), so the runs can overlap
+            # Every calib run is a subprocess, the threads only wait for them
+            print(f"Calibrating {len(detector_list)} detectors with {n_workers} concurrent calib processes")
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                futures = [executor.submit(calibrate_detector, cur_detector, config_calib_paths[cur_detector],
+                                           calib_with_fcd, hornsgatan_home, verbose)
+                           for cur_detector in detector_list]
+                for future in futures:
+                    print(f"Finished detector: {future.result()}")
+
+            # Move contents of every "Hornsgatan/data/calibration_intermediate_data/{detector}/" to
             # "Hornsgatan/data/calibration_intermediate_data/{simulation_name}/"
-            folder_from = os.path.join(hornsgatan_home, 'data', 'calibration_intermediate_data')
-            folder_to = os.path.join(hornsgatan_home, 'data', 'calibration_intermediate_data', simulation_name)
-            move_all_files_from_folder_to_folder(folder_from, folder_to)
+            folder_to = os.path.join(intermediate_dir, simulation_name)
+            for cur_detector in detector_list:
+                folder_from = os.path.join(intermediate_dir, cur_detector)
+                move_all_files_from_folder_to_folder(folder_from, folder_to)
+                if not os.listdir(folder_from):
+                    os.rmdir(folder_from)
+
+        else:
+            # Iterate through detector list
+            for cur_detector in detector_list:
+                calibrate_detector(cur_detector, config_calib_paths[cur_detector],
+                                   calib_with_fcd, hornsgatan_home, verbose)
+
+                # Move contents of folder "Hornsgatan/data/calibration_intermediate_data/" to
+                # "Hornsgatan/data/calibration_intermediate_data/{simulation_name}/"
+                folder_from = intermediate_dir
+                folder_to = os.path.join(intermediate_dir, simulation_name)
+                move_all_files_from_folder_to_folder(folder_from, folder_to)
 
     if not (only_run_import_data or only_run_calib):
 
@@ -256,6 +327,7 @@ def main():
                 'init_number': init_number,  # MODIFY. Number of vehicles considered. 0 = all vehicles
                 'network_file': "data/map/Hornsgatan.net.xml",
                 'hornsgatan_home': hornsgatan_home,
+                'storage': storage,
             }
             config_sim_path = os.path.join(hornsgatan_config, f'sim-{simulation_name}.yaml')
             create_yaml_file(config_sim, config_sim_path)
@@ -7,9 +7,31 @@ import yaml
 
 from src.pipeline import features_calib
 from src.tools import mytools
+from src.tools import node_cache
+from src.tools import sumo_backend
+from src.tools import storage
 import logging
 
-localconfig = mytools.read_local_config()
+
+# Options that a calibration node does not have. A config setting one of them is rejected instead of being ignored.
+UNSUPPORTED_OPTIONS = {
+    "calibrated_data": [],
+    "calibrated_data_sharded": ["resume", "speculative"],
+    "calibrated_data_clustered": ["resume", "speculative", "n_shards"],
+    "calibrated_data_FCD": ["batch_size", "warm_start", "speculative", "lookahead", "clustered", "n_shards"],
+}
+
+
+def _check_options(config: dict, output: str) -> None:
+    """
+    Raise ValueError if the config sets an option that the calibration node output would ignore
+    """
+    # batch_size and n_shards are off at 1, the other options at false/0
+    ignored = [option for option in UNSUPPORTED_OPTIONS[output]
+               if config.get(option) not in (None, False, 0, 1 if option in ("batch_size", "n_shards") else 0)]
+    if ignored:
+        raise ValueError(f"{output} does not support {ignored}, remove them from the config "
+                         f"(or run another calibration mode)")
 
 
 def main(tracker: bool = False, fcd: bool = False):
@@ -20,6 +42,10 @@ def main(tracker: bool = False, fcd: bool = False):
 
     parser.add_argument('--config', type=str, help='Path to YAML config file')
     parser.add_argument('--log-level', type=str, default='INFO', help='Set logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)')
+    parser.add_argument('--backend', type=str, choices=sumo_backend.BACKENDS, default=None,
+                        help='SUMO backend: traci (socket) or libsumo (in-process). Overrides "backend" in the config')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last checkpoint. Overrides "resume" in the config')
     args, _ = parser.parse_known_args()
     tracker = args.tracker
     fcd = args.fcd
@@ -41,6 +67,10 @@ def main(tracker: bool = False, fcd: bool = False):
     f"acq_func: {config['acq_func']}, n_initial_points: {config['n_initial_points']}, name: {config['name']}")
     logger.info("-------------------------------------------------------")
 
+    config["backend"] = args.backend or config.get("backend", "traci")
+    sumo_backend.select(config["backend"])
+    config["resume"] = args.resume or config.get("resume", False)
+
     builder = (
         driver.Builder()
         .with_config(config)
@@ -48,8 +78,12 @@ def main(tracker: bool = False, fcd: bool = False):
         .with_adapters(base.DictResult)
         .with_adapters(base)
     )
+    # cache: true loads the unchanged upstream nodes from the node cache of earlier runs
+    builder = node_cache.with_node_cache(builder, config, features_calib)
 
     if tracker:
+        # Read here only, the module is also imported without a config/config.ini (e.g. by the tests)
+        localconfig = mytools.read_local_config()
         tracker_adapter = adapters.HamiltonTracker(
             project_id=localconfig.get("project_id", "default_project"),
             username="kaveh",
@@ -58,12 +92,24 @@ def main(tracker: bool = False, fcd: bool = False):
         )
         builder = builder.with_adapters(tracker_adapter)
 
-    dr = builder.build()
     if fcd:
-        result = dr.execute(["calibrated_data_FCD"])
-
+        output = "calibrated_data_FCD"
+    elif config.get("clustered", False):
+        output = "calibrated_data_clustered"
+    elif config.get("n_shards", 1) > 1:
+        output = "calibrated_data_sharded"
     else:
-        result = dr.execute(["calibrated_data"])
+        output = "calibrated_data"
+    _check_options(config, output)
+
+    dr = builder.build()
+    result = dr.execute([output])
+    node_cache.report(dr, config, logger)
+
+    # The csv is the checkpoint of the run, with storage: parquet the finished result is also written as Parquet
+    if config.get("storage", "csv") == "parquet":
+        output_csv_path = next(iter(result.values()))
+        logger.info(f"Calibrated data written to {storage.csv_to_parquet(output_csv_path)}")
 
 if __name__ == "__main__":
     main()
@@ -7,6 +7,7 @@ import logging
 
 from src.pipeline import features_import_data
 from src.tools import mytools
+from src.tools import node_cache
 localconfig = mytools.read_local_config()
 
 
@@ -43,11 +44,20 @@ def main(tracker: bool = False):
     mytools.setup_logging(postfix, log_level=log_level)
     logger = logging.getLogger("import_data")
 
-    outputs = [
-        "transform_raw_data",
-        "save_transform_raw_data",
-        "split_and_save_daily"
-    ]
+    # chunksize in the config streams the raw file instead of loading it whole, incremental imports only what is new,
+    # rawFiles imports several raw files in parallel
+    if config.get("incremental"):
+        outputs = ["split_and_save_daily_incremental"]
+    elif config.get("rawFiles"):
+        outputs = ["split_and_save_daily_multi"]
+    elif config.get("chunksize"):
+        outputs = ["split_and_save_daily_chunked"]
+    else:
+        outputs = [
+            "transform_raw_data",
+            "save_transform_raw_data",
+            "split_and_save_daily"
+        ]
     builder = (
         driver.Builder()
         .with_config(config)
@@ -55,6 +65,8 @@ def main(tracker: bool = False):
         .with_adapters(base.DictResult)
         .with_adapters(base)
     )
+    # cache: true loads the unchanged upstream nodes from the node cache of earlier runs
+    builder = node_cache.with_node_cache(builder, config, features_import_data)
     if tracker:
         tracker_adapter = adapters.HamiltonTracker(
             project_id=localconfig.get("project_id", "default_project"),
@@ -65,8 +77,16 @@ def main(tracker: bool = False):
         builder = builder.with_adapters(tracker_adapter)
     dr = builder.build()
     results = dr.execute(outputs)
-    print(results["save_transform_raw_data"])
-    print(results["split_and_save_daily"])
+    node_cache.report(dr, config, logger)
+    if config.get("incremental"):
+        print(results["split_and_save_daily_incremental"])
+    elif config.get("rawFiles"):
+        print(results["split_and_save_daily_multi"])
+    elif config.get("chunksize"):
+        print(results["split_and_save_daily_chunked"])
+    else:
+        print(results["save_transform_raw_data"])
+        print(results["split_and_save_daily"])
     #print(results["transform_raw_data"])
     #print(results["transform_raw_data"].head(5))
 
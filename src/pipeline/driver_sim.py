@@ -9,6 +9,8 @@ import logging
 
 from src.pipeline import features_sim
 from src.tools import mytools
+from src.tools import node_cache
+from src.tools import sumo_backend
 
 localconfig = mytools.read_local_config()
 
@@ -19,6 +21,8 @@ def main(tracker: bool = False):
     parser.add_argument('--tracker', action='store_true', help='Enable HamiltonTracker adapter')
     parser.add_argument('--config', type=str, help='Path to YAML config file')
     parser.add_argument('--log-level', type=str, default='INFO', help='Set logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)')
+    parser.add_argument('--backend', type=str, choices=sumo_backend.BACKENDS, default=None,
+                        help='SUMO backend: traci (socket) or libsumo (in-process). Overrides "backend" in the config')
     args, _ = parser.parse_known_args()
     tracker = args.tracker
     log_level = args.log_level
@@ -44,6 +48,9 @@ def main(tracker: bool = False):
     logger.info(f"date: {config['date']}, detector: {config['detector']}, init_number: {config['init_number']}")
     logger.info("-------------------------------------------------------")
 
+    config["backend"] = args.backend or config.get("backend", "traci")
+    sumo_backend.select(config["backend"])
+
     builder = (
         driver.Builder()
         .with_config(config)
@@ -51,6 +58,8 @@ def main(tracker: bool = False):
         .with_adapters(base.DictResult)
         .with_adapters(base)
     )
+    # cache: true loads the unchanged upstream nodes from the node cache of earlier runs
+    builder = node_cache.with_node_cache(builder, config, features_sim)
     if tracker:
         tracker_adapter = adapters.HamiltonTracker(
             project_id=localconfig.get("project_id", "default_project"),
@@ -65,6 +74,7 @@ def main(tracker: bool = False):
         "diagram/diag_simulation.png"
     )  
     result = dr.execute(["run_sumo"])
+    node_cache.report(dr, config, logger)
     print("Done!!!")
     print(result)
 
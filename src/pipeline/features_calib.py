@@ -6,27 +6,70 @@ transforming the original script into a modular pipeline with well-defined depen
 """
 
 import os
-import shutil
 
 from typing import Dict, List, Optional, Tuple, Any, Union
 import pandas as pd
 import xml.etree.ElementTree as ET
 #from ..tools import mytools
-#import libsumo as traci
-import traci
 from math import ceil
 from hamilton import driver
 from hamilton.function_modifiers import extract_fields, source
 from skopt import Optimizer
 import numpy as np
 from skopt.space import Integer
+from skopt.learning import GaussianProcessRegressor
+from traci import constants as tc
 import logging
 import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from time import perf_counter
 from src.tools import mytools
+from src.tools import optimizers
+from src.tools import storage as storage_format
+from src.tools import sumo_backend
+from src.tools.sumo_backend import traci
+from src.tools.snapshot_store import SnapshotStore
+from src.tools.phase_timer import PhaseTimer
+from src.tools import fcd_trace
+from src.tools.fcd_trace import FcdTrace
+from src.tools.geo import GeoProjection
 
 
 logger = logging.getLogger("calib")
 
+# Columns of calibrated_data_{postfix}.csv
+CSV_HEADERS = [
+    "veh_id",
+    "time_detector_sim",
+    "speed_detector_sim",
+    "speed_factor",
+    "time_detector_real",
+    "depart",
+    "departSpeed",
+    "speed_detector_real",
+    "delta_time",
+    "delta_speed",
+    "stop_iteration",
+]
+
+# Values read through TraCI subscriptions: every simulationStep() returns all of them in one response.
+# The vehicle data of the detector is read with getVehicleData once the vehicle is hit (libsumo does not
+# convert LAST_STEP_VEHICLE_DATA subscription results).
+SIMULATION_VARIABLES = [tc.VAR_TIME, tc.VAR_MIN_EXPECTED_VEHICLES, tc.VAR_DEPARTED_VEHICLES_IDS]
+DETECTOR_VARIABLES = [tc.LAST_STEP_VEHICLE_ID_LIST, tc.LAST_STEP_MEAN_SPEED]
+FCD_VARIABLES = [tc.VAR_SPEED_FACTOR, tc.VAR_POSITION, tc.VAR_ANGLE, tc.VAR_SPEED, tc.VAR_ACCELERATION,
+                 tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_NOISEEMISSION]
+# Range of the FCD context subscription around the detector in m, covers the whole network
+FCD_RANGE = 1e5
+# Rows collected before they are projected and written at the end of the FCD run
+FCD_FLUSH_ROWS = 10000
+
+# Nodes of the node cache (cache: true, see src.tools.node_cache): CACHE_NODES are loaded from the cache when their
+# code and inputs are unchanged, CACHE_RECOMPUTE read files and always run, the other nodes are not cached
+CACHE_NODES = ["maxspeed", "preprocess_data", "number", "sample_data", "postfix", "trips"]
+CACHE_RECOMPUTE = ["raw_data", "detector_mappings", "physics_seeds", "lookahead_bounds", "interaction_clusters"]
+
 
 def maxspeed(detector: str) -> float:
     """Determine maximum speed based on detector type.
@@ -44,17 +87,21 @@ def maxspeed(detector: str) -> float:
 
 
 # Data loading and preprocessing
-def raw_data(pathin: str, date: str, detector: str) -> pd.DataFrame:
+def raw_data(pathin: str, date: str, detector: str, storage: str = "csv") -> pd.DataFrame:
     """Load and filter the raw data for the specified detector.
     
     Args:
         pathin: Path to input data
         date: Date string for data file
         detector: Detector ID to filter for
+        storage: "csv" (default) or "parquet", the Parquet reader opens only the partition of the detector
         
     Returns:
         DataFrame containing filtered data
     """
+    if storage_format.check_format(storage) == "parquet":
+        return storage_format.read_day(f'{pathin}data_{date}.parquet', detector,
+                                       columns=["detector_id", "time_detector_real", "speed_detector_real"])
     data = pd.read_csv(f'{pathin}data_{date}.csv')
     return data[data['detector_id'] == detector]
 
@@ -217,22 +264,22 @@ def induction_loop_add_file(
     path: str,
 ) -> str:
     """Generate XML for standard induction loop.
+
+    The calibration reads the loop through TraCI only, so its per-step file output is suppressed ("NUL").
     
     Args:
         detector: Detector ID
         detector_mappings['detector2lane']: Dictionary mapping detectors to lanes
-        inductionLoop_filename_xml: XML filename for induction loop
         inductionLoop_filename_add: Add XML filename for induction loop
         
     Returns:
         Generated XML string
     """
     
-    inductionLoop_filename_xml =  f"inductionLoop_{postfix}.xml"
     inductionLoop_filename_add =  f"inductionLoop_{postfix}.add.xml"
     
     induction_loops = [
-        {"id": detector, "lane": detector_mappings['detector2lane'][detector], "pos": "1", "period": "1", "file": inductionLoop_filename_xml},
+        {"id": detector, "lane": detector_mappings['detector2lane'][detector], "pos": "1", "period": "1", "file": "NUL"},
     ]
     root = ET.Element("additional")
     for loop in induction_loops:
@@ -333,11 +380,13 @@ def sumo_config(network_file: str, induction_loop_add_file: str,instant_inductio
     """
     start_time = trips["depart"].min()
     config_file_name = f"{path}simulation_{postfix}.sumo.cfg"
+    # SUMO resolves the net file relative to the .cfg, which may live at any depth under data/
+    network_file_rel = os.path.relpath(network_file, path)
     
     config_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <configuration xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/sumoConfiguration.xsd">
     <input>
-        <net-file value="../../{network_file}"/>
+        <net-file value="{network_file_rel}"/>
         <additional-files value="{induction_loop_add_file}"/>
     </input>
     <processing>
@@ -374,8 +423,7 @@ def setup_traci_simulation(
     trips: pd.DataFrame, 
     detector: str, 
     detector_mappings: Dict, 
-    path: str, 
-    postfix: str
+    snapshot_store: SnapshotStore,
 ) -> str:
     """Set up TraCI simulation environment.
     
@@ -384,52 +432,530 @@ def setup_traci_simulation(
         trips: Trips DataFrame
         detector: Detector ID
          detector_mappings: Combined detector DataFrame
-        path: Output path
-        postfix: Postfix for filenames
+        snapshot_store: Store for the simulation states
         
+    Returns:
+        SUMO binary path
+    """
+    return _start_sumo(sumo_config, trips["depart"][0]-100, detector, detector_mappings, snapshot_store)
+
+
+def _start_sumo(
+    sumo_config: str,
+    begin: int,
+    detector: str,
+    detector_mappings: Dict,
+    store: SnapshotStore,
+    extra_args: Optional[List[str]] = None,
+) -> str:
+    """Start SUMO, add the detector route and save the initial state.
+
+    Args:
+        sumo_config: Path to SUMO config file
+        begin: Simulation begin time
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        store: Store for the simulation states
+        extra_args: Additional SUMO command line options
+
     Returns:
         SUMO binary path
     """
     sumo_binary = "sumo"
-    
+
     if traci.isLoaded():
         traci.close()
-        
-  
 
-    
-    traci.start([sumo_binary, "-c", sumo_config,"--tls.all-off", "--begin", str(trips["depart"][0]-100)])
+    traci.start([sumo_binary, "-c", sumo_config, "--tls.all-off", "--begin", str(begin)] + (extra_args or []))
     traci.route.add(f"{detector}_route",  detector_mappings["detector2route"][detector].split())
-    traci.simulation.saveState(f"{path}simulation_{postfix}.sumo.state")
+    store.save()
     return sumo_binary
 
 
+def _start_batch_connections(
+    sumo_config: str,
+    begin: int,
+    detector: str,
+    detector_mappings: Dict,
+    batch_size: int,
+) -> Optional[List[Any]]:
+    """Start batch_size - 1 additional SUMO instances next to the running one, for batch evaluation.
+
+    Every instance gets its own TraCI connection (label batch1, batch2, ...) and the detector route.
+    The candidates of a vehicle all start from the same snapshot, so the instances never have to be in sync:
+    every evaluation loads the base state first.
+
+    Args:
+        sumo_config: Path to SUMO config file
+        begin: Simulation begin time
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        batch_size: Number of candidates evaluated at the same time
+
+    Returns:
+        List of batch_size connections, the default connection first, or None for batch_size <= 1
+    """
+    if batch_size <= 1:
+        return None
+    if sumo_backend.name() != "traci":
+        raise ValueError(f"batch_size = {batch_size} needs the traci backend, "
+                         f"'{sumo_backend.name()}' runs a single simulation per process")
+
+    connections = [traci.getConnection()]
+    for k in range(1, batch_size):
+        label = f"batch{k}"
+        traci.start(["sumo", "-c", sumo_config, "--tls.all-off", "--begin", str(begin)], label=label, doSwitch=False)
+        connection = traci.getConnection(label)
+        connection.route.add(f"{detector}_route",  detector_mappings["detector2route"][detector].split())
+        connections.append(connection)
+    logger.info(f"Batch evaluation with {batch_size} SUMO instances")
+    return connections
+
+
+def _close_batch_connections(connections: Optional[List[Any]]) -> None:
+    """Close the additional SUMO instances started by _start_batch_connections."""
+    for connection in (connections or [])[1:]:
+        connection.close()
+
+
+def stopping_rules(
+    iteration: int,
+    stop_time_tolerance: Union[int, float] = 0.0,
+    stop_speed_tolerance: Union[int, float] = 0.0,
+    stop_patience: int = 0,
+) -> Dict[str, float]:
+    """Early-stopping rules of the optimizer loop of every vehicle.
+
+    A vehicle stops as soon as |time_error| <= stop_time_tolerance and |speed_error| <= stop_speed_tolerance
+    (speed is ignored with no_speed), or when the loss has not improved for stop_patience iterations.
+    iteration is the cap. A rule set to 0 is disabled, so by default every vehicle runs all iterations.
+    The legacy algorithm in src/old used stop_time_tolerance = 2 and stop_speed_tolerance = 1.
+
+    Args:
+        iteration: Maximum number of iterations
+        stop_time_tolerance: Absolute tolerance on the detector time in seconds
+        stop_speed_tolerance: Absolute tolerance on the detector speed in m/s
+        stop_patience: Number of iterations without improvement before stopping
+
+    Returns:
+        Dictionary of stopping rules
+    """
+    return {
+        "max_iteration": iteration,
+        "time_tolerance": stop_time_tolerance,
+        "speed_tolerance": stop_speed_tolerance,
+        "patience": stop_patience,
+    }
+
+
+def _stop_reason(
+    stopping_rules: Optional[Dict[str, float]],
+    time_error: float,
+    speed_error: float,
+    no_speed: bool,
+    iterations_without_improvement: int,
+) -> Optional[str]:
+    """Check the early-stopping rules after an iteration.
+
+    Returns:
+        Reason for stopping, or None to continue
+    """
+    if not stopping_rules:
+        return None
+    if stopping_rules["time_tolerance"] > 0 and abs(time_error) <= stopping_rules["time_tolerance"]:
+        if no_speed or stopping_rules["speed_tolerance"] <= 0 or abs(speed_error) <= stopping_rules["speed_tolerance"]:
+            return f"within tolerance (time_error={round(time_error, 2)}, speed_error={round(speed_error, 2)})"
+    if 0 < stopping_rules["patience"] <= iterations_without_improvement:
+        return f"no improvement for {iterations_without_improvement} iterations"
+    return None
+
+
+def _subscribe(sumo, detector: str, fcd: bool = False) -> None:
+    """Subscribe to the simulation and detector values read in every step (and all vehicles for the FCD).
+
+    loadState drops all subscriptions, so this is called after every load.
+
+    Args:
+        sumo: traci (the selected backend) or a TraCI connection
+        detector: Detector ID
+        fcd: Also subscribe to the FCD values of all vehicles in the network
+    """
+    sumo.simulation.subscribe(SIMULATION_VARIABLES)
+    sumo.inductionloop.subscribe(detector, DETECTOR_VARIABLES)
+    if fcd:
+        sumo.inductionloop.subscribeContext(detector, tc.CMD_GET_VEHICLE_VARIABLE, FCD_RANGE, FCD_VARIABLES)
+
+
+def _record_fcd(trace: FcdTrace, inductionloop, detector: str, simtime: float) -> None:
+    """Append the FCD rows of all vehicles from the context subscription of the last step (see _subscribe).
+
+    x and y are network coordinates, they are projected to lon/lat when the trace is written (geo_projection).
+
+    Args:
+        trace: FCD rows of the run
+        inductionloop: Induction loop domain of the connection (traci.inductionloop)
+        detector: Detector ID
+        simtime: Simulation time of the last step
+    """
+    # One row per vehicle, in the order of traci.vehicle.getIDList() (sorted by ID, SUMO keeps the vehicles in a map).
+    # The order of the subscription results is not guaranteed, so they are sorted here
+    results = inductionloop.getContextSubscriptionResults(detector) or {}
+    for veh in sorted(results):
+        values = results[veh]
+        x, y = values[tc.VAR_POSITION]
+        trace.append(time=int(simtime)-1,
+                     id=veh,
+                     speedfactor=values[tc.VAR_SPEED_FACTOR],
+                     x=x,
+                     y=y,
+                     angle=round(values[tc.VAR_ANGLE],2),
+                     speed=round(values[tc.VAR_SPEED],2),
+                     acceleration=round(values[tc.VAR_ACCELERATION],2),
+                     pos=round(values[tc.VAR_LANEPOSITION],2),
+                     lane=values[tc.VAR_LANE_ID],
+                     noise=round(values[tc.VAR_NOISEEMISSION],2))
+
+
+def snapshot_store(path: str, postfix: str, snapshot_dir: str = "shm", snapshot_compress: bool = False) -> SnapshotStore:
+    """Create the store for the simulation states saved and loaded in every optimizer iteration.
+
+    Args:
+        path: Output path
+        postfix: Postfix for filenames
+        snapshot_dir: "shm" (RAM-backed, default), "path" (the intermediate data folder) or a folder
+        snapshot_compress: gzip the states
+
+    Returns:
+        SnapshotStore
+    """
+    return SnapshotStore(path, postfix, snapshot_dir=snapshot_dir, compress=snapshot_compress)
+
+
+def geo_projection(network_file: str) -> GeoProjection:
+    """Projection of the network coordinates to lon/lat, read from the <location> element of the network file.
+
+    Replaces traci.simulation.convertGeo, a round trip per point, by one vectorized pass over the FCD rows.
+
+    Args:
+        network_file: SUMO network file
+
+    Returns:
+        GeoProjection
+    """
+    return GeoProjection.from_net(network_file)
+
+
+def phase_timer(pathout: str, postfix: str, timing: str = "csv") -> Optional[PhaseTimer]:
+    """Create the recorder of the per-phase timings (ask, tell, load/save state, steps, FCD getters) of every iteration.
+
+    The timings are written to timing_{postfix}.{timing} next to calibrated_data_{postfix}.csv.
+
+    Args:
+        pathout: Output path
+        postfix: Postfix for filenames
+        timing: "csv" (default), "parquet" (needs pyarrow) or "off"
+
+    Returns:
+        PhaseTimer, or None if timing is "off"
+    """
+    if timing == "off":
+        return None
+    if timing not in ("csv", "parquet"):
+        raise ValueError(f"Unknown timing format '{timing}', expected csv, parquet or off")
+    return PhaseTimer(f"{pathout}timing_{postfix}.{timing}")
+
+
+# Search space of the optimizer
+SPEED_FACTOR_MIN = 0.6
+SPEED_FACTOR_MAX = 3.2
+SPEED_FACTOR_RESOLUTION = 20
+
+
+def physics_seeds(
+    trips: pd.DataFrame,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    network_file: str,
+    physics_init: bool = False,
+    physics_depart_margin: Union[int, float] = 20.0,
+    physics_speed_margin: Union[int, float] = 0.3,
+) -> Optional[pd.DataFrame]:
+    """Free-flow estimate of depart and speed_factor for every vehicle, computed in one vectorized pass.
+
+    In free flow a vehicle with speed factor sf passes the detector at sf * v_ref, with v_ref the lower of
+    maxspeed and the speed limit of the detector lane, and needs traveltimetosensor / sf seconds from its
+    departure (detector2traveltimetosensor is the travel time at sf = 1). So
+        speed_factor = speed_detector_real / v_ref
+        depart       = time_detector_real - traveltimetosensor / speed_factor
+    Congestion can only delay a vehicle, so the depart window reaches physics_depart_margin seconds earlier
+    than the free-flow curve allows for the speed factor window, and 2 s later.
+
+    Args:
+        trips: Trips DataFrame
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        maxspeed: Maximum speed value
+        network_file: SUMO network file
+        physics_init: Seed and narrow the search of every vehicle with these estimates (default off)
+        physics_depart_margin: Extra seconds before the free-flow depart window
+        physics_speed_margin: Half width of the speed factor window
+
+    Returns:
+        DataFrame with seed_depart, seed_speed_factor, depart_low, depart_high, speed_factor_low and
+        speed_factor_high (same index as trips), or None if physics_init is off
+    """
+    if not physics_init:
+        return None
+    v_ref = min(maxspeed, mytools.lane_speed(detector_mappings["detector2lane"][detector], network_file))
+    traveltime = detector_mappings["detector2traveltimetosensor"][detector]
+    time_real = trips["time_detector_real"].to_numpy(dtype=float)
+
+    seed_speed_factor = np.clip(trips["speed_detector_real"].to_numpy(dtype=float) / v_ref,
+                                SPEED_FACTOR_MIN, SPEED_FACTOR_MAX)
+    speed_factor_low = np.maximum(seed_speed_factor - physics_speed_margin, SPEED_FACTOR_MIN)
+    speed_factor_high = np.minimum(seed_speed_factor + physics_speed_margin, SPEED_FACTOR_MAX)
+
+    seeds = pd.DataFrame({
+        "seed_depart": np.round(time_real - traveltime / seed_speed_factor),
+        "seed_speed_factor": seed_speed_factor,
+        "depart_low": np.floor(time_real - traveltime / speed_factor_low - physics_depart_margin),
+        "depart_high": np.ceil(time_real - traveltime / speed_factor_high + 2),
+        "speed_factor_low": speed_factor_low,
+        "speed_factor_high": speed_factor_high,
+    }, index=trips.index)
+    logger.info(f"Physics seeds: v_ref = {v_ref} m/s, "
+                f"mean depart window = {round((seeds['depart_high'] - seeds['depart_low']).mean(), 1)} s, "
+                f"mean speed factor window = {round((speed_factor_high - speed_factor_low).mean(), 2)}")
+    return seeds
+
+
+def lookahead_bounds(
+    trips: pd.DataFrame,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    network_file: str,
+    lookahead: bool = False,
+) -> Optional[pd.DataFrame]:
+    """Route length to the detector and highest possible speed, to skip the steps before a vehicle can arrive.
+
+    A vehicle with speed factor sf drives at most sf * lookahead_speed (the highest speed limit on its route up
+    to the detector, junctions included, and at least maxspeed), so it cannot reach the detector before
+        depart + lookahead_distance / (sf * lookahead_speed)
+    lookahead_distance leaves out the junctions and is a lower bound. The simulation jumps to the step before
+    this time with one simulationStep(target) call, see _lookahead_target(). The FCD run steps every second:
+    it sets speed mode 95, which disregards the speed limits this bound relies on.
+
+    Args:
+        trips: Trips DataFrame
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        maxspeed: Maximum speed value
+        network_file: SUMO network file
+        lookahead: Jump ahead to the earliest possible arrival of every candidate (default off)
+
+    Returns:
+        DataFrame with lookahead_distance and lookahead_speed (same index as trips), or None if lookahead is off
+    """
+    if not lookahead:
+        return None
+    # The induction loop is at pos 1 of the detector lane, see induction_loop_add_file()
+    distance, speed = mytools.route_to_lane(detector_mappings["detector2route"][detector],
+                                            detector_mappings["detector2lane"][detector], 1, network_file)
+    logger.info(f"Look-ahead: {round(distance, 1)} m to the detector, at most {max(maxspeed, speed)} m/s * speed factor")
+    return pd.DataFrame({"lookahead_distance": distance, "lookahead_speed": max(maxspeed, speed)}, index=trips.index)
+
+
+def interaction_clusters(
+    trips: pd.DataFrame,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    network_file: str,
+    clustered: bool = False,
+    cluster_margin: Union[int, float] = 20.0,
+) -> Optional[pd.DataFrame]:
+    """Split the day into clusters of vehicles that cannot interact with the vehicles of other clusters.
+
+    A vehicle is on its route to the detector for about traveltimetosensor / sf seconds before
+    time_detector_real, with sf the free-flow speed factor of physics_seeds(). If the headway to the previous
+    vehicle exceeds this travel time plus cluster_margin (slack for congestion), the previous vehicle has
+    passed the detector before the vehicle departs, and the vehicle starts a new cluster. The head of a cluster
+    gets depart_floor = time_detector_real of the previous vehicle + 1. It departs behind the previous vehicle,
+    so the depart chain holds across clusters and every cluster can be calibrated from a clean network.
+
+    Args:
+        trips: Trips DataFrame
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        maxspeed: Maximum speed value
+        network_file: SUMO network file
+        clustered: Calibrate the clusters as independent jobs, see calibrated_data_clustered() (default off)
+        cluster_margin: Extra seconds of headway needed to start a new cluster
+
+    Returns:
+        DataFrame with cluster (0, 1, ... in time order) and depart_floor (NaN except at the cluster heads),
+        same index as trips, or None if clustered is off
+    """
+    if not clustered:
+        return None
+    v_ref = min(maxspeed, mytools.lane_speed(detector_mappings["detector2lane"][detector], network_file))
+    traveltime = detector_mappings["detector2traveltimetosensor"][detector]
+    time_real = trips["time_detector_real"].to_numpy(dtype=float)
+    speed_factor = np.clip(trips["speed_detector_real"].to_numpy(dtype=float) / v_ref,
+                           SPEED_FACTOR_MIN, SPEED_FACTOR_MAX)
+
+    headway = np.diff(time_real, prepend=-np.inf)
+    head = headway > traveltime / speed_factor + cluster_margin
+    head[0] = True
+    clusters = pd.DataFrame({
+        "cluster": np.cumsum(head) - 1,
+        "depart_floor": np.where(head, time_real - headway + 1, np.nan),
+    }, index=trips.index)
+    sizes = clusters["cluster"].value_counts()
+    logger.info(f"Interaction clusters: {len(sizes)} clusters for {len(trips)} vehicles, "
+                f"largest = {sizes.max()} vehicles, mean = {round(sizes.mean(), 1)} vehicles")
+    return clusters
+
+
+def _lookahead_target(row: dict) -> Optional[int]:
+    """Last step before the candidate can reach the detector, None if the row has no lookahead_bounds().
+
+    Args:
+        row: Vehicle data row with the proposed depart and speed_factor
+
+    Returns:
+        Simulation time to jump to after the depart+1 snapshot
+    """
+    if pd.isna(row.get("lookahead_distance", np.nan)):
+        return None
+    earliest = row["depart"] + row["lookahead_distance"] / (row["speed_factor"] * row["lookahead_speed"])
+    return int(earliest) - 1
+
+
+def _search_space(row: dict, depart_min: float, depart_max: float) -> Tuple[List[Integer], Optional[List[int]]]:
+    """Bounds of the optimizer for one vehicle, narrowed to the physics seed if the row has one.
+
+    The depart dimension is the offset to depart_min, the speed factor dimension is in 1/SPEED_FACTOR_RESOLUTION.
+    The seed window is intersected with the default box, so the depart chain (depart_min) always holds.
+
+    Args:
+        row: Vehicle data row, optionally with the columns of physics_seeds()
+        depart_min: Earliest depart (last calibrated depart + 1)
+        depart_max: Latest depart
+
+    Returns:
+        Tuple of (bounds, seed point or None)
+    """
+    depart_low, depart_high = 0, int(depart_max - depart_min)
+    speed_low = int(SPEED_FACTOR_MIN * SPEED_FACTOR_RESOLUTION)
+    speed_high = int(SPEED_FACTOR_MAX * SPEED_FACTOR_RESOLUTION)
+    if pd.isna(row.get("seed_depart", np.nan)):
+        return [Integer(depart_low, depart_high), Integer(speed_low, speed_high)], None
+
+    depart_low = int(np.clip(row["depart_low"] - depart_min, depart_low, depart_high - 2))
+    depart_high = int(np.clip(row["depart_high"] - depart_min, depart_low + 2, depart_high))
+    speed_low = int(np.clip(np.floor(row["speed_factor_low"] * SPEED_FACTOR_RESOLUTION), speed_low, speed_high - 1))
+    speed_high = int(np.clip(np.ceil(row["speed_factor_high"] * SPEED_FACTOR_RESOLUTION), speed_low + 1, speed_high))
+    seed = [int(np.clip(round(row["seed_depart"] - depart_min), depart_low, depart_high)),
+            int(np.clip(round(row["seed_speed_factor"] * SPEED_FACTOR_RESOLUTION), speed_low, speed_high))]
+    return [Integer(depart_low, depart_high), Integer(speed_low, speed_high)], seed
+
+
+def _transfer_points(warm: Dict[str, Any], row: dict, depart_min: float,
+                     bounds: List[Integer]) -> Tuple[List[List[int]], List[float]]:
+    """Best points of the previous vehicle, shifted to the search space of this vehicle.
+
+    A point keeps its lead time (time_detector_real - depart) and speed factor, so it lands where the previous
+    vehicle had its best region relative to its own detector time. The points are clipped to the bounds,
+    duplicates are dropped.
+
+    Args:
+        warm: Warm-start state, see _warm_start_state()
+        row: Vehicle data row
+        depart_min: Earliest depart of this vehicle
+        bounds: Bounds of the optimizer, see _search_space()
+
+    Returns:
+        Tuple of (points, losses of the previous vehicle), at most warm["n_points"] each
+    """
+    points, values = [], []
+    for lead, speed_index, y in sorted(warm.get("points", []), key=lambda point: point[2]):
+        x = [int(np.clip(round(row["time_detector_real"] - lead - depart_min), bounds[0].low, bounds[0].high)),
+             int(np.clip(speed_index, bounds[1].low, bounds[1].high))]
+        if x not in points:
+            points.append(x)
+            values.append(y)
+        if len(points) == warm["n_points"]:
+            break
+    return points, values
+
+
+def _warm_estimator(warm: Optional[Dict[str, Any]], base_estimator: str):
+    """GP with the fitted kernel of the previous vehicle as initial hyperparameters, refit without restarts.
+
+    Same surrogate as skopt's "GP" (cook_estimator), which starts from unit length scales and restarts the
+    hyperparameter fit twice. Any other base_estimator, or no kernel yet, is returned as is.
+    """
+    if warm is None or warm.get("kernel") is None or base_estimator != "GP":
+        return base_estimator
+    return GaussianProcessRegressor(kernel=warm["kernel"], normalize_y=True, noise="gaussian",
+                                    n_restarts_optimizer=0)
+
+
+def _warm_start_state(warm: Dict[str, Any], row: dict, opt: Optimizer, n_transferred: int,
+                      depart_min: float) -> None:
+    """Keep the evaluations and the fitted kernel of a vehicle for the next one.
+
+    Args:
+        warm: Warm-start state, updated in place
+        row: Vehicle data row
+        opt: Optimizer of the vehicle
+        n_transferred: Number of points told to opt before the first evaluation
+        depart_min: Earliest depart of the vehicle
+    """
+    warm["veh_id"] = row["id"]
+    warm["points"] = [(row["time_detector_real"] - (x[0] + depart_min), x[1], y)
+                      for x, y in zip(opt.Xi[n_transferred:], opt.yi[n_transferred:])]
+    models = getattr(opt, "models", None)
+    if warm["reuse_kernel"] and models and hasattr(models[-1], "kernel_"):
+        warm["kernel"] = models[-1].kernel_.k1       # Without the WhiteKernel, its noise is zeroed after the fit
+
+
 def _calibrate_single_vehicle_FCD(
     row: dict, 
     detector: str, 
     maxspeed: float, 
-    path: str, 
-    postfix: str, 
+    store: SnapshotStore, 
     iteration: int, 
     mylog: List,
     base_estimator: str,   #{"GP", "RF", "ET", "GBRT"}
     acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
     n_initial_points: int,
     no_speed: bool,
-) -> Tuple[Dict[str, Any], list]:
+    stopping_rules: Optional[Dict[str, float]] = None,
+    timer: Optional[PhaseTimer] = None,
+    engine: str = "skopt",
+) -> Tuple[Dict[str, Any], FcdTrace, int]:
     """Calibrate a single vehicle in the simulation.
+
+    Only the FCD trace of the best iteration so far is kept, the others are dropped as soon as they are
+    evaluated, so the memory does not grow with the number of iterations.
     
     Args:
         row: Vehicle data row
         detector: Detector ID
         maxspeed: Maximum speed value
-        path: Output path
-        postfix: Postfix for filenames
+        store: Store for the simulation states
         iteration: Maximum number of iterations
         mylog: List of calibration results
+        stopping_rules: Early-stopping rules, see stopping_rules()
+        timer: Records the phase timings of every iteration
+        engine: Optimizer engine, see src.tools.optimizers
         
     Returns:
-        Dictionary with calibration result for this vehicle
+        Dictionary with calibration result for this vehicle, FCD trace and index of the best iteration
     """
     #traci.simulation.loadState(f"{path}simulation_{postfix}_next.sumo.state")
     #traci.simulation.saveState(f"{path}simulation_{postfix}.sumo.state")
@@ -438,10 +964,9 @@ def _calibrate_single_vehicle_FCD(
     
     time = None
     speed = None
-    simlog = []
+    best_trace = None
     time_list = []
     speed_list = []
-    simlog_list = []
     
     if len(mylog) > 0:
         depart_min = mylog[-1]["depart"]+1
@@ -451,35 +976,52 @@ def _calibrate_single_vehicle_FCD(
     depart_max = max(row["time_detector_real"] - 10, depart_min +2)
     
     
-    speed_factor_min = 0.6
-    speed_factor_max = 3.2
-    speed_factor_resolution = 20
+    speed_factor_min = SPEED_FACTOR_MIN
+    speed_factor_max = SPEED_FACTOR_MAX
+    speed_factor_resolution = SPEED_FACTOR_RESOLUTION
     
-    bounds = [Integer(0, depart_max-depart_min), Integer(int(speed_factor_min*speed_factor_resolution), int(speed_factor_max*speed_factor_resolution))]
+    bounds, x_seed = _search_space(row, depart_min, depart_max)
     #bounds = [Integer(0, depart_max-depart_min), (speed_factor_min, speed_factor_max)]
 
     logger.info(row)
-    logger.info(f"bounds = {bounds}, depart_min = {depart_min} ")
+    logger.info(f"bounds = {bounds}, depart_min = {depart_min}, seed = {x_seed} ")
     
     # --- Initialize Bayesian Optimizer ---
-    opt = Optimizer(dimensions=bounds, base_estimator=base_estimator, acq_func=acq_func, n_initial_points=n_initial_points)
+    opt = optimizers.make_optimizer(engine, bounds, base_estimator, acq_func, n_initial_points=n_initial_points)
+    best_y_so_far = np.inf
+    last_improvement = 0
+    # Evaluation cache: (vehicle, depart, speed factor index, base state) -> ((time, speed), snapshot key)
+    evaluations = {}
+    snapshot_keys = []
+    cache_hits = 0
     for i in range(iteration):
-        x_next = opt.ask()                 # Propose next point
+        ask_start = perf_counter()
+        x_next = x_seed if i == 0 and x_seed is not None else opt.ask()                 # Propose next point
+        ask_s = perf_counter() - ask_start
         row['depart'] = x_next[0]+depart_min
         row["speed_factor"] = x_next[1]/speed_factor_resolution
         #row["speed_factor"] = x_next[1]
  
-        time_speed_simlog = _run_simulation_steps_FCD(row, detector, path, postfix, i, maxspeed=maxspeed)
-        if time_speed_simlog is not None:
-            time, speed,simlog = time_speed_simlog
+        key = (row["id"], row["depart"], x_next[1], store.generation)
+        trace = None
+        if key in evaluations:
+            cache_hits += 1
+        else:
+            result = _run_simulation_steps_FCD(row, detector, store, i, maxspeed=maxspeed, timer=timer)
+            if result is not None:
+                *result, trace = result
+            evaluations[key] = (result, i)
+        time_speed, snapshot_key = evaluations[key]
+        snapshot_keys.append(snapshot_key)
+        if time_speed is not None:
+            time, speed = time_speed
             time_list.append(time)
             speed_list.append(speed)
-            simlog_list.append(simlog)
             
         else:
-            logger.error("errorrrrrrrrrrr in time-speeeeeeeed")
-            print("cccaaaalllliiiibbbraaaattiioonnnn  eeerrrrooooorrrrr")
-            exit(0)
+            # Raised instead of exiting, the run can be resumed from its last checkpoint
+            raise RuntimeError(f"Vehicle {row['id']} did not pass detector {detector} "
+                               f"(depart = {row['depart']}, speed_factor = {row['speed_factor']})")
         time_error = time-row["time_detector_real"]
         speed_error = speed - row["speed_detector_real"]
 
@@ -490,8 +1032,22 @@ def _calibrate_single_vehicle_FCD(
         #y_next = y_next - .5*(row["speed_factor"]-speed_factor_min)/(speed_factor_max-speed_factor_min)
         #y_next = y_next + (row['depart']-depart_min)/(depart_max-depart_min)
 
+        tell_start = perf_counter()
         opt.tell(x_next, y_next)          # Give result to optimizer
+        if timer is not None:
+            timer.add(row["id"], i, ask_s=ask_s, tell_s=perf_counter() - tell_start)
         #logger.info(f"Iter {i}: Input={x_next}, Error={y_next:.4f}, time_error={time_error},  speed_error={speed_error}")
+
+        # --- Early stopping ---
+        # Strictly lower: like np.argmin, the first of equal losses stays the best. A cache hit repeats an
+        # earlier loss, so it never replaces the kept trace.
+        if y_next < best_y_so_far:
+            best_y_so_far, last_improvement = y_next, i
+            best_trace = trace
+        stop_reason = _stop_reason(stopping_rules, time_error, speed_error, no_speed, i - last_improvement)
+        if stop_reason:
+            logger.info(f"Stopped after {i + 1} of {iteration} iterations: {stop_reason}")
+            break
         
     # --- Best result ---
     best_index = np.argmin(opt.yi)
@@ -504,8 +1060,12 @@ def _calibrate_single_vehicle_FCD(
     #for item in simlog_list[best_index]:
     #    logging.info(f"simlog = {item} ")
 
-    traci.simulation.loadState(f"{path}simulation_{postfix}_{best_index}.sumo.state")
-    traci.simulation.saveState(f"{path}simulation_{postfix}.sumo.state")
+    # The best iteration snapshot becomes the starting state of the next vehicle
+    store.promote(snapshot_keys[best_index])
+    store.evict()
+    logger.info(f"State I/O: {store.stats()}, evaluation cache: {cache_hits} hits, {len(evaluations)} misses, "
+                f"FCD trace: {len(best_trace)} rows, {round(best_trace.nbytes / 1024, 1)} kB")
+    store.reset_stats()
     
     return {
         "veh_id": row["id"],
@@ -517,33 +1077,41 @@ def _calibrate_single_vehicle_FCD(
         "time_detector_real": row["time_detector_real"],
         "depart": best_x[0]+depart_min,
         "departSpeed": maxspeed * round((best_x[1]/speed_factor_resolution),2) ,
-        "speed_detector_real": row["speed_detector_real"]
-    }, simlog_list[best_index], best_index
+        "speed_detector_real": row["speed_detector_real"],
+        "stop_iteration": i + 1,
+    }, best_trace, best_index
 
 
 
-def _run_simulation_steps_FCD(row: dict, detector: str, path: str, postfix: str, iteration_number:int, maxspeed: float) -> Optional[Tuple[float, float]]:
+def _run_simulation_steps_FCD(row: dict, detector: str, store: SnapshotStore, iteration_number:int, maxspeed: float,
+                              timer: Optional[PhaseTimer] = None) -> Optional[Tuple[float, float, FcdTrace]]:
     """Run simulation steps until the vehicle passes the detector.
     
     Args:
         row: Vehicle data row
         detector: Detector ID
-        path: Output path
-        postfix: Postfix for filenames
+        store: Store for the simulation states
+        iteration_number: Key of the snapshot saved one step after the departure
+        timer: Records load_state, save_state, step and fcd timings of the iteration
         
     Returns:
-        Tuple of (time, speed) or None if vehicle didn't pass detector
+        Tuple of (time, speed, FCD trace up to the departure) or None if vehicle didn't pass detector
     """
     time = None
     speed = None
-    simulation_log =[]
+    trace = FcdTrace()
     
+    start = perf_counter()
     try:
-        traci.simulation.loadState(f"{path}simulation_{postfix}.sumo.state")
+        store.load()
     except traci.FatalTraCIError as e:
         logger.error(f"Error loading simulation state: {e}")
         traci.close()
         raise
+    load_state_s = perf_counter() - start
+    save_state_s = 0
+    fcd_s = 0
+    n_steps = 0
 
     # Remove the vehicle if it exists
     if row['id'] in traci.vehicle.getIDList():
@@ -574,18 +1142,25 @@ def _run_simulation_steps_FCD(row: dict, detector: str, path: str, postfix: str,
 
 
     
-    while traci.simulation.getMinExpectedNumber() > 0:
+    _subscribe(traci, detector, fcd=True)
+    # Subscription results are read locally, without a round trip to SUMO
+    simulation, inductionloop = traci.simulation, traci.inductionloop
+    start = perf_counter()
+    while simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
         #print(f"step  = {traci.simulation.getTime()}  , depart  = {row["depart"]}")
         
         traci.simulationStep()
+        n_steps += 1
         #for veh in traci.simulation.getDepartedIDList():
         #    traci.vehicle.changeLane(veh,row["departLane"],100000) #time to stay in the lane
         #    traci.vehicle.setLaneChangeMode(veh, 0)
 
                     
-        simtime = traci.simulation.getTime()
+        simtime = simulation.getSubscriptionResults()[tc.VAR_TIME]
         if simtime == int(row["depart"])+1:
-            traci.simulation.saveState(f"{path}simulation_{postfix}_{iteration_number}.sumo.state")
+            save_start = perf_counter()
+            store.save(iteration_number)
+            save_state_s += perf_counter() - save_start
             #print (f"depart = {row["depart"]}, step = {traci.simulation.getMinExpectedNumber()}, ite = {iteration_number}" )
         
         #if simtime == int(row["depart"]):
@@ -596,70 +1171,132 @@ def _run_simulation_steps_FCD(row: dict, detector: str, path: str, postfix: str,
 
         
         if simtime <= int(row["depart"])+1:
-            for veh in traci.vehicle.getIDList():
-                x, y = traci.vehicle.getPosition(veh)
-                lon, lat = traci.simulation.convertGeo(x, y)
-                #lon, lat = self.net.convertXY2LonLat(x, y)
-                simulation_log.append({"time": int(simtime)-1,
-                                       "id":veh,
-                                       "speedfactor": traci.vehicle.getSpeedFactor(veh),
-                                       "x":round(lon,6),
-                                       "y":round(lat,6),
-                                       "angle":round(traci.vehicle.getAngle(veh),2),
-                                       "speed":round(traci.vehicle.getSpeed(veh),2), 
-                                       "acceleration":round(traci.vehicle.getAcceleration(veh),2),
-                                       "pos":round(traci.vehicle.getLanePosition(veh),2),
-                                       "lane":traci.vehicle.getLaneID(veh),
-                                       "noise":round(traci.vehicle.getNoiseEmission(veh),2)})
+            fcd_start = perf_counter()
+            _record_fcd(trace, inductionloop, detector, simtime)
+            fcd_s += perf_counter() - fcd_start
+            if simtime == int(row["depart"])+1:
+                # Only the steps up to the departure are logged
+                inductionloop.unsubscribeContext(detector, tc.CMD_GET_VEHICLE_VARIABLE, FCD_RANGE)
             #if not (traci.vehicle.getIDList()):
             #    simulation_log.append({"time": int(simtime)-1})
           
-        vehicles = traci.inductionloop.getLastStepVehicleIDs(detector)
+        detector_values = inductionloop.getSubscriptionResults(detector)
+        vehicles = detector_values[tc.LAST_STEP_VEHICLE_ID_LIST]
 
 
         if vehicles and vehicles[0] == row["id"]:
-            veh_id, veh_length, entry_time, exit_time, vType = traci.inductionloop.getVehicleData(detector)[0]
+            veh_id, veh_length, entry_time, exit_time, vType = inductionloop.getVehicleData(detector)[0]
             lane = traci.vehicle.getLaneID(vehicles[0])
             logger.info(f"veh = {veh_id}, lane = {lane}, time ={int(simtime)-1},pos = {round(traci.vehicle.getLanePosition(veh_id),2)}")
-            speed = traci.inductionloop.getLastStepMeanSpeed(detector)
+            speed = detector_values[tc.LAST_STEP_MEAN_SPEED]
             time = round(entry_time - 1, 2)
             #time = round(entry_time, 2)
+            break
 
-            return time, speed, simulation_log
-    
-    return None
+    if timer is not None:
+        timer.add(row["id"], iteration_number, load_state_s=load_state_s, save_state_s=save_state_s, fcd_s=fcd_s,
+                  step_s=perf_counter() - start - save_state_s - fcd_s, n_steps=n_steps)
+    if time is None:
+        return None
+    return time, speed, trace
 
-def _last_times_sim_fcd( last_best_state:int, path:str , postfix:str):
-    traci.simulation.loadState(f"{path}simulation_{postfix}_{last_best_state}.sumo.state")
-    simulation_log = []
+def _last_times_sim_fcd(store: SnapshotStore, detector: str, fcd_writer, projection: GeoProjection) -> int:
+    """Run the simulation to the end from the state of the last vehicle and write the FCD rows.
+
+    The rows are written every FCD_FLUSH_ROWS rows, so the memory does not grow with the rest of the day.
+
+    Args:
+        store: Store for the simulation states
+        detector: Detector ID
+        fcd_writer: csv.writer of fcd_data_{postfix}.csv
+        projection: Projection of x and y to lon/lat
 
-    while traci.simulation.getMinExpectedNumber() > 0:
-        for veh in traci.simulation.getDepartedIDList():
+    Returns:
+        Number of rows written
+    """
+    # The base state is the best state of the last calibrated vehicle
+    store.load()
+    _subscribe(traci, detector, fcd=True)
+    simulation, inductionloop = traci.simulation, traci.inductionloop
+    trace = FcdTrace()
+    n_rows = 0
+
+    while simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
+        for veh in simulation.getSubscriptionResults()[tc.VAR_DEPARTED_VEHICLES_IDS]:
             #traci.vehicle.changeLane(veh,1,100000) #time to stay in the lane
             traci.vehicle.setSpeedMode(veh, 95)
             #traci.vehicle.setLaneChangeMode(veh, 0)            
         traci.simulationStep()
-        simtime = traci.simulation.getTime()
-
-        for veh in traci.vehicle.getIDList():
-                x, y = traci.vehicle.getPosition(veh)
-                lon, lat = traci.simulation.convertGeo(x, y)
-                #lon, lat = self.net.convertXY2LonLat(x, y)
-                simulation_log.append({"time": int(simtime)-1,
-                                       "id":veh,
-                                       "speedfactor": traci.vehicle.getSpeedFactor(veh),
-                                       "x":round(lon,6),
-                                       "y":round(lat,6),
-                                       "angle":round(traci.vehicle.getAngle(veh),2),
-                                       "speed":round(traci.vehicle.getSpeed(veh),2), 
-                                       "acceleration":round(traci.vehicle.getAcceleration(veh),2),
-                                       "pos":round(traci.vehicle.getLanePosition(veh),2),
-                                       "lane":traci.vehicle.getLaneID(veh),
-                                       "noise":round(traci.vehicle.getNoiseEmission(veh),2)})
+        simtime = simulation.getSubscriptionResults()[tc.VAR_TIME]
+
+        _record_fcd(trace, inductionloop, detector, simtime)
+        if len(trace) >= FCD_FLUSH_ROWS:
+            n_rows += trace.write(fcd_writer, projection)
+            trace.clear()
 
 
     
-    return simulation_log
+    return n_rows + trace.write(fcd_writer, projection)
+
+
+def _checkpoint(store: SnapshotStore, mylog: List[Dict[str, Any]], result_csv, fcd_csv=None,
+                fcd_rows: int = 0) -> None:
+    """Flush the result files to disk and checkpoint the base state after the last vehicle of mylog.
+
+    Args:
+        store: Store for the simulation states
+        mylog: Calibration results so far, in the order of the trips
+        result_csv: Open calibrated_data_{postfix}.csv
+        fcd_csv: Open fcd_data_{postfix}.csv of the FCD run
+        fcd_rows: Number of FCD rows written so far
+    """
+    for file in (result_csv, fcd_csv):
+        if file is not None:
+            file.flush()
+            os.fsync(file.fileno())
+    store.checkpoint({"veh_id": mylog[-1]["veh_id"], "n_done": len(mylog), "fcd_rows": fcd_rows,
+                      "result": mylog[-1]})
+
+
+def _restore_checkpoint(trips: pd.DataFrame, store: SnapshotStore, output_csv_path: str,
+                        fcd_csv_path: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """Resume a run from the checkpoint of the store (see _checkpoint()).
+
+    The base state becomes the state after the last checkpointed vehicle, and the result files are cut back
+    to the rows written up to it. The last result is restored as it was (mylog[-1] sets depart_min of the
+    next vehicle), the earlier ones are read back from calibrated_data_{postfix}.csv.
+
+    Args:
+        trips: Trips DataFrame of the run
+        store: Store for the simulation states, with SUMO started
+        output_csv_path: calibrated_data_{postfix}.csv
+        fcd_csv_path: fcd_data_{postfix}.csv of the FCD run
+
+    Returns:
+        Tuple of (restored calibration results, number of FCD rows), ([], 0) if there is no checkpoint
+    """
+    info = store.restore_checkpoint()
+    if info is None:
+        logger.info(f"Resume: no checkpoint of {store.postfix}, starting from the first vehicle")
+        return [], 0
+    n_done = info["n_done"]
+    if n_done > len(trips) or trips["id"].iloc[n_done - 1] != info["veh_id"]:
+        raise ValueError(f"Checkpoint after vehicle {info['veh_id']} ({n_done} vehicles) does not match "
+                         f"the trips of {store.postfix}")
+    _truncate_csv(output_csv_path, n_done)
+    if fcd_csv_path is not None:
+        _truncate_csv(fcd_csv_path, info["fcd_rows"])
+    mylog = pd.read_csv(output_csv_path).to_dict("records")[:-1] + [info["result"]]
+    logger.info(f"Resume: {n_done} of {len(trips)} vehicles restored, continuing after {info['veh_id']}")
+    return mylog, info["fcd_rows"]
+
+
+def _truncate_csv(path: str, n_rows: int) -> None:
+    # Keep the header and the first n_rows rows
+    with open(path, "r+b") as file:
+        for _ in range(n_rows + 1):
+            file.readline()
+        file.truncate()
 
 
 def calibrated_data_FCD(
@@ -668,7 +1305,7 @@ def calibrated_data_FCD(
     detector_mappings: Dict,
     detector: str,
     maxspeed: float,
-    path: str,
+    snapshot_store: SnapshotStore,
     postfix: str,
     pathout: str,
     iteration: int,
@@ -676,6 +1313,13 @@ def calibrated_data_FCD(
     acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
     n_initial_points: int,
     no_speed: bool,
+    stopping_rules: Dict[str, float],
+    physics_seeds: Optional[pd.DataFrame],
+    phase_timer: Optional[PhaseTimer],
+    geo_projection: GeoProjection,
+    resume: bool = False,
+    checkpoint_every: int = 10,
+    optimizer_engine: str = "skopt",
 ) -> str:
     """Run the calibration process for all vehicles.
 
@@ -683,9 +1327,16 @@ def calibrated_data_FCD(
         trips: Trips DataFrame
         detector: Detector ID
         maxspeed: Maximum speed value
-        path: Output path
+        snapshot_store: Store for the simulation states
         postfix: Postfix for filenames
         iteration: Maximum number of iterations
+        physics_seeds: Seeds and narrowed bounds per vehicle, None to search the default box
+        phase_timer: Per-phase timings, written next to the results, None to disable
+        geo_projection: Projection of the FCD x and y to lon/lat
+        resume: Continue from the last checkpoint of an interrupted run
+        checkpoint_every: Checkpoint the run every checkpoint_every vehicles, 0 to disable
+        optimizer_engine: Optimizer of every vehicle, "skopt" (base_estimator, acq_func) or "pattern",
+            see src.tools.optimizers
 
     Returns:
         DataFrame with calibration results
@@ -696,65 +1347,49 @@ def calibrated_data_FCD(
                 trips,
                 detector,
                 detector_mappings,
-                path,
-                postfix)
+                snapshot_store)
 
+    if physics_seeds is not None:
+        trips = trips.join(physics_seeds)
     trips["departSpeed"] = maxspeed
     trips["speed_factor"] = 1
-    mylog = []
     # Determine the output file path
     output_csv_path = f"{pathout}calibrated_data_{postfix}.csv"
     logsim_csv_path = f"{pathout}fcd_data_{postfix}.csv"
+    mylog, fcd_rows = [], 0
+    if resume:
+        mylog, fcd_rows = _restore_checkpoint(trips, snapshot_store, output_csv_path, logsim_csv_path)
+    mode = 'a' if mylog else 'w'
 
     # Define the CSV column headers based on the result dictionary keys and the calculated deltas
-    csv_headers = [
-        "veh_id",
-        "time_detector_sim",
-        "speed_detector_sim",
-        "speed_factor",
-        "time_detector_real",
-        "depart",
-        "departSpeed",
-        "speed_detector_real",
-        "delta_time",
-        "delta_speed"
-    ]
+    csv_headers = CSV_HEADERS
     
-    fcd_header = [
-        "time",
-        "id",
-        "speedfactor",
-        "x",
-        "y",
-        "angle",
-        "speed", 
-        "acceleration",
-        "pos",
-        "lane",
-        "noise",   
-    ]
+    fcd_header = fcd_trace.COLUMNS
 
     # Open the CSV file in write mode to create a new file and write the header
     # Use newline='' to prevent extra blank rows.
-    logsim_list = []
     
-    with open(output_csv_path, 'w', newline='') as result_csv,  \
-         open(logsim_csv_path, 'w', newline='') as fcd_csv:
+    with open(output_csv_path, mode, newline='') as result_csv,  \
+         open(logsim_csv_path, mode, newline='') as fcd_csv:
 
         result_writer = csv.writer(result_csv)
         fcd_writer = csv.writer(fcd_csv)
 
-        result_writer.writerow(csv_headers)
-        fcd_writer.writerow(fcd_header)  # Assuming each dict in logsim_list has these keys
+        if not mylog:
+            result_writer.writerow(csv_headers)
+            fcd_writer.writerow(fcd_header)
 
 
         #mylog = [] # Keep mylog for existing logic if needed later in the function
         step = 0
         best_iter  = 0
 
-        for index, row in trips.iterrows():
-            result, logsim_list, best_iter = _calibrate_single_vehicle_FCD(dict(row), detector, maxspeed, path, postfix, iteration, mylog,
-                                               base_estimator, acq_func, n_initial_points, no_speed)
+        for index, row in trips.iloc[len(mylog):].iterrows():
+            if phase_timer is not None:
+                phase_timer.start_vehicle()
+            result, best_trace, best_iter = _calibrate_single_vehicle_FCD(dict(row), detector, maxspeed, snapshot_store, iteration, mylog,
+                                               base_estimator, acq_func, n_initial_points, no_speed, stopping_rules,
+                                               phase_timer, optimizer_engine)
 
             # Calculate the delta values for the current vehicle
             result["delta_time"] = result["time_detector_sim"] - result["time_detector_real"]
@@ -764,16 +1399,16 @@ def calibrated_data_FCD(
             row_data = [result.get(header, "") for header in csv_headers] # Use .get to handle missing keys gracefully
             result_writer.writerow(row_data)
 
-            # FCD ---------
-            for log_row in logsim_list:
-                fcd_writer.writerow([log_row.get(h, "") for h in fcd_header])
-                #logger.info(log_row)
+            # FCD --------- only the trace of the best iteration is kept, written and dropped per vehicle
+            fcd_rows += best_trace.write(fcd_writer, geo_projection)
             #mylog.append(result) # Keep appending to mylog if needed for other logic
             step += 1
+            if phase_timer is not None:
+                phase_timer.end_vehicle(result["veh_id"], step, len(trips))
+            if checkpoint_every and len(mylog) % checkpoint_every == 0:
+                _checkpoint(snapshot_store, mylog, result_csv, fcd_csv, fcd_rows)
             
-        last_logsim = _last_times_sim_fcd(last_best_state=best_iter ,path=path, postfix=postfix)
-        for log_row in last_logsim:
-            fcd_writer.writerow([log_row.get(h, "") for h in fcd_header])
+        _last_times_sim_fcd(snapshot_store, detector, fcd_writer, geo_projection)
 
 
     # The file is automatically closed when exiting the 'with' block.
@@ -786,6 +1421,11 @@ def calibrated_data_FCD(
 
     if traci.isLoaded():
         traci.close()
+    snapshot_store.persist()
+    snapshot_store.clear_checkpoint()
+    snapshot_store.close()
+    if phase_timer is not None:
+        logger.info(f"Time per phase [s]: {phase_timer.summary()}, timings written to {phase_timer.write()}")
     #out_df = pd.DataFrame(mylog)
     #out_df["delta_time"] = out_df["time_detector_sim"] - out_df["time_detector_real"] # Recalculate deltas for the DataFrame
     #out_df["delta_speed"] = out_df["speed_detector_sim"] - out_df["speed_detector_real"] # Recalculate deltas for the DataFrame
@@ -801,7 +1441,7 @@ def calibrated_data(
     detector_mappings: Dict,
     detector: str,
     maxspeed: float,
-    path: str,
+    snapshot_store: SnapshotStore,
     postfix: str,
     pathout: str,
     iteration: int,
@@ -809,6 +1449,18 @@ def calibrated_data(
     acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
     n_initial_points: int,
     no_speed:bool,
+    stopping_rules: Dict[str, float],
+    physics_seeds: Optional[pd.DataFrame],
+    lookahead_bounds: Optional[pd.DataFrame],
+    phase_timer: Optional[PhaseTimer],
+    batch_size: int = 1,
+    resume: bool = False,
+    checkpoint_every: int = 10,
+    warm_start: int = 0,
+    warm_start_kernel: bool = True,
+    speculative: bool = False,
+    speculative_tolerance: Union[int, float] = 1.0,
+    optimizer_engine: str = "skopt",
 ) -> str:
     """Run the calibration process for all vehicles.
 
@@ -816,71 +1468,71 @@ def calibrated_data(
         trips: Trips DataFrame
         detector: Detector ID
         maxspeed: Maximum speed value
-        path: Output path
+        snapshot_store: Store for the simulation states
         postfix: Postfix for filenames
         iteration: Maximum number of iterations
+        physics_seeds: Seeds and narrowed bounds per vehicle, None to search the default box
+        lookahead_bounds: Route bounds per vehicle to jump ahead to the detector, None to step every second
+        phase_timer: Per-phase timings, written next to the results, None to disable
+        batch_size: Number of candidates per vehicle simulated at the same time, each in its own SUMO instance
+        resume: Continue from the last checkpoint of an interrupted run
+        checkpoint_every: Checkpoint the run every checkpoint_every vehicles, 0 to disable
+        warm_start: Number of best points of the previous vehicle told to the optimizer of the next one, 0 to disable
+        warm_start_kernel: With warm_start, start the GP of a vehicle from the kernel of the previous one
+        speculative: Calibrate the next vehicle in a second SUMO process at the same time, on a predicted
+            result of the current one, see _calibrate_trips_speculative()
+        speculative_tolerance: Allowed deviation in time_detector_sim of a speculative result replayed on the
+            actual state in seconds
+        optimizer_engine: Optimizer of every vehicle, "skopt" (base_estimator, acq_func) or "pattern",
+            see src.tools.optimizers
 
     Returns:
         DataFrame with calibration results
     """
+    if speculative and warm_start:
+        # The speculative vehicle starts before the optimizer of the previous vehicle is done
+        raise ValueError("speculative does not support warm_start, set one of them only")
 
     setup_traci_simulation(
                 sumo_config,
                 trips,
                 detector,
                 detector_mappings,
-                path,
-                postfix)
+                snapshot_store)
+    connections = _start_batch_connections(sumo_config, trips["depart"][0]-100, detector, detector_mappings, batch_size)
 
+    if physics_seeds is not None:
+        trips = trips.join(physics_seeds)
+    if lookahead_bounds is not None:
+        trips = trips.join(lookahead_bounds)
     trips["departSpeed"] = maxspeed
     trips["speed_factor"] = 1
-    mylog = []
     # Determine the output file path
     output_csv_path = f"{pathout}calibrated_data_{postfix}.csv"
-
-    # Define the CSV column headers based on the result dictionary keys and the calculated deltas
-    csv_headers = [
-        "veh_id",
-        "time_detector_sim",
-        "speed_detector_sim",
-        "speed_factor",
-        "time_detector_real",
-        "depart",
-        "departSpeed",
-        "speed_detector_real",
-        "delta_time",
-        "delta_speed"
-    ]
+    mylog = _restore_checkpoint(trips, snapshot_store, output_csv_path)[0] if resume else []
 
     # Open the CSV file in write mode to create a new file and write the header
     # Use newline='' to prevent extra blank rows.
-    logsim_list = []
-    
-    with open(output_csv_path, 'w', newline='') as result_csv:
+    with open(output_csv_path, 'a' if mylog else 'w', newline='') as result_csv:
 
         result_writer = csv.writer(result_csv)
 
-        result_writer.writerow(csv_headers)
-
-
-        #mylog = [] # Keep mylog for existing logic if needed later in the function
-        step = 0
-
-        for index, row in trips.iterrows():
-            result = _calibrate_single_vehicle(dict(row), detector, maxspeed, path, postfix, iteration, mylog,
-                                               base_estimator, acq_func, n_initial_points, no_speed )
-
-            # Calculate the delta values for the current vehicle
-            result["delta_time"] = result["time_detector_sim"] - result["time_detector_real"]
-            result["delta_speed"] = result["speed_detector_sim"] - result["speed_detector_real"]
-            mylog.append(result)
-            # Write the current vehicle's result as a row to the CSV
-            row_data = [result.get(header, "") for header in csv_headers] # Use .get to handle missing keys gracefully
-            result_writer.writerow(row_data)
+        if not mylog:
+            result_writer.writerow(CSV_HEADERS)
 
-         
-            #mylog.append(result) # Keep appending to mylog if needed for other logic
-            step += 1
+        if speculative:
+            _calibrate_trips_speculative(trips.iloc[len(mylog):], sumo_config, detector, detector_mappings,
+                                         maxspeed, snapshot_store, iteration, mylog, base_estimator, acq_func,
+                                         n_initial_points, no_speed, stopping_rules, speculative_tolerance,
+                                         result_writer=result_writer, connections=connections,
+                                         timer=phase_timer, checkpoint_every=checkpoint_every,
+                                         result_csv=result_csv, engine=optimizer_engine)
+        else:
+            _calibrate_trips(trips.iloc[len(mylog):], detector, maxspeed, snapshot_store, iteration, mylog,
+                             base_estimator, acq_func, n_initial_points, no_speed, stopping_rules,
+                             result_writer=result_writer, connections=connections, timer=phase_timer,
+                             checkpoint_every=checkpoint_every, result_csv=result_csv,
+                             warm_start=warm_start, warm_start_kernel=warm_start_kernel, engine=optimizer_engine)
 
     # The file is automatically closed when exiting the 'with' block.
     # The original code then converts mylog to a DataFrame and saves again.
@@ -890,8 +1542,14 @@ def calibrated_data(
     # Note: This will overwrite the file just created in the loop, but ensures consistency
     # if other parts of the pipeline expect the DataFrame return value or the final file format.
 
+    _close_batch_connections(connections)
     if traci.isLoaded():
         traci.close()
+    snapshot_store.persist()
+    snapshot_store.clear_checkpoint()
+    snapshot_store.close()
+    if phase_timer is not None:
+        logger.info(f"Time per phase [s]: {phase_timer.summary()}, timings written to {phase_timer.write()}")
     #out_df = pd.DataFrame(mylog)
     #out_df["delta_time"] = out_df["time_detector_sim"] - out_df["time_detector_real"] # Recalculate deltas for the DataFrame
     #out_df["delta_speed"] = out_df["speed_detector_sim"] - out_df["speed_detector_real"] # Recalculate deltas for the DataFrame
@@ -900,18 +1558,90 @@ def calibrated_data(
 
 
 
+def _calibrate_trips(
+    trips: pd.DataFrame,
+    detector: str,
+    maxspeed: float,
+    store: SnapshotStore,
+    iteration: int,
+    mylog: List,
+    base_estimator: str,
+    acq_func: str,
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Optional[Dict[str, float]] = None,
+    result_writer=None,
+    connections: Optional[List[Any]] = None,
+    timer: Optional[PhaseTimer] = None,
+    checkpoint_every: int = 0,
+    result_csv=None,
+    warm_start: int = 0,
+    warm_start_kernel: bool = True,
+    engine: str = "skopt",
+) -> List[Dict[str, Any]]:
+    """Calibrate the vehicles in trips one after the other on the running simulation.
+
+    Args:
+        trips: Trips DataFrame, sorted by depart
+        detector: Detector ID
+        maxspeed: Maximum speed value
+        store: Store for the simulation states
+        iteration: Maximum number of iterations
+        mylog: List of calibration results, extended in place
+        stopping_rules: Early-stopping rules, see stopping_rules()
+        result_writer: Optional csv.writer, every result is written as soon as it is available
+        connections: TraCI connections for batch evaluation, see _start_batch_connections()
+        timer: Records the phase timings and logs the progress
+        checkpoint_every: Checkpoint the store every checkpoint_every vehicles (counted in mylog), 0 to disable
+        result_csv: Open file of result_writer, flushed to disk at every checkpoint
+        warm_start: Number of best points of the previous vehicle told to the optimizer of the next one, 0 to disable
+        warm_start_kernel: With warm_start, start the GP of a vehicle from the kernel of the previous one
+        engine: Optimizer engine, see src.tools.optimizers
+
+    Returns:
+        List of calibration results (mylog)
+    """
+    warm = {"n_points": warm_start, "reuse_kernel": warm_start_kernel} if warm_start > 0 else None
+    for done, (index, row) in enumerate(trips.iterrows(), start=1):
+        if timer is not None:
+            timer.start_vehicle()
+        result = _calibrate_single_vehicle(dict(row), detector, maxspeed, store, iteration, mylog,
+                                           base_estimator, acq_func, n_initial_points, no_speed, stopping_rules,
+                                           connections, timer, warm, engine)
+        if timer is not None:
+            timer.end_vehicle(result["veh_id"], done, len(trips))
+
+        # Calculate the delta values for the current vehicle
+        result["delta_time"] = result["time_detector_sim"] - result["time_detector_real"]
+        result["delta_speed"] = result["speed_detector_sim"] - result["speed_detector_real"]
+        mylog.append(result)
+        # Write the current vehicle's result as a row to the CSV
+        if result_writer is not None:
+            result_writer.writerow([result.get(header, "") for header in CSV_HEADERS])
+        if checkpoint_every and len(mylog) % checkpoint_every == 0:
+            _checkpoint(store, mylog, result_csv)
+
+    if mylog:
+        logger.info(f"Mean iterations per vehicle: {round(np.mean([r['stop_iteration'] for r in mylog]), 1)} of {iteration}")
+    return mylog
+
+
 def _calibrate_single_vehicle(
     row: dict, 
     detector: str, 
     maxspeed: float, 
-    path: str, 
-    postfix: str, 
+    store: SnapshotStore, 
     iteration: int, 
     mylog: List,
     base_estimator: str,   #{"GP", "RF", "ET", "GBRT"}
     acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
     n_initial_points: int,
-    no_speed: bool
+    no_speed: bool,
+    stopping_rules: Optional[Dict[str, float]] = None,
+    connections: Optional[List[Any]] = None,
+    timer: Optional[PhaseTimer] = None,
+    warm: Optional[Dict[str, Any]] = None,
+    engine: str = "skopt",
 ) -> Tuple[Dict[str, Any], list]:
     """Calibrate a single vehicle in the simulation.
     
@@ -919,10 +1649,18 @@ def _calibrate_single_vehicle(
         row: Vehicle data row
         detector: Detector ID
         maxspeed: Maximum speed value
-        path: Output path
-        postfix: Postfix for filenames
+        store: Store for the simulation states
         iteration: Maximum number of iterations
         mylog: List of calibration results
+        stopping_rules: Early-stopping rules, see stopping_rules()
+        connections: TraCI connections for batch evaluation, see _start_batch_connections()
+        timer: Records the phase timings of every iteration
+        warm: Warm-start state of the previous vehicle, updated for the next one, None for a cold start.
+            The transferred points are told to the optimizer first and replace random initial points,
+            but they are never the result of this vehicle.
+        engine: Optimizer engine, see src.tools.optimizers
+
+    Points the optimizer proposes again are answered from a per-vehicle evaluation cache.
         
     Returns:
         Dictionary with calibration result for this vehicle
@@ -942,55 +1680,117 @@ def _calibrate_single_vehicle(
         depart_min = mylog[-1]["depart"]+1
     else:
         depart_min = row["time_detector_real"] - 100
+        if not pd.isna(row.get("depart_floor", np.nan)):
+            depart_min = max(depart_min, row["depart_floor"])      # Head of an interaction cluster
         
     depart_max = max(row["time_detector_real"] - 10, depart_min +2)
     
     
-    speed_factor_min = 0.6
-    speed_factor_max = 3.2
-    speed_factor_resolution = 20
+    speed_factor_min = SPEED_FACTOR_MIN
+    speed_factor_max = SPEED_FACTOR_MAX
+    speed_factor_resolution = SPEED_FACTOR_RESOLUTION
 
     
-    bounds = [Integer(0, depart_max-depart_min), Integer(int(speed_factor_min*speed_factor_resolution), int(speed_factor_max*speed_factor_resolution))]
+    bounds, x_seed = _search_space(row, depart_min, depart_max)
     #bounds = [Integer(0, depart_max-depart_min), (speed_factor_min, speed_factor_max)]
 
     logger.info(row)
-    logger.info(f"bounds = {bounds}, depart_min = {depart_min} ")
+    logger.info(f"bounds = {bounds}, depart_min = {depart_min}, seed = {x_seed} ")
     
     # --- Initialize Bayesian Optimizer ---
-    opt = Optimizer(dimensions=bounds, base_estimator=base_estimator, acq_func=acq_func, n_initial_points=n_initial_points)
-    for i in range(iteration):
-        x_next = opt.ask()                 # Propose next point
-        row['depart'] = x_next[0]+depart_min
-        row["speed_factor"] = x_next[1]/speed_factor_resolution
-        #row["speed_factor"] = x_next[1]
- 
-        time_speed = _run_simulation_steps(row, detector, path, postfix, i, maxspeed=maxspeed)
-        if time_speed is not None:
-            time, speed = time_speed
-            time_list.append(time)
-            speed_list.append(speed)
-            
+    opt = optimizers.make_optimizer(engine, bounds, _warm_estimator(warm, base_estimator), acq_func, n_initial_points=n_initial_points)
+    n_transferred = 0
+    if warm is not None:
+        x_transferred, y_transferred = _transfer_points(warm, row, depart_min, bounds)
+        if x_transferred:
+            opt.tell(x_transferred, y_transferred)
+            n_transferred = len(x_transferred)
+            logger.info(f"Warm start from {warm['veh_id']}: {n_transferred} points {x_transferred}"
+                        + (f", kernel {warm['kernel']}" if warm.get("kernel") is not None else ""))
+    best_y_so_far = np.inf
+    last_improvement = 0
+    batch_size = len(connections) if connections else 1
+    # Evaluation cache: (vehicle, depart, speed factor index, base state) -> ((time, speed), snapshot key)
+    evaluations = {}
+    snapshot_keys = []
+    cache_hits = 0
+    i = 0
+    stop_reason = None
+    while i < iteration and not stop_reason:
+        # Propose the next point(s), one per SUMO instance
+        n_points = min(batch_size, iteration - i)
+        batch_start = i
+        ask_start = perf_counter()
+        if i == 0 and x_seed is not None:
+            n_points = 1
+            x_batch = [x_seed]               # The physics seed is the first initial point
         else:
-            logger.info("errorrrrrrrrrrr in time-speeeeeeeed")
-        time_error = time-row["time_detector_real"]
-        speed_error = speed - row["speed_detector_real"]
-
-
-        if no_speed:
-            y_next = (time_error)**2 + 0.1*(1-row["speed_factor"])**2
+            x_batch = [opt.ask()] if n_points == 1 else opt.ask(n_points=n_points)
+        ask_s = (perf_counter() - ask_start) / n_points
+        candidates = []
+        for x_next in x_batch:
+            candidate = dict(row)
+            candidate['depart'] = x_next[0]+depart_min
+            candidate["speed_factor"] = x_next[1]/speed_factor_resolution
+            #candidate["speed_factor"] = x_next[1]
+            candidates.append(candidate)
+
+        # Points evaluated before are answered from the cache without touching SUMO
+        keys = [(row["id"], candidate["depart"], x_next[1], store.generation) for candidate, x_next in zip(candidates, x_batch)]
+        misses = [j for j, key in enumerate(keys) if key not in evaluations]
+        evaluated = _evaluate_candidates([candidates[j] for j in misses], detector, store, [i + j for j in misses],
+                                         maxspeed, connections, timer)
+        for j, time_speed in zip(misses, evaluated):
+            evaluations[keys[j]] = (time_speed, i + j)
+        cache_hits += len(x_batch) - len(misses)
+
+        y_batch = []
+        for candidate, key in zip(candidates, keys):
+            time_speed, snapshot_key = evaluations[key]
+            snapshot_keys.append(snapshot_key)
+            row.update(candidate)
+            if time_speed is not None:
+                time, speed = time_speed
+                time_list.append(time)
+                speed_list.append(speed)
+
+            else:
+                logger.info("errorrrrrrrrrrr in time-speeeeeeeed")
+            time_error = time-row["time_detector_real"]
+            speed_error = speed - row["speed_detector_real"]
+
+
+            if no_speed:
+                y_next = (time_error)**2 + 0.1*(1-row["speed_factor"])**2
+            else:
+                y_next = (time_error)**2 + 2*(speed_error)**2
+                y_next = y_next - .5*(row["speed_factor"]-speed_factor_min)/(speed_factor_max-speed_factor_min)
+                y_next = y_next + (row['depart']-depart_min)/(depart_max-depart_min)
+            y_batch.append(y_next)
+            #logger.info(f"Iter {i}: Input={x_next}, Error={y_next:.4f}, time_error={time_error},  speed_error={speed_error}")
+
+            # --- Early stopping --- (checked per evaluation, the rest of the batch is still told)
+            if y_next < best_y_so_far:
+                best_y_so_far, last_improvement = y_next, i
+            stop_reason = stop_reason or _stop_reason(stopping_rules, time_error, speed_error, no_speed, i - last_improvement)
+            i += 1
+
+        tell_start = perf_counter()
+        if n_points == 1:
+            opt.tell(x_batch[0], y_batch[0])          # Give result to optimizer
         else:
-            y_next = (time_error)**2 + 2*(speed_error)**2
-            y_next = y_next - .5*(row["speed_factor"]-speed_factor_min)/(speed_factor_max-speed_factor_min)
-            y_next = y_next + (row['depart']-depart_min)/(depart_max-depart_min)
-
-        opt.tell(x_next, y_next)          # Give result to optimizer
-        #logger.info(f"Iter {i}: Input={x_next}, Error={y_next:.4f}, time_error={time_error},  speed_error={speed_error}")
-        
-    # --- Best result ---
-    best_index = np.argmin(opt.yi)
-    best_x = opt.Xi[best_index]
-    best_y = min(opt.yi)
+            opt.tell(x_batch, y_batch)
+        if timer is not None:
+            tell_s = (perf_counter() - tell_start) / n_points
+            for j in range(n_points):
+                timer.add(row["id"], batch_start + j, ask_s=ask_s, tell_s=tell_s)
+    if stop_reason:
+        logger.info(f"Stopped after {i} of {iteration} iterations: {stop_reason}")
+
+    # --- Best result --- (of the own evaluations, without the transferred points)
+    best_index = int(np.argmin(opt.yi[n_transferred:]))
+    best_x = opt.Xi[n_transferred + best_index]
+    best_y = opt.yi[n_transferred + best_index]
     logging.info(f"Best estimate: index = {best_index}" )
     logging.info(f"Depart time: {depart_min+ best_x[0]} s, factor speed: {round(best_x[1]/speed_factor_resolution, 2)} ")
     logging.info(f"Minimum error: {best_y:.4f}")
@@ -998,8 +1798,13 @@ def _calibrate_single_vehicle(
     #for item in simlog_list[best_index]:
     #    logging.info(f"simlog = {item} ")
 
-    traci.simulation.loadState(f"{path}simulation_{postfix}_{best_index}.sumo.state")
-    traci.simulation.saveState(f"{path}simulation_{postfix}.sumo.state")
+    # The best iteration snapshot becomes the starting state of the next vehicle
+    store.promote(snapshot_keys[best_index])
+    store.evict()
+    logger.info(f"State I/O: {store.stats()}, evaluation cache: {cache_hits} hits, {len(evaluations)} misses")
+    store.reset_stats()
+    if warm is not None:
+        _warm_start_state(warm, row, opt, n_transferred, depart_min)
     
     return {
         "veh_id": row["id"],
@@ -1011,19 +1816,64 @@ def _calibrate_single_vehicle(
         "time_detector_real": row["time_detector_real"],
         "depart": best_x[0]+depart_min,
         "departSpeed": maxspeed * round((best_x[1]/speed_factor_resolution),2) ,
-        "speed_detector_real": row["speed_detector_real"]
+        "speed_detector_real": row["speed_detector_real"],
+        "stop_iteration": i,
     }
 
 
+def _evaluate_candidates(
+    candidates: List[dict],
+    detector: str,
+    store: SnapshotStore,
+    iteration_numbers: List[int],
+    maxspeed: float,
+    connections: Optional[List[Any]] = None,
+    timer: Optional[PhaseTimer] = None,
+) -> List[Optional[Tuple[float, float]]]:
+    """Simulate the candidates of one vehicle, in parallel if there is a connection for each of them.
+
+    All candidates start from the base state of the store. Candidate j saves its snapshot under
+    iteration_numbers[j].
+
+    Args:
+        candidates: Vehicle rows with the proposed depart and speed_factor
+        detector: Detector ID
+        store: Store for the simulation states
+        iteration_numbers: Snapshot key per candidate
+        maxspeed: Maximum speed value
+        connections: TraCI connections, at least len(candidates) for a parallel evaluation
+        timer: Records the phase timings
+
+    Returns:
+        List of (time, speed) or None per candidate
+    """
+    if not candidates:
+        return []
+    if len(candidates) == 1:
+        connection = connections[0] if connections else None
+        return [_run_simulation_steps(candidates[0], detector, store, iteration_numbers[0], maxspeed=maxspeed,
+                                      connection=connection, timer=timer)]
+
+    # Every SUMO instance runs in its own process, the threads only wait on the sockets
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        futures = [executor.submit(_run_simulation_steps, candidate, detector, store, iteration_numbers[j],
+                                   maxspeed, connections[j], timer)
+                   for j, candidate in enumerate(candidates)]
+        return [future.result() for future in futures]
+
 
-def _run_simulation_steps(row: dict, detector: str, path: str, postfix: str, iteration_number:int, maxspeed: float) -> Optional[Tuple[float, float]]:
+
+def _run_simulation_steps(row: dict, detector: str, store: SnapshotStore, iteration_number:int, maxspeed: float,
+                          connection=None, timer: Optional[PhaseTimer] = None) -> Optional[Tuple[float, float]]:
     """Run simulation steps until the vehicle passes the detector.
     
     Args:
         row: Vehicle data row
         detector: Detector ID
-        path: Output path
-        postfix: Postfix for filenames
+        store: Store for the simulation states
+        iteration_number: Key of the snapshot saved one step after the departure
+        connection: TraCI connection to run on, the default connection if None
+        timer: Records load_state, save_state and step timings of the iteration
         
     Returns:
         Tuple of (time, speed) or None if vehicle didn't pass detector
@@ -1031,20 +1881,25 @@ def _run_simulation_steps(row: dict, detector: str, path: str, postfix: str, ite
     time = None
     speed = None
     simulation_log =[]
+    sumo = connection if connection is not None else traci
     
+    start = perf_counter()
     try:
-        traci.simulation.loadState(f"{path}simulation_{postfix}.sumo.state")
+        store.load(connection=connection)
     except traci.FatalTraCIError as e:
         logger.error(f"Error loading simulation state: {e}")
-        traci.close()
+        sumo.close()
         raise
+    load_state_s = perf_counter() - start
+    save_state_s = 0
+    n_steps = 0
 
     # Remove the vehicle if it exists
-    if row['id'] in traci.vehicle.getIDList():
-        traci.vehicle.remove(row['id'])
+    if row['id'] in sumo.vehicle.getIDList():
+        sumo.vehicle.remove(row['id'])
     
     try:
-        traci.vehicle.addFull(
+        sumo.vehicle.addFull(
             vehID=row['id'],
             routeID=f"{row['detector_id']}_route",
             depart=row["depart"],
@@ -1054,42 +1909,656 @@ def _run_simulation_steps(row: dict, detector: str, path: str, postfix: str, ite
         )
         #traci.vehicle.setSpeedMode(row['id'], 95)
         row["departSpeed"] = row["speed_factor"] * maxspeed
-        traci.vehicle.setLaneChangeMode(row['id'], 0)
+        sumo.vehicle.setLaneChangeMode(row['id'], 0)
         #traci.vehicle.changeLine(row['id'],row["departLane"],100000) #time to stay in the lane
     except traci.TraCIException as e:
         logger.error(f"Error adding vehicle {row['id']}: {e}")
-        traci.close()
+        sumo.close()
         raise
     
-    traci.vehicle.setSpeedFactor(row["id"], row["speed_factor"])
+    sumo.vehicle.setSpeedFactor(row["id"], row["speed_factor"])
     #traci.vehicle.setSpeed(row['id'], row["speed_factor"] * maxspeed)
     
     #traci.vehicle.setMaxSpeed(row["id"], row["speed_factor"] * maxspeed)
 
     
-    while traci.simulation.getMinExpectedNumber() > 0:
+    _subscribe(sumo, detector)
+    # Subscription results are read locally, without a round trip to SUMO
+    simulation, inductionloop = sumo.simulation, sumo.inductionloop
+    simtime = simulation.getSubscriptionResults()[tc.VAR_TIME]
+    jump_to = _lookahead_target(row)
+    start = perf_counter()
+    while simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
         #print(f"step  = {traci.simulation.getTime()}  , depart  = {row["depart"]}")
             
-        traci.simulationStep()
+        # One step, or after the depart+1 snapshot straight to the step before the earliest arrival
+        # (simulationStep(target) with a target not after the current time is a single step)
+        target = 0
+        if jump_to is not None and simtime > int(row["depart"]):
+            target, jump_to = jump_to, None
+        sumo.simulationStep(target)
+        n_steps += 1
         #for veh in traci.simulation.getDepartedIDList():
             #traci.vehicle.changeLine(veh,row["departLane"],100000) #time to stay in the lane
         #    traci.vehicle.setLaneChangeMode(veh, 0)
 
-        simtime = traci.simulation.getTime()
+        simtime = simulation.getSubscriptionResults()[tc.VAR_TIME]
         if simtime == int(row["depart"])+1:
-            traci.simulation.saveState(f"{path}simulation_{postfix}_{iteration_number}.sumo.state")
+            save_start = perf_counter()
+            store.save(iteration_number, connection=connection)
+            save_state_s += perf_counter() - save_start
             #print (f"depart = {row["depart"]}, step = {traci.simulation.getMinExpectedNumber()}, ite = {iteration_number}" )
       
         
-        vehicles = traci.inductionloop.getLastStepVehicleIDs(detector)
+        detector_values = inductionloop.getSubscriptionResults(detector)
+        vehicles = detector_values[tc.LAST_STEP_VEHICLE_ID_LIST]
         
         if vehicles and vehicles[0] == row["id"]:
-            veh_id, veh_length, entry_time, exit_time, vType = traci.inductionloop.getVehicleData(detector)[0]
-            speed = traci.inductionloop.getLastStepMeanSpeed(detector)
+            veh_id, veh_length, entry_time, exit_time, vType = inductionloop.getVehicleData(detector)[0]
+            speed = detector_values[tc.LAST_STEP_MEAN_SPEED]
             time = round(entry_time - 1, 2)
             #time = round(entry_time, 2)
+            break
 
-            return time, speed
-    
-    return None
+    if timer is not None:
+        timer.add(row["id"], iteration_number, load_state_s=load_state_s, save_state_s=save_state_s,
+                  step_s=perf_counter() - start - save_state_s, n_steps=n_steps)
+    if time is None:
+        return None
+    return time, speed
+
+
+
+##########   Sharded  Version  ####################
+
+def calibrated_data_sharded(
+    trips: pd.DataFrame,
+    sumo_config: str,
+    detector_mappings: Dict,
+    detector: str,
+    maxspeed: float,
+    snapshot_store: SnapshotStore,
+    postfix: str,
+    pathout: str,
+    iteration: int,
+    base_estimator: str,   #{"GP", "RF", "ET", "GBRT"}
+    acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Dict[str, float],
+    physics_seeds: Optional[pd.DataFrame],
+    lookahead_bounds: Optional[pd.DataFrame],
+    phase_timer: Optional[PhaseTimer],
+    n_shards: int = 1,
+    shard_warmup: int = 200,
+    shard_tolerance: Union[int, float] = 1.0,
+    batch_size: int = 1,
+    warm_start: int = 0,
+    warm_start_kernel: bool = True,
+    optimizer_engine: str = "skopt",
+) -> str:
+    """Run the calibration process for all vehicles, split into time windows calibrated in parallel.
+
+    The day is split into n_shards windows holding about the same number of vehicles. Every window is
+    calibrated in its own SUMO process, starting shard_warmup seconds early so that the vehicles already
+    on the road at the window start are in the network. Warm-up results are only used for the seam check:
+    at every seam the warm-up vehicles of shard k are also calibrated by shard k-1. If the two disagree by
+    more than shard_tolerance seconds on time_detector_sim, or the depart chain is broken, the head of
+    shard k is re-calibrated on top of a replay of the accepted results of shard k-1. The vehicles after the
+    re-calibrated head are checked in the same way, failing that the re-calibration goes on through shard k.
+
+    Args:
+        trips: Trips DataFrame
+        detector: Detector ID
+        maxspeed: Maximum speed value
+        snapshot_store: Store for the simulation states, every shard gets its own store with the same settings
+        postfix: Postfix for filenames
+        iteration: Maximum number of iterations
+        physics_seeds: Seeds and narrowed bounds per vehicle, None to search the default box
+        lookahead_bounds: Route bounds per vehicle to jump ahead to the detector, None to step every second
+        phase_timer: Per-phase timings, the timings of all shards are written next to the results
+        n_shards: Number of time windows (and worker processes)
+        shard_warmup: Warm-up margin before every window in seconds
+        shard_tolerance: Allowed deviation in time_detector_sim at the seams in seconds
+        batch_size: Number of SUMO instances per shard for batch evaluation, see calibrated_data
+        warm_start: Number of best points of the previous vehicle told to the optimizer, see calibrated_data
+        warm_start_kernel: With warm_start, start the GP of a vehicle from the kernel of the previous one
+        optimizer_engine: Optimizer of every vehicle, see calibrated_data
+
+    Returns:
+        Path to the stitched calibration results
+    """
+    if physics_seeds is not None:
+        trips = trips.join(physics_seeds)
+    if lookahead_bounds is not None:
+        trips = trips.join(lookahead_bounds)
+    trips["departSpeed"] = maxspeed
+    trips["speed_factor"] = 1
+    output_csv_path = f"{pathout}calibrated_data_{postfix}.csv"
+
+    windows = _shard_windows(trips, n_shards)
+    logger.info(f"Calibrating {len(trips)} vehicles in {len(windows)} shards, warm-up = {shard_warmup} s")
+
+    common = dict(sumo_config=sumo_config, detector=detector, detector_mappings=detector_mappings,
+                  maxspeed=maxspeed, iteration=iteration, base_estimator=base_estimator,
+                  acq_func=acq_func, n_initial_points=n_initial_points, no_speed=no_speed,
+                  stopping_rules=stopping_rules, batch_size=batch_size, timing=phase_timer is not None,
+                  backend=sumo_backend.name(), warm_start=warm_start, warm_start_kernel=warm_start_kernel,
+                  engine=optimizer_engine)
+    times = trips["time_detector_real"]
+
+    with ProcessPoolExecutor(max_workers=len(windows)) as executor:
+        futures = []
+        for k, (start, end) in enumerate(windows):
+            shard_trips = trips[(times >= start - shard_warmup) & (times < end)]
+            futures.append(executor.submit(_calibrate_shard, shard_trips=shard_trips, replay=[],
+                                           store=snapshot_store.spawn(f"{postfix}_shard{k}"), **common))
+        shard_results = []
+        for future in futures:
+            results, timing_rows = future.result()
+            shard_results.append(results)
+            if phase_timer is not None:
+                phase_timer.extend(timing_rows)
+
+        # Owned results per shard, warm-up results are only kept for the seam check
+        owned = []
+        warmup = []
+        for (start, end), results in zip(windows, shard_results):
+            owned.append([r for r in results if start <= r["time_detector_real"] < end])
+            warmup.append([r for r in results if r["time_detector_real"] < start])
+
+        # --- Reconciliation pass at the seams ---
+        # A seam is re-calibrated in rounds of two warm-ups on top of the accepted results before it. The second
+        # warm-up of a round is checked against the first run of the shard like the warm-up vehicles at the seam.
+        # While it deviates, or the depart chain to the rest of the shard is broken, the next round goes on from
+        # the reconciled state, at worst up to the end of the shard.
+        def seam_replay(k, lo):
+            accepted = {r["veh_id"]: r for shard in owned[:k + 1] for r in shard}
+            return [accepted[veh_id] for veh_id in trips[(times >= lo - shard_warmup) & (times < lo)]["id"]
+                    if veh_id in accepted]
+
+        submitted = []
+        def submit_round(k, lo):
+            hi = min(lo + 2 * shard_warmup, windows[k][1]) if shard_warmup > 0 else windows[k][1]
+            replay = seam_replay(k, lo)
+            head = trips[(times >= lo) & (times < hi)]
+            future = None
+            if len(head):
+                future = executor.submit(_calibrate_shard, shard_trips=head, replay=replay,
+                                         store=snapshot_store.spawn(f"{postfix}_seam{k}_{len(submitted)}"), **common)
+                submitted.append(future)
+            return lo, hi, replay, future
+
+        reconcile = {}
+        for k in range(1, len(windows)):
+            accepted = {r["veh_id"]: r for shard in owned[:k] for r in shard}
+            deviation = max([abs(r["time_detector_sim"] - accepted[r["veh_id"]]["time_detector_sim"])
+                             for r in warmup[k] if r["veh_id"] in accepted], default=0.0)
+            chain_ok = not owned[k] or not owned[k-1] or owned[k][0]["depart"] > owned[k-1][-1]["depart"]
+            logger.info(f"Seam {k}: max deviation of warm-up vehicles = {round(deviation, 3)} s, chain ok = {chain_ok}")
+            if deviation <= shard_tolerance and chain_ok:
+                continue
+            reconcile[k] = submit_round(k, windows[k][0])
+
+        # In order, a seam replays the results of the shard before it, which its own reconciliation may change
+        n_rounds = 0
+        for k, (lo, hi, replay, future) in reconcile.items():
+            while True:
+                if future is not None and seam_replay(k, lo) != replay:
+                    future.cancel()
+                    lo, hi, replay, future = submit_round(k, lo)
+                results = []
+                if future is not None:
+                    results, timing_rows = future.result()
+                    if phase_timer is not None:
+                        phase_timer.extend(timing_rows)
+                n_rounds += 1
+
+                first_run = {r["veh_id"]: r for r in owned[k]}
+                deviation = max([abs(r["time_detector_sim"] - first_run[r["veh_id"]]["time_detector_sim"])
+                                 for r in results
+                                 if r["time_detector_real"] >= lo + shard_warmup and r["veh_id"] in first_run],
+                                default=0.0)
+                rest = [r for r in owned[k] if r["time_detector_real"] >= hi]
+                owned[k] = [r for r in owned[k] if r["time_detector_real"] < lo] + results + rest
+                chain_ok = not rest or not results or results[-1]["depart"] < rest[0]["depart"]
+                logger.info(f"Seam {k}: re-calibrated up to {hi}, max deviation of the checked vehicles = "
+                            f"{round(deviation, 3)} s, chain ok = {chain_ok}")
+                if not rest or (deviation <= shard_tolerance and chain_ok):
+                    break
+                lo, hi, replay, future = submit_round(k, hi)
+        logger.info(f"Re-calibrated {len(reconcile)} of {len(windows) - 1} seams in {n_rounds} rounds")
+
+    with open(output_csv_path, 'w', newline='') as result_csv:
+        result_writer = csv.writer(result_csv)
+        result_writer.writerow(CSV_HEADERS)
+        for shard in owned:
+            for result in shard:
+                result_writer.writerow([result.get(header, "") for header in CSV_HEADERS])
+
+    snapshot_store.close()
+    if phase_timer is not None:
+        logger.info(f"Time per phase [s]: {phase_timer.summary()}, timings written to {phase_timer.write()}")
+    return output_csv_path
+
+
+def _shard_windows(trips: pd.DataFrame, n_shards: int) -> List[Tuple[float, float]]:
+    """Split the day into time windows holding about the same number of vehicles.
+
+    Args:
+        trips: Trips DataFrame
+        n_shards: Number of windows
+
+    Returns:
+        List of (start, end) windows on time_detector_real, end exclusive
+    """
+    times = np.sort(trips["time_detector_real"].to_numpy())
+    chunks = [chunk for chunk in np.array_split(times, max(1, n_shards)) if len(chunk) > 0]
+    starts = sorted(set(chunk[0] for chunk in chunks))
+    ends = starts[1:] + [np.inf]
+    return list(zip(starts, ends))
+
+
+def _calibrate_shard(
+    shard_trips: pd.DataFrame,
+    replay: List[Dict[str, Any]],
+    sumo_config: str,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    store: SnapshotStore,
+    iteration: int,
+    base_estimator: str,
+    acq_func: str,
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Optional[Dict[str, float]] = None,
+    batch_size: int = 1,
+    timing: bool = False,
+    backend: str = "traci",
+    warm_start: int = 0,
+    warm_start_kernel: bool = True,
+    engine: str = "skopt",
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Calibrate one shard in its own SUMO process. Runs in a worker of calibrated_data_sharded.
+
+    Args:
+        shard_trips: Trips of the shard, including the warm-up vehicles
+        replay: Accepted results inserted as they are before shard_trips is calibrated
+        store: Store for the simulation states of this shard
+        batch_size: Number of SUMO instances for batch evaluation
+        timing: Record the per-phase timings
+        backend: SUMO backend of the parent process
+        warm_start: Number of best points of the previous vehicle told to the optimizer, 0 to disable
+        warm_start_kernel: With warm_start, start the GP of a vehicle from the kernel of the previous one
+        engine: Optimizer engine, see src.tools.optimizers
+
+    Returns:
+        Tuple of (calibration results for shard_trips, timing rows)
+    """
+    sumo_backend.select(backend)
+    departs = [r["depart"] for r in replay] + [shard_trips["depart"].min()]
+    _start_sumo(sumo_config, min(departs) - 100, detector, detector_mappings, store)
+    connections = _start_batch_connections(sumo_config, min(departs) - 100, detector, detector_mappings, batch_size)
+
+    timer = PhaseTimer() if timing else None
+    mylog = []
+    for result in replay:
+        _replay_vehicle(result, detector, detector_mappings, maxspeed, store)
+        mylog.append(result)
+
+    _calibrate_trips(shard_trips, detector, maxspeed, store, iteration, mylog,
+                     base_estimator, acq_func, n_initial_points, no_speed, stopping_rules,
+                     connections=connections, timer=timer, warm_start=warm_start,
+                     warm_start_kernel=warm_start_kernel, engine=engine)
+
+    _close_batch_connections(connections)
+    if traci.isLoaded():
+        traci.close()
+    store.close()
+    return mylog[len(replay):], (timer.rows if timer is not None else [])
+
+
+def _replay_vehicle(result: Dict[str, Any], detector: str, detector_mappings: Dict, maxspeed: float,
+                    store: SnapshotStore, promote: bool = True) -> Optional[Tuple[float, float]]:
+    """Insert an already calibrated vehicle and save the state for the next vehicle.
+
+    Args:
+        result: Calibration result of the vehicle
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        maxspeed: Maximum speed value
+        store: Store for the simulation states
+        promote: Make the state after the vehicle the new base, otherwise it is kept as snapshot 0
+
+    Returns:
+        Tuple of (time, speed) at the detector or None if the vehicle didn't pass it
+    """
+    row = {
+        "id": result["veh_id"],
+        "detector_id": detector,
+        "departLane": detector_mappings["detector2laneN"][detector],
+        "depart": result["depart"],
+        "speed_factor": result["speed_factor"],
+    }
+    time_speed = _run_simulation_steps(row, detector, store, 0, maxspeed=maxspeed)
+    if promote:
+        store.promote(0)
+        store.evict()
+    return time_speed
+
+
+
+##########   Clustered  Version  ####################
+
+def calibrated_data_clustered(
+    trips: pd.DataFrame,
+    sumo_config: str,
+    detector_mappings: Dict,
+    detector: str,
+    maxspeed: float,
+    snapshot_store: SnapshotStore,
+    postfix: str,
+    pathout: str,
+    iteration: int,
+    base_estimator: str,   #{"GP", "RF", "ET", "GBRT"}
+    acq_func: str, #{"LCB", "EI", "PI", "MES", "PVRS", "gp_hedge", "EIps", "PIps"}
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Dict[str, float],
+    interaction_clusters: Optional[pd.DataFrame],
+    physics_seeds: Optional[pd.DataFrame],
+    lookahead_bounds: Optional[pd.DataFrame],
+    phase_timer: Optional[PhaseTimer],
+    cluster_workers: int = 0,
+    batch_size: int = 1,
+    warm_start: int = 0,
+    warm_start_kernel: bool = True,
+    optimizer_engine: str = "skopt",
+) -> str:
+    """Run the calibration process for all vehicles, every interaction cluster as an independent job.
+
+    Each cluster from interaction_clusters() is calibrated in its own SUMO run, which starts from a clean
+    network 100 s before the first departure of the cluster. The runs are spread over a pool of
+    cluster_workers processes, and the largest clusters are submitted first. The results are merged in time
+    order.
+
+    Args:
+        trips: Trips DataFrame
+        detector: Detector ID
+        maxspeed: Maximum speed value
+        snapshot_store: Store for the simulation states, every cluster gets its own store with the same settings
+        postfix: Postfix for filenames
+        iteration: Maximum number of iterations
+        interaction_clusters: Cluster and depart_floor per vehicle, None (clustered off) runs a single cluster
+        physics_seeds: Seeds and narrowed bounds per vehicle, None to search the default box
+        lookahead_bounds: Route bounds per vehicle to jump ahead to the detector, None to step every second
+        phase_timer: Per-phase timings, the timings of all clusters are written next to the results
+        cluster_workers: Number of worker processes, 0 for one per CPU
+        batch_size: Number of SUMO instances per cluster for batch evaluation, see calibrated_data
+        warm_start: Number of best points of the previous vehicle told to the optimizer, see calibrated_data
+        warm_start_kernel: With warm_start, start the GP of a vehicle from the kernel of the previous one
+        optimizer_engine: Optimizer of every vehicle, see calibrated_data
+
+    Returns:
+        Path to the merged calibration results
+    """
+    if interaction_clusters is not None:
+        trips = trips.join(interaction_clusters)
+    else:
+        trips = trips.assign(cluster=0)
+    if physics_seeds is not None:
+        trips = trips.join(physics_seeds)
+    if lookahead_bounds is not None:
+        trips = trips.join(lookahead_bounds)
+    trips["departSpeed"] = maxspeed
+    trips["speed_factor"] = 1
+    output_csv_path = f"{pathout}calibrated_data_{postfix}.csv"
 
+    clusters = [cluster_trips for _, cluster_trips in trips.groupby("cluster", sort=True)]
+    workers = min(cluster_workers or os.cpu_count(), len(clusters))
+    logger.info(f"Calibrating {len(trips)} vehicles in {len(clusters)} interaction clusters on {workers} workers")
+
+    common = dict(sumo_config=sumo_config, detector=detector, detector_mappings=detector_mappings,
+                  maxspeed=maxspeed, iteration=iteration, base_estimator=base_estimator,
+                  acq_func=acq_func, n_initial_points=n_initial_points, no_speed=no_speed,
+                  stopping_rules=stopping_rules, batch_size=batch_size, timing=phase_timer is not None,
+                  backend=sumo_backend.name(), warm_start=warm_start, warm_start_kernel=warm_start_kernel,
+                  engine=optimizer_engine)
+
+    cluster_results = [None] * len(clusters)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for k in sorted(range(len(clusters)), key=lambda k: -len(clusters[k])):
+            futures[executor.submit(_calibrate_shard, shard_trips=clusters[k], replay=[],
+                                    store=snapshot_store.spawn(f"{postfix}_cluster{k}"), **common)] = k
+        done = 0
+        for future in as_completed(futures):
+            k = futures[future]
+            cluster_results[k], timing_rows = future.result()
+            if phase_timer is not None:
+                phase_timer.extend(timing_rows)
+            done += len(clusters[k])
+            logger.info(f"Cluster {k} done ({len(clusters[k])} vehicles), {done}/{len(trips)} vehicles")
+
+    with open(output_csv_path, 'w', newline='') as result_csv:
+        result_writer = csv.writer(result_csv)
+        result_writer.writerow(CSV_HEADERS)
+        for results in cluster_results:
+            for result in results:
+                result_writer.writerow([result.get(header, "") for header in CSV_HEADERS])
+
+    snapshot_store.close()
+    if phase_timer is not None:
+        logger.info(f"Time per phase [s]: {phase_timer.summary()}, timings written to {phase_timer.write()}")
+    return output_csv_path
+
+
+
+##########   Speculative  Version  ####################
+
+def _calibrate_trips_speculative(
+    trips: pd.DataFrame,
+    sumo_config: str,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    store: SnapshotStore,
+    iteration: int,
+    mylog: List,
+    base_estimator: str,
+    acq_func: str,
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Optional[Dict[str, float]],
+    speculative_tolerance: float,
+    result_writer=None,
+    connections: Optional[List[Any]] = None,
+    timer: Optional[PhaseTimer] = None,
+    checkpoint_every: int = 0,
+    result_csv=None,
+    engine: str = "skopt",
+) -> List[Dict[str, Any]]:
+    """Calibrate the vehicles in trips one after the other, each next vehicle speculatively in a second SUMO.
+
+    Vehicle i+1 depends on vehicle i only through depart_min and the state after vehicle i. While vehicle i
+    is optimized on the running simulation, a worker process calibrates vehicle i+1 on its own SUMO instance,
+    starting from the base state of vehicle i with vehicle i inserted at _predict_result(). When vehicle i is
+    done, the speculative result of vehicle i+1 is replayed once on the actual state. It is committed with the
+    replayed time and speed if it still passes the detector within speculative_tolerance seconds and departs
+    after vehicle i. Otherwise vehicle i+1 is optimized again on the running simulation.
+
+    Args:
+        trips: Trips DataFrame, sorted by depart
+        sumo_config: Path to SUMO config file, for the SUMO instance of the worker
+        detector: Detector ID
+        detector_mappings: Combined detector DataFrame
+        maxspeed: Maximum speed value
+        store: Store for the simulation states
+        iteration: Maximum number of iterations
+        mylog: List of calibration results, extended in place
+        stopping_rules: Early-stopping rules, see stopping_rules()
+        speculative_tolerance: Allowed deviation in time_detector_sim of the replayed speculative result in seconds
+        result_writer: Optional csv.writer, every result is written as soon as it is available
+        connections: TraCI connections for batch evaluation of the vehicles optimized on the running simulation
+        timer: Records the phase timings and logs the progress
+        checkpoint_every: Checkpoint the store every checkpoint_every vehicles (counted in mylog), 0 to disable
+        result_csv: Open file of result_writer, flushed to disk at every checkpoint
+        engine: Optimizer engine, see src.tools.optimizers
+
+    Returns:
+        List of calibration results (mylog)
+    """
+    rows = [dict(row) for _, row in trips.iterrows()]
+    speculation_store = store.spawn(f"{store.postfix}_speculative")
+    common = dict(detector=detector, detector_mappings=detector_mappings, maxspeed=maxspeed, iteration=iteration,
+                  base_estimator=base_estimator, acq_func=acq_func, n_initial_points=n_initial_points,
+                  no_speed=no_speed, stopping_rules=stopping_rules, timing=timer is not None, engine=engine)
+    start = len(mylog)
+    speculated = committed = 0
+
+    def log_result(result):
+        result["delta_time"] = result["time_detector_sim"] - result["time_detector_real"]
+        result["delta_speed"] = result["speed_detector_sim"] - result["speed_detector_real"]
+        mylog.append(result)
+        if result_writer is not None:
+            result_writer.writerow([result.get(header, "") for header in CSV_HEADERS])
+        if checkpoint_every and len(mylog) % checkpoint_every == 0:
+            _checkpoint(store, mylog, result_csv)
+        if timer is not None:
+            timer.end_vehicle(result["veh_id"], len(mylog) - start, len(rows))
+
+    # The worker is spawned, a forked one would inherit (and close) the TraCI connection of this process
+    log_files = [handler.baseFilename for handler in logging.getLogger().handlers
+                 if isinstance(handler, logging.FileHandler)]
+    initargs = (sumo_config, int(rows[0]["depart"]) - 100 if rows else 0, detector, detector_mappings,
+                speculation_store, sumo_backend.name(), logger.getEffectiveLevel(), log_files)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_start_speculation_worker, initargs=initargs) as executor:
+        n = 0
+        while n < len(rows):
+            # Vehicle n+1 starts in the worker on the predicted result of vehicle n
+            future = None
+            if n + 1 < len(rows):
+                speculation_store.link_base(store)
+                future = executor.submit(_speculate_vehicle, dict(rows[n + 1]), _predict_result(rows[n], mylog),
+                                         speculation_store, **common)
+            if timer is not None:
+                timer.start_vehicle()
+            result = _calibrate_single_vehicle(dict(rows[n]), detector, maxspeed, store, iteration, mylog,
+                                               base_estimator, acq_func, n_initial_points, no_speed,
+                                               stopping_rules, connections, timer, engine=engine)
+            log_result(result)
+            n += 1
+            if future is None:
+                continue
+
+            speculative_result, timing_rows = future.result()
+            speculated += 1
+            if timer is not None:
+                timer.start_vehicle()
+            time_speed = _replay_vehicle(speculative_result, detector, detector_mappings, maxspeed, store,
+                                         promote=False)
+            deviation = abs(time_speed[0] - speculative_result["time_detector_sim"]) if time_speed else np.inf
+            if deviation <= speculative_tolerance and speculative_result["depart"] > result["depart"]:
+                store.promote(0)
+                store.evict()
+                speculative_result["time_detector_sim"], speculative_result["speed_detector_sim"] = time_speed
+                if timer is not None:
+                    timer.extend(timing_rows)
+                log_result(speculative_result)
+                committed += 1
+                n += 1
+            else:
+                store.evict()
+                logger.info(f"Speculative result of {speculative_result['veh_id']} rejected: "
+                            f"deviation = {round(deviation, 3)} s, depart = {speculative_result['depart']} "
+                            f"(previous depart = {result['depart']})")
+        executor.submit(_stop_speculation_worker).result()
+    speculation_store.close()
+
+    logger.info(f"Speculation: {committed} of {speculated} speculative vehicles committed, "
+                f"{len(rows) - committed} vehicles optimized on the running simulation")
+    if mylog:
+        logger.info(f"Mean iterations per vehicle: {round(np.mean([r['stop_iteration'] for r in mylog]), 1)} of {iteration}")
+    return mylog
+
+
+def _predict_result(row: dict, mylog: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Guess of the result of a vehicle before it is calibrated, the starting point of the speculative next vehicle.
+
+    The physics seed if the row has one, otherwise the free-flow depart of trips() with speed factor 1, clipped to
+    the depart window of the vehicle.
+
+    Args:
+        row: Vehicle data row
+        mylog: List of calibration results so far
+
+    Returns:
+        Dictionary with veh_id, depart and speed_factor, as in a calibration result
+    """
+    depart_min = mylog[-1]["depart"] + 1 if mylog else row["time_detector_real"] - 100
+    depart_max = max(row["time_detector_real"] - 10, depart_min + 2)
+    if pd.isna(row.get("seed_depart", np.nan)):
+        depart, speed_factor = row["depart"], row["speed_factor"]
+    else:
+        depart, speed_factor = row["seed_depart"], row["seed_speed_factor"]
+    return {
+        "veh_id": row["id"],
+        "depart": int(np.clip(round(depart), depart_min, depart_max)),
+        "speed_factor": round(speed_factor * SPEED_FACTOR_RESOLUTION) / SPEED_FACTOR_RESOLUTION,
+    }
+
+
+def _start_speculation_worker(sumo_config: str, begin: int, detector: str, detector_mappings: Dict,
+                              store: SnapshotStore, backend: str, log_level: int, log_files: List[str]) -> None:
+    """Set up logging and start the SUMO instance of the speculation worker process.
+
+    Initializer of its ProcessPoolExecutor, the log records go to the log files of the parent process.
+    """
+    logging.basicConfig(level=log_level, format=mytools.LOG_FORMAT,
+                        handlers=[logging.FileHandler(log_file) for log_file in log_files] + [logging.StreamHandler()])
+    sumo_backend.select(backend)
+    _start_sumo(sumo_config, begin, detector, detector_mappings, store)
+
+
+def _stop_speculation_worker() -> None:
+    """Close the SUMO instance of the speculation worker process."""
+    if traci.isLoaded():
+        traci.close()
+
+
+def _speculate_vehicle(
+    row: dict,
+    predicted: Dict[str, Any],
+    store: SnapshotStore,
+    detector: str,
+    detector_mappings: Dict,
+    maxspeed: float,
+    iteration: int,
+    base_estimator: str,
+    acq_func: str,
+    n_initial_points: int,
+    no_speed: bool,
+    stopping_rules: Optional[Dict[str, float]] = None,
+    timing: bool = False,
+    engine: str = "skopt",
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Calibrate a vehicle on top of the predicted result of the previous one. Runs in the speculation worker.
+
+    Args:
+        row: Vehicle data row
+        predicted: Predicted result of the previous vehicle, see _predict_result()
+        store: Store of the worker, its base state is the state before the previous vehicle
+        timing: Record the per-phase timings
+        engine: Optimizer engine, see src.tools.optimizers
+
+    Returns:
+        Tuple of (calibration result, timing rows)
+    """
+    timer = PhaseTimer() if timing else None
+    _replay_vehicle(predicted, detector, detector_mappings, maxspeed, store)
+    result = _calibrate_single_vehicle(row, detector, maxspeed, store, iteration, [predicted], base_estimator,
+                                       acq_func, n_initial_points, no_speed, stopping_rules, timer=timer,
+                                       engine=engine)
+    return result, (timer.rows if timer is not None else [])
@@ -1,9 +1,28 @@
 from hamilton.function_modifiers import extract_columns, schema
+import numpy as np
 import pandas as pd
 import logging
+import os
+import glob
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from src.tools import storage as storage_format
+from src.tools.manifest import Manifest, content_hash, file_hashes
 
 logger = logging.getLogger("import_data")
 
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# Dtypes of the raw CSV columns in the chunked modes, which read only these columns. avg_speed is float even if a file
+# has integer speeds only, so that all chunks write the same speeds. The in-memory mode (raw_data) infers the dtypes
+RAW_DTYPES = {"timestamp": str, "avg_speed": "float64", "node_id": str}
+
+# Nodes of the node cache (cache: true, see src.tools.node_cache): none, fingerprinting the raw columns costs as much
+# as transforming them and storing them is slower than reading the raw file. incremental: true skips unchanged raw data
+CACHE_NODES = []
+CACHE_RECOMPUTE = []
+
 # --- 1. Read raw CSV file and extract key columns ---
 
 #@extract_columns("timestamp", "avg_speed", "node_id")
@@ -68,8 +87,7 @@ def time_detector_real(timestamp: pd.Series) -> pd.Series:
     Returns:
         Series of integer UNIX timestamps.
     """
-    s1 = pd.to_datetime(timestamp, format='%Y%m%dT%H%M%S')
-    return s1.apply(lambda x: int(x.timestamp()))
+    return _unix_time(timestamp)
 
 # --- 4. Pass speed value through (already float) ---
 
@@ -128,33 +146,38 @@ def transform_raw_data(detector_id: pd.Series, time_detector_real: pd.Series, sp
     return df
 
 
-# --- 7. Save transformed DataFrame to CSV ---
+# --- 7. Save transformed DataFrame to CSV (or Parquet) ---
 
-def save_transform_raw_data(transform_raw_data: pd.DataFrame, dataFilename: str) -> str:
+def save_transform_raw_data(transform_raw_data: pd.DataFrame, dataFilename: str, storage: str = "csv") -> str:
     """
     Saves the cleaned dataset to disk.
     
     Args:
         transform_raw_data: Cleaned and combined DataFrame.
         dataFilename: Name of the original file (used in output naming).
+        storage: "csv" (default) or "parquet" (compact dtypes, see src.tools.storage).
     
     Returns:
-        Path to the saved CSV file.
+        Path to the saved file.
     """
-    extended_output_file_path = f"data/transform_raw_data/{dataFilename}_out.csv"
+    extended_output_file_path = f"data/transform_raw_data/{dataFilename}_out.{storage_format.check_format(storage)}"
+    if storage == "parquet":
+        return storage_format.write_frame(transform_raw_data, extended_output_file_path)
     transform_raw_data.to_csv(extended_output_file_path, index=False)
     return extended_output_file_path
 
 
 # --- 8. Split data by day and save to separate files ---
 
-def split_and_save_daily(transform_raw_data: pd.DataFrame, minimumLenData:int) -> list:
+def split_and_save_daily(transform_raw_data: pd.DataFrame, minimumLenData:int, storage: str = "csv") -> list:
     """
     Adds 'day' and 'date' columns, then splits the data by date, saving each to a separate file.
     Saves only if there are more than 10,000 rows for that date.
+    With storage "parquet" every date is a dataset folder data_{date}.parquet partitioned by detector_id.
     
     Args:
         transform_raw_data: The full cleaned dataset.
+        storage: "csv" (default) or "parquet".
     
     Returns:
         A list of filenames that were saved.
@@ -167,9 +190,419 @@ def split_and_save_daily(transform_raw_data: pd.DataFrame, minimumLenData:int) -
     
     saved_files = []
     for date, group in transform_raw_data.groupby('date'):
-        file_name = f"data_{date}.csv"
+        file_name = f"data_{date}.{storage_format.check_format(storage)}"
         if len(group) > minimumLenData:
-            group.to_csv(output_dir + file_name, index=False)
+            if storage == "parquet":
+                storage_format.remove(output_dir + file_name)
+                storage_format.write_day(group, output_dir + file_name)
+            else:
+                group.to_csv(output_dir + file_name, index=False)
             saved_files.append(file_name)
     
     return saved_files
+
+
+# --- 9. Chunked import for raw files larger than memory ---
+
+def _unix_time(timestamp: pd.Series) -> pd.Series:
+    """
+    Vectorized conversion of 'YYYYMMDDTHHMMSS' strings to integer UNIX timestamps (seconds, naive times as UTC).
+    """
+    seconds = pd.to_datetime(timestamp, format=TIMESTAMP_FORMAT).to_numpy().astype("datetime64[s]")
+    return pd.Series(seconds.astype(np.int64), index=timestamp.index)
+
+
+def _transform_chunk(chunk: pd.DataFrame, node2detector: dict) -> pd.DataFrame:
+    """
+    transform_raw_data of one chunk of the raw CSV.
+    """
+    return pd.DataFrame({
+        "detector_id": chunk["node_id"].map(node2detector),
+        "time_detector_real": _unix_time(chunk["timestamp"]),
+        "speed_detector_real": chunk["avg_speed"] if "avg_speed" in chunk.columns else 0,
+    })
+
+
+def split_and_save_daily_chunked(dataFilename: str, sensor_info: pd.DataFrame, minimumLenData: int,
+                                 chunksize: int = 1000000, storage: str = "csv") -> list:
+    """
+    Streaming version of save_transform_raw_data and split_and_save_daily for raw files that do not fit in memory.
+
+    The raw CSV is read chunksize rows at a time, with only the timestamp, avg_speed and node_id columns and fixed
+    dtypes. Every chunk is transformed (vectorized timestamps, node_id mapped to detector_id) and appended to
+    'data/transform_raw_data/{dataFilename}_out.csv' and to a partial file per date. Only the row count per date is
+    kept across chunks, so the peak memory depends on chunksize and not on the file size. At the end the partial
+    files with more than minimumLenData rows become 'data/daily_splitted_data/data_{date}.csv', the others are
+    removed. The files are the same as those of the in-memory mode, except that speeds are always written as floats
+    (33.0 where the in-memory mode writes 33 for a raw file with integer speeds only). With storage "parquet" every chunk is a row group
+    of {dataFilename}_out.parquet and a part file in every detector partition of data_{date}.parquet.
+
+    Args:
+        dataFilename: The name of the raw file (without `.csv`) in 'data/raw_data/'.
+        sensor_info: DataFrame containing node_id and detector_id mapping.
+        minimumLenData: A date is saved only if it has more rows than this.
+        chunksize: Number of raw rows per chunk.
+        storage: "csv" (default) or "parquet".
+
+    Returns:
+        A list of filenames that were saved.
+    """
+    raw_data_path = f"data/raw_data/{dataFilename}.csv"
+    extension = storage_format.check_format(storage)
+    output_file_path = f"data/transform_raw_data/{dataFilename}_out.{extension}"
+    output_dir = "data/daily_splitted_data/"
+    node2detector = sensor_info.set_index('node_id')['detector_id'].to_dict()
+
+    transform_writer = storage_format.FrameWriter(output_file_path) if storage == "parquet" else None
+
+    def write_transform(number, data):
+        if transform_writer is not None:
+            transform_writer.write(data)
+        else:
+            data.to_csv(output_file_path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+
+    rows_per_date = _split_chunks(_raw_chunks(raw_data_path, chunksize), node2detector, output_dir, storage,
+                                  write_transform)
+    if transform_writer is not None:
+        transform_writer.close()
+
+    saved_files = []
+    for date in sorted(rows_per_date):
+        part_path = _part_path(output_dir, date, extension)
+        file_name = f"data_{date}.{extension}"
+        if rows_per_date[date] > minimumLenData and os.path.exists(part_path):
+            storage_format.remove(output_dir + file_name)
+            os.replace(part_path, output_dir + file_name)
+            saved_files.append(file_name)
+        else:
+            storage_format.remove(part_path)
+    return saved_files
+
+
+def _raw_chunks(raw_data_path: str, chunksize: int, offset: int = 0):
+    """
+    Chunks of the raw CSV (timestamp, avg_speed and node_id with fixed dtypes), from byte offset on if given.
+
+    offset must be the start of a line; the header is read from the first line of the file.
+    """
+    columns = list(pd.read_csv(raw_data_path, nrows=0).columns)
+    with open(raw_data_path, "rb") as file:
+        if offset:
+            file.seek(offset)
+        try:
+            yield from pd.read_csv(file, header=None if offset else 0, names=columns if offset else None,
+                                   usecols=lambda column: column in RAW_DTYPES, dtype=RAW_DTYPES, chunksize=chunksize)
+        except pd.errors.EmptyDataError:
+            return
+
+
+def _part_path(output_dir: str, date, extension: str) -> str:
+    return f"{output_dir}.data_{date}.{extension}.part"
+
+
+def _split_chunks(chunks, node2detector: dict, output_dir: str, storage: str, write_transform=None) -> dict:
+    """
+    Transforms the chunks of the raw CSV and appends their rows to a partial file per date in output_dir.
+
+    Args:
+        chunks: Chunks of the raw CSV, see _raw_chunks.
+        node2detector: node_id to detector_id mapping.
+        output_dir: Folder of the partial files (.data_{date}.{storage}.part).
+        storage: "csv" or "parquet".
+        write_transform: Called with the number and the transformed rows of every chunk, or None.
+
+    Returns:
+        Dictionary of date -> number of rows.
+    """
+    extension = storage_format.check_format(storage)
+    rows_per_date = {}
+    rows = 0
+    for number, chunk in enumerate(chunks):
+        if number == 0 and "avg_speed" not in chunk.columns:
+            logger.warning("No avg_speed column in the raw data. It's set to zero.")
+        data = _transform_chunk(chunk, node2detector)
+        if write_transform is not None:
+            write_transform(number, data)
+
+        time = pd.to_datetime(data['time_detector_real'], unit='s')
+        data['day'] = time.dt.day_name()
+        data['date'] = time.dt.date
+        for date, group in data.groupby('date'):
+            part_path = _part_path(output_dir, date, extension)
+            first = date not in rows_per_date
+            if storage == "parquet":
+                if first:
+                    storage_format.remove(part_path)
+                storage_format.write_day(group, part_path, part=number)
+            else:
+                group.to_csv(part_path, mode="w" if first else "a", header=first, index=False)
+            rows_per_date[date] = rows_per_date.get(date, 0) + len(group)
+        rows += len(chunk)
+        logger.info(f"Chunk {number + 1}: {rows} rows imported, {len(rows_per_date)} dates")
+    return rows_per_date
+
+
+# --- 10. Incremental import of a growing raw file ---
+
+def _read_daily(path: str, storage: str) -> pd.DataFrame:
+    """
+    Read a daily file back with the speeds it was written with (round_trip: same content hash in csv and Parquet)
+    """
+    if storage == "parquet":
+        return storage_format.read_day(path)
+    return pd.read_csv(path, float_precision="round_trip")
+
+
+def _day_path(day: dict, file_name: str, dailyPath: str, pending_dir: str):
+    """
+    Path of the file of a date of the manifest, None if it was moved or deleted (or written in the other storage)
+    """
+    path = (dailyPath if day["saved"] else pending_dir) + file_name
+    return path if os.path.exists(path) else None
+
+
+def _imported_offset(raw_data_path: str, imported: dict, size: int, prefix_sha256: str) -> int:
+    """
+    Byte offset of the rows not imported yet if the raw file only grew since the last import (same bytes up to the
+    old size, ending with a full line), else 0.
+    """
+    if imported is None or size <= imported["size"] or prefix_sha256 != imported["sha256"]:
+        return 0
+    with open(raw_data_path, "rb") as file:
+        file.seek(imported["size"] - 1)
+        return imported["size"] if file.read(1) == b"\n" else 0
+
+
+def split_and_save_daily_incremental(dataFilename: str, sensor_info: pd.DataFrame, minimumLenData: int,
+                                     chunksize: int = 1000000, storage: str = "csv",
+                                     dailyPath: str = "data/daily_splitted_data/") -> list:
+    """
+    Incremental version of split_and_save_daily_chunked: only new or changed dates are parsed and written.
+
+    The import is recorded in the manifest of dailyPath (see src.tools.manifest): a hash of the raw file and a content
+    hash per date.
+        - same raw file as at the last import: nothing is read or written
+        - raw file with rows appended (same bytes up to the old end): only the new bytes are parsed. A date of the
+          new rows that was imported before (a day continued at the end of the old file) is merged with its file.
+          If that file was moved or deleted, the whole file is imported instead.
+        - any other change: the whole file is parsed (chunked), but only dates whose content hash changed are written.
+          Dates imported from the file before that it no longer has are removed (files and manifest).
+    Dates with minimumLenData rows or fewer are kept in dailyPath/.pending/ until later imports bring enough rows.
+    The transform_raw_data file is not written in this mode.
+
+    Args:
+        dataFilename: The name of the raw file (without `.csv`) in 'data/raw_data/'.
+        sensor_info: DataFrame containing node_id and detector_id mapping.
+        minimumLenData: A date is saved only if it has more rows than this.
+        chunksize: Number of raw rows per chunk.
+        storage: "csv" (default) or "parquet".
+        dailyPath: Folder of the daily files and the manifest.
+
+    Returns:
+        A list of filenames that were written.
+    """
+    raw_data_path = f"data/raw_data/{dataFilename}.csv"
+    extension = storage_format.check_format(storage)
+    pending_dir = f"{dailyPath}.pending/"
+    os.makedirs(pending_dir, exist_ok=True)
+    node2detector = sensor_info.set_index('node_id')['detector_id'].to_dict()
+
+    manifest = Manifest(dailyPath)
+    imported = manifest.raw_files.get(dataFilename)
+    size = os.path.getsize(raw_data_path)
+    prefix_sha256, sha256 = file_hashes(raw_data_path, imported["size"] if imported else 0)
+    if imported is not None and imported["size"] == size and imported["sha256"] == sha256:
+        logger.info(f"{raw_data_path} is unchanged since import run {imported['run']}, nothing to import")
+        return []
+    offset = _imported_offset(raw_data_path, imported, size, prefix_sha256)
+    run = manifest.start_run(dataFilename, "append" if offset else "full")
+    logger.info(f"Import run {run}: {'new rows from byte ' + str(offset) if offset else 'whole file'} "
+                f"of {raw_data_path}")
+
+    rows_per_date = _split_chunks(_raw_chunks(raw_data_path, chunksize, offset), node2detector, dailyPath, storage)
+    missing = [str(date) for date in rows_per_date if str(date) in manifest.days and
+               _day_path(manifest.days[str(date)], f"data_{date}.{extension}", dailyPath, pending_dir) is None]
+    if offset and missing:
+        # The new rows continue a date whose file was moved or deleted, its old rows are only in the raw file
+        logger.warning(f"Import run {run}: daily files of {missing} are missing, importing the whole file instead")
+        for date in rows_per_date:
+            storage_format.remove(_part_path(dailyPath, date, extension))
+        offset = 0
+        manifest.runs[-1]["mode"] = "full"
+        rows_per_date = _split_chunks(_raw_chunks(raw_data_path, chunksize), node2detector, dailyPath, storage)
+
+    saved_files = []
+    unchanged = 0
+    for date in sorted(rows_per_date):
+        part_path = _part_path(dailyPath, date, extension)
+        file_name = f"data_{date}.{extension}"
+        day = manifest.days.get(str(date))
+        previous_path = None if day is None else _day_path(day, file_name, dailyPath, pending_dir)
+
+        data = _read_daily(part_path, storage)
+        if offset and previous_path is not None:
+            data = pd.concat([_read_daily(previous_path, storage), data], ignore_index=True)
+        day_sha256 = content_hash(data)
+        if previous_path is not None and day["sha256"] == day_sha256:
+            storage_format.remove(part_path)
+            unchanged += 1
+            continue
+
+        saved = len(data) > minimumLenData
+        storage_format.remove(dailyPath + file_name)
+        storage_format.remove(pending_dir + file_name)
+        path = (dailyPath if saved else pending_dir) + file_name
+        if offset and previous_path is not None:
+            if storage == "parquet":
+                storage_format.write_day(data, path)
+            else:
+                data.to_csv(path, index=False)
+            storage_format.remove(part_path)
+        else:
+            os.replace(part_path, path)
+        manifest.record_day(str(date), file_name, len(data), day_sha256, saved)
+        if saved:
+            saved_files.append(file_name)
+
+    if not offset:
+        # A rewritten raw file replaces all dates imported from it: dates it no longer has are removed
+        imported_dates = {str(date) for date in rows_per_date}
+        for date in sorted(manifest.days):
+            if date not in imported_dates and manifest.raw_file_of(date) == dataFilename:
+                file_name = manifest.days[date]["file"]
+                storage_format.remove(dailyPath + file_name)
+                storage_format.remove(pending_dir + file_name)
+                manifest.remove_day(date)
+        if manifest.runs[-1].get("removed"):
+            logger.warning(f"Import run {run}: {manifest.runs[-1]['removed']} are no longer in {raw_data_path}, "
+                           f"their daily files were removed")
+
+    manifest.record_raw(dataFilename, size, sha256)
+    manifest.save()
+    written = len(manifest.runs[-1]['written'])
+    logger.info(f"Import run {run}: {written} dates written ({len(saved_files)} saved, {written - len(saved_files)} "
+                f"pending), {unchanged} unchanged, new dates: {manifest.new_days()}")
+    return saved_files
+
+
+# --- 11. Parallel import of several raw files ---
+
+def _raw_files(rawFiles: str) -> list:
+    """
+    Raw CSV files of a glob pattern or a folder in 'data/raw_data/', sorted by name.
+    """
+    pattern = f"data/raw_data/{rawFiles}"
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.csv")
+    return sorted(glob.glob(pattern))
+
+
+def _ingest_file(raw_data_path: str, node2detector: dict, work_dir: str, chunksize: int, storage: str) -> dict:
+    """
+    Transforms one raw file in a worker process: transform rows to work_dir/transform.{storage}, the rows of every date
+    to a partial file in work_dir.
+
+    Returns:
+        Dictionary of date -> number of rows.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    transform_path = f"{work_dir}transform.{storage}"
+    transform_writer = storage_format.FrameWriter(transform_path) if storage == "parquet" else None
+
+    def write_transform(number, data):
+        if transform_writer is not None:
+            transform_writer.write(data)
+        else:
+            data.to_csv(transform_path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+
+    rows_per_date = _split_chunks(_raw_chunks(raw_data_path, chunksize), node2detector, work_dir, storage,
+                                  write_transform)
+    if transform_writer is not None:
+        transform_writer.close()
+    return rows_per_date
+
+
+def _concat_csv(paths: list, path: str):
+    """
+    Concatenates csv files with the same header, the header is written once.
+    """
+    with open(path, "wb") as output:
+        for number, part_path in enumerate(paths):
+            with open(part_path, "rb") as part:
+                header = part.readline()
+                if number == 0:
+                    output.write(header)
+                shutil.copyfileobj(part, output)
+
+
+def split_and_save_daily_multi(dataFilename: str, rawFiles: str, sensor_info: pd.DataFrame, minimumLenData: int,
+                               chunksize: int = 1000000, storage: str = "csv", workers: int = 0) -> list:
+    """
+    Parallel version of split_and_save_daily_chunked for raw data delivered as several files (e.g. one per sensor
+    node and day).
+
+    Every raw file is parsed (chunked) in a worker process into its own transform file and partial date files. The
+    parts are then concatenated in the order of the file names: the outputs are the same as those of the in-memory
+    mode on the concatenated files (with the speeds as floats, see split_and_save_daily_chunked), written to 'data/transform_raw_data/{dataFilename}_out.{storage}' and
+    'data/daily_splitted_data/data_{date}.{storage}'.
+
+    Args:
+        dataFilename: Name of the outputs.
+        rawFiles: Glob pattern (e.g. "2020-01-*/an0005_r*.csv") or folder of the raw CSV files in 'data/raw_data/'.
+        sensor_info: DataFrame containing node_id and detector_id mapping.
+        minimumLenData: A date is saved only if it has more rows than this.
+        chunksize: Number of raw rows per chunk.
+        storage: "csv" (default) or "parquet".
+        workers: Number of worker processes, 0 for one per CPU.
+
+    Returns:
+        A list of filenames that were saved.
+    """
+    raw_files = _raw_files(rawFiles)
+    if not raw_files:
+        raise FileNotFoundError(f"No raw files match data/raw_data/{rawFiles}")
+    extension = storage_format.check_format(storage)
+    output_file_path = f"data/transform_raw_data/{dataFilename}_out.{extension}"
+    output_dir = "data/daily_splitted_data/"
+    ingest_dir = f"{output_dir}.ingest/"
+    storage_format.remove(ingest_dir)
+    node2detector = sensor_info.set_index('node_id')['detector_id'].to_dict()
+    work_dirs = [f"{ingest_dir}{number:05d}/" for number in range(len(raw_files))]
+
+    workers = min(workers or os.cpu_count(), len(raw_files))
+    logger.info(f"Importing {len(raw_files)} raw files with {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_ingest_file, raw_data_path, node2detector, work_dir, chunksize, storage)
+                   for raw_data_path, work_dir in zip(raw_files, work_dirs)]
+        rows_per_file = []
+        for raw_data_path, future in zip(raw_files, futures):
+            rows_per_file.append(future.result())
+            logger.debug(f"{raw_data_path}: {sum(rows_per_file[-1].values())} rows")
+    logger.info(f"{sum(sum(rows_per_date.values()) for rows_per_date in rows_per_file)} rows imported")
+
+    # Merge in the order of the files
+    transform_paths = [f"{work_dir}transform.{extension}" for work_dir in work_dirs]
+    if storage == "parquet":
+        transform_writer = storage_format.FrameWriter(output_file_path)
+        for path in transform_paths:
+            transform_writer.write_file(path)
+        transform_writer.close()
+    else:
+        _concat_csv(transform_paths, output_file_path)
+
+    saved_files = []
+    dates = sorted(set().union(*rows_per_file))
+    for date in dates:
+        file_name = f"data_{date}.{extension}"
+        part_paths = [_part_path(work_dir, date, extension) for work_dir, rows_per_date in zip(work_dirs, rows_per_file)
+                      if date in rows_per_date]
+        part_paths = [path for path in part_paths if os.path.exists(path)]
+        if sum(rows_per_date.get(date, 0) for rows_per_date in rows_per_file) > minimumLenData and part_paths:
+            storage_format.remove(output_dir + file_name)
+            if storage == "parquet":
+                storage_format.merge_days(part_paths, output_dir + file_name)
+            else:
+                _concat_csv(part_paths, output_dir + file_name)
+            saved_files.append(file_name)
+    storage_format.remove(ingest_dir)
+    return saved_files
@@ -1,14 +1,18 @@
-#import libsumo as traci
-import traci
 
 import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any, Union
 import logging
 import xml.etree.ElementTree as ET
 from src.tools import mytools
+from src.tools import storage as storage_format
+from src.tools.sumo_backend import traci
 
 logger = logging.getLogger("sim")
 
+# Nodes of the node cache (cache: true, see src.tools.node_cache), the other nodes are not cached
+CACHE_NODES = ["maxspeed", "number", "postfix", "trips"]
+CACHE_RECOMPUTE = ["calibrated_data", "detector_mappings"]
+
 
 
 def maxspeed(detector: str) -> float:
@@ -47,7 +51,9 @@ def postfix(detector: str, date: str, number: int) -> str:
     else:
         return f"{detector}_{date}_{number}"
     
-def calibrated_data(postfix:str, detector:str, pathin:str) -> pd.DataFrame:
+def calibrated_data(postfix:str, detector:str, pathin:str, storage: str = "csv") -> pd.DataFrame:
+    if storage_format.check_format(storage) == "parquet":
+        return storage_format.read_frame(f'{pathin}calibrated_data_{postfix}.parquet')
     calibrated_data = pd.read_csv(f'{pathin}calibrated_data_{postfix}.csv')
     #calibrated_data = calibrated_data[calibrated_data['detector_id'] == detector]
     return calibrated_data
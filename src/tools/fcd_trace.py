@@ -0,0 +1,86 @@
+"""
+Compact columnar storage of FCD (floating car data) rows.
+
+The FCD calibration logs every vehicle of the network for every step up to the departure of the calibrated
+vehicle. Kept as one dict per row, the trajectories of all optimizer iterations of a dense detector-day take
+hundreds of MB of short-lived Python objects. An FcdTrace keeps the rows in typed arrays instead (8 bytes per
+value, vehicle and lane IDs as integer codes) and writes them straight to the fcd_data_{postfix}.csv writer.
+x and y are recorded in network coordinates and projected to lon/lat in one vectorized pass when the rows are
+written (see src.tools.geo), instead of a convertGeo round trip per row.
+"""
+from array import array
+
+import numpy as np
+
+COLUMNS = ["time", "id", "speedfactor", "x", "y", "angle", "speed", "acceleration", "pos", "lane", "noise"]
+
+# Columns stored as IDs (string codes), the others are numbers
+_CODED = ("id", "lane")
+
+
+class FcdTrace:
+    """
+    FCD rows of one simulation run, one typed array per column
+    """
+
+    def __init__(self):
+        self._columns = {column: array("q" if column in _CODED + ("time",) else "d") for column in COLUMNS}
+        self._codes = {column: {} for column in _CODED}
+        self._names = {column: [] for column in _CODED}
+
+    def __len__(self):
+        return len(self._columns["time"])
+
+    def append(self, **values):
+        """
+        Append one row, e.g. append(time=10, id="3_w2e_out", speedfactor=1.2, ...)
+        """
+        for column in COLUMNS:
+            value = values[column]
+            if column in _CODED:
+                codes = self._codes[column]
+                if value not in codes:
+                    codes[value] = len(codes)
+                    self._names[column].append(value)
+                value = codes[value]
+            self._columns[column].append(value)
+
+    def rows(self, projection=None):
+        """
+        Iterate over the rows as lists in the order of COLUMNS
+
+        Args:
+            projection: GeoProjection of the network, x and y are given as lon/lat rounded to 6 decimals.
+                None keeps the network coordinates.
+        """
+        columns = dict(self._columns)
+        if projection is not None:
+            lon, lat = projection.to_lonlat(np.asarray(columns["x"]), np.asarray(columns["y"]))
+            columns["x"], columns["y"] = np.round(lon, 6).tolist(), np.round(lat, 6).tolist()
+        names = [self._names[column].__getitem__ if column in _CODED else None for column in COLUMNS]
+        for values in zip(*(columns[column] for column in COLUMNS)):
+            yield [name(value) if name else value for name, value in zip(names, values)]
+
+    def write(self, writer, projection=None):
+        """
+        Write the rows with a csv writer
+
+        Args:
+            writer: csv.writer of the FCD file, the header is COLUMNS
+            projection: GeoProjection to write x and y as lon/lat, see rows()
+
+        Returns:
+            Number of rows written
+        """
+        writer.writerows(self.rows(projection))
+        return len(self)
+
+    def clear(self):
+        self.__init__()
+
+    @property
+    def nbytes(self):
+        """
+        Size of the column arrays in bytes
+        """
+        return sum(column.itemsize * len(column) for column in self._columns.values())
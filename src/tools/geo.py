@@ -0,0 +1,107 @@
+"""
+Projection of SUMO network coordinates to lon/lat.
+
+traci.simulation.convertGeo(x, y) is a round trip to SUMO for every point. The projection is fully described by
+the <location> element of the net.xml (netOffset and projParameter), so trajectories can be recorded in network
+x/y and projected in one vectorized pass after the run:
+
+    projection = GeoProjection.from_net("data/map/Hornsgatan.net.xml")
+    lon, lat = projection.to_lonlat(x, y)
+
+UTM projections (like the Hornsgatan network) are inverted with NumPy (Krueger series, sub-millimetre error),
+any other projParameter needs pyproj.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# WGS84 ellipsoid
+_A = 6378137.0
+_F = 1 / 298.257223563
+_K0 = 0.9996
+_FALSE_EASTING = 500000.0
+_FALSE_NORTHING_SOUTH = 10000000.0
+
+
+def _utm_series():
+    n = _F / (2 - _F)
+    radius = _A / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    beta = [n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96 - n ** 4 / 360,
+            n ** 2 / 48 + n ** 3 / 15 - 437 * n ** 4 / 1440,
+            17 * n ** 3 / 480 - 37 * n ** 4 / 840,
+            4397 * n ** 4 / 161280]
+    delta = [2 * n - 2 * n ** 2 / 3 - 2 * n ** 3 + 116 * n ** 4 / 45,
+             7 * n ** 2 / 3 - 8 * n ** 3 / 5 - 227 * n ** 4 / 45,
+             56 * n ** 3 / 15 - 136 * n ** 4 / 35,
+             4279 * n ** 4 / 630]
+    return radius, beta, delta
+
+
+_RADIUS, _BETA, _DELTA = _utm_series()
+
+
+class GeoProjection:
+    """
+    Network x/y to lon/lat, from the <location> element of a net.xml
+    """
+
+    def __init__(self, net_offset, proj_parameter):
+        """
+        Args:
+            net_offset: (x, y) offset added to the projected coordinates by SUMO
+            proj_parameter: PROJ string of the network, e.g. "+proj=utm +zone=34 +ellps=WGS84 ..."
+        """
+        self.net_offset = net_offset
+        self.proj_parameter = proj_parameter
+        params = dict(re.findall(r"\+(\w+)(?:=(\S+))?", proj_parameter))
+        if params.get("proj") == "utm" and params.get("ellps", params.get("datum")) == "WGS84":
+            self._zone = int(params["zone"])
+            self._south = "south" in params
+            self._transformer = None
+        else:
+            try:
+                import pyproj
+            except ImportError as e:
+                raise ImportError(f"Projection {proj_parameter!r} needs pyproj (pip install pyproj)") from e
+            self._transformer = pyproj.Transformer.from_proj(pyproj.Proj(proj_parameter), "EPSG:4326",
+                                                             always_xy=True)
+
+    @classmethod
+    def from_net(cls, network_file):
+        """
+        Read the projection of a net.xml, only up to its <location> element
+        """
+        for _, element in ET.iterparse(network_file):
+            if element.tag == "location":
+                x, y = (float(value) for value in element.get("netOffset").split(","))
+                return cls((x, y), element.get("projParameter"))
+        raise ValueError(f"No <location> element in {network_file}")
+
+    def to_lonlat(self, x, y):
+        """
+        Project network coordinates, the vectorized equivalent of traci.simulation.convertGeo
+
+        Args:
+            x: Network x coordinates in m (array-like)
+            y: Network y coordinates in m (array-like)
+
+        Returns:
+            Tuple of (lon, lat) arrays in degrees
+        """
+        easting = np.asarray(x, dtype=float) - self.net_offset[0]
+        northing = np.asarray(y, dtype=float) - self.net_offset[1]
+        if self._transformer is not None:
+            return self._transformer.transform(easting, northing)
+        if self._south:
+            northing = northing - _FALSE_NORTHING_SOUTH
+        xi = northing / (_K0 * _RADIUS)
+        eta = (easting - _FALSE_EASTING) / (_K0 * _RADIUS)
+        xi_prime, eta_prime = xi.copy(), eta.copy()
+        for j, beta in enumerate(_BETA, start=1):
+            xi_prime -= beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+            eta_prime -= beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        chi = np.arcsin(np.sin(xi_prime) / np.cosh(eta_prime))
+        lat = chi + sum(delta * np.sin(2 * j * chi) for j, delta in enumerate(_DELTA, start=1))
+        lon = np.radians(6 * self._zone - 183) + np.arctan2(np.sinh(eta_prime), np.cos(xi_prime))
+        return np.degrees(lon), np.degrees(lat)
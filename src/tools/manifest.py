@@ -0,0 +1,159 @@
+"""
+Manifest of the incremental import_data pipeline.
+
+The manifest (manifest.json in the daily folder) records what has been imported into that folder:
+    - raw_files:   per raw file its size and sha256 when it was last imported. The same size and hash means
+                   nothing to do. A larger file that starts with the imported bytes (the usual case of a
+                   timestamps file with a new week appended) is parsed from the old end of file only.
+    - days:        per date the output file, the number of rows, a content hash of the rows and the import run
+                   that last wrote it. Dates with too few rows (minimumLenData) are kept as pending, they are
+                   saved once later imports bring enough rows.
+    - runs:        one entry per import run (raw file, mode, dates written, dates removed because the rewritten raw
+                   file no longer has them)
+Downstream runs ask for the dates written since a run, e.g. the dates of the last import:
+    python -m src.tools.manifest data/daily_splitted_data/
+    python -m src.tools.manifest data/daily_splitted_data/ --since 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+MANIFEST_FILE = "manifest.json"
+
+# Columns of the content hash of a day, the other columns are derived from them
+HASH_COLUMNS = ["detector_id", "time_detector_real", "speed_detector_real"]
+
+
+def file_hashes(path, prefix_size=0, block_size=1 << 20):
+    """
+    sha256 of the first prefix_size bytes of a file and of the whole file, in one pass
+
+    Returns:
+        (prefix hash, file hash)
+    """
+    digest = hashlib.sha256()
+    prefix = digest.hexdigest() if prefix_size == 0 else None
+    read = 0
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(min(block_size, prefix_size - read) if prefix is None else block_size)
+            if not block:
+                break
+            digest.update(block)
+            read += len(block)
+            if prefix is None and read == prefix_size:
+                prefix = digest.copy().hexdigest()
+    return prefix, digest.hexdigest()
+
+
+def content_hash(data):
+    """
+    sha256 of the rows of a day (HASH_COLUMNS), the same for a day read back from csv or Parquet
+
+    The rows are sorted first, a Parquet day is read back grouped by detector. Rows without a detector are left out,
+    the Parquet day does not keep them. Speeds are hashed as float64, as both formats store them.
+    """
+    data = data[HASH_COLUMNS].dropna(subset=["detector_id"]).astype({"detector_id": "category", "time_detector_real": "int64",
+                                      "speed_detector_real": "float64"})
+    data = data.sort_values(HASH_COLUMNS, kind="stable", ignore_index=True)
+    return hashlib.sha256(pd.util.hash_pandas_object(data, index=False).values.tobytes()).hexdigest()
+
+
+class Manifest:
+    """
+    manifest.json of a daily folder
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.raw_files = {}
+        self.days = {}
+        self.runs = []
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                content = json.load(file)
+            self.raw_files = content["raw_files"]
+            self.days = content["days"]
+            self.runs = content["runs"]
+
+    @property
+    def run(self):
+        """
+        Number of the last import run (0 before the first one)
+        """
+        return self.runs[-1]["run"] if self.runs else 0
+
+    def start_run(self, raw_file, mode):
+        """
+        Start the next import run
+
+        Returns:
+            Number of the run
+        """
+        self.runs.append({"run": self.run + 1, "raw_file": raw_file, "mode": mode,
+                          "started": time.strftime("%Y-%m-%d %H:%M:%S"), "written": []})
+        return self.run
+
+    def record_raw(self, raw_file, size, sha256):
+        self.raw_files[raw_file] = {"size": size, "sha256": sha256, "run": self.run}
+
+    def record_day(self, date, file, rows, sha256, saved):
+        """
+        Record a date written by the current run
+        """
+        self.days[date] = {"file": file, "rows": rows, "sha256": sha256, "saved": saved, "run": self.run}
+        self.runs[-1]["written"].append(date)
+
+    def remove_day(self, date):
+        """
+        Forget a date that is no longer in its raw file, recorded as removed by the current run
+        """
+        del self.days[date]
+        self.runs[-1].setdefault("removed", []).append(date)
+
+    def raw_file_of(self, date):
+        """
+        Raw file of the import run that last wrote a date
+        """
+        return self.runs[self.days[date]["run"] - 1]["raw_file"]
+
+    def new_days(self, since=None):
+        """
+        Saved dates written after run since
+
+        Args:
+            since: Run number, None for the dates of the last run
+
+        Returns:
+            Sorted list of dates
+        """
+        since = self.run - 1 if since is None else since
+        return sorted(date for date, day in self.days.items() if day["saved"] and day["run"] > since)
+
+    def save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"raw_files": self.raw_files, "days": self.days, "runs": self.runs}, file, indent=2,
+                      sort_keys=True)
+        os.replace(temporary, self.path)
+        return self.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dates written by the incremental import_data pipeline")
+    parser.add_argument("folder", type=str, help="Daily folder with the manifest.json")
+    parser.add_argument("--since", type=int, default=None, help="Run number (default: dates of the last run)")
+    args = parser.parse_args()
+    manifest = Manifest(args.folder)
+    for date in manifest.new_days(args.since):
+        print(date)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
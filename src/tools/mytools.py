@@ -8,13 +8,15 @@ import sumolib
 
 
 # Logging setup
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
 def setup_logging(postfix, log_level="INFO", log_dir="logs"):
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, f"pipeline_{postfix}.log")
-    log_format = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
     logging.basicConfig(
         level=getattr(logging, log_level.upper(), logging.INFO),
-        format=log_format,
+        format=LOG_FORMAT,
         handlers=[
             logging.FileHandler(log_file, mode='a'),  # use mode 'w' for overwritting
             logging.StreamHandler()
@@ -132,3 +134,23 @@ def shortest_path(source_edge, destination_edge, netfile):
     route = ' '.join(edges)
     return route
 
+
+def lane_speed(lane, netfile):
+    # Speed limit of a lane in m/s
+    net = sumolib.net.readNet(netfile)
+    return net.getLane(lane).getSpeed()
+
+
+def route_to_lane(route, lane, pos, netfile):
+    # Length of a route up to a position on one of its lanes (without the junctions, so a lower bound)
+    # and the highest speed limit on the way, junction lanes included
+    net = sumolib.net.readNet(netfile, withInternal=True)
+    edges = route.split()
+    edges = edges[:edges.index(net.getLane(lane).getEdge().getID()) + 1]
+    distance = sum(net.getEdge(edge).getLength() for edge in edges[:-1]) + pos
+    lanes = [lane for edge in edges for lane in net.getEdge(edge).getLanes()]
+    for edge, next_edge in zip(edges, edges[1:]):
+        for connection in net.getEdge(edge).getConnections(net.getEdge(next_edge)):
+            if connection.getViaLaneID():
+                lanes.append(net.getLane(connection.getViaLaneID()))
+    return distance, max(lane.getSpeed() for lane in lanes)
@@ -0,0 +1,113 @@
+"""
+Cache of Hamilton node results across pipeline runs.
+
+With cache: true in the config the drivers add the Hamilton caching adapter. A node result is stored under a key of
+the node code version and of the data versions (fingerprints) of its inputs and config values, a later run with the
+same code and the same inputs loads it instead of running the node:
+    - default:     pure nodes of the module (CACHE_NODES), e.g. preprocess_data, sample_data and trips of the calib
+                   pipeline. Changing only the optimizer settings (iteration, acq_func, ...) loads all of them.
+    - recompute:   nodes reading files (CACHE_RECOMPUTE), their key would only be the file path. They always run, their
+                   result is still fingerprinted so the nodes after them load from the cache when the content is the
+                   same.
+    - disabled:    all other nodes, they write XML/csv files or start SUMO and must run every time.
+The results are files in {cache_path}results/, the least recently used ones are deleted after a run once the folder
+is larger than cache_max_mb. A deleted result is computed again by the next run that needs it.
+"""
+import inspect
+import logging
+import os
+
+from hamilton.caching.adapter import CachingEventType
+from hamilton.caching.stores.file import FileResultStore
+from hamilton.caching.stores.sqlite import SQLiteMetadataStore
+
+CACHE_PATH = "data/cache/"
+CACHE_MAX_MB = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class LruFileResultStore(FileResultStore):
+    """
+    FileResultStore that marks a result as used when it is loaded, prune() deletes the least recently used results
+    """
+
+    def get(self, data_version: str):
+        result = super().get(data_version)
+        if result is not None:
+            os.utime(self._path_from_data_version(data_version))
+        return result
+
+
+def prune(path: str, max_mb: float = CACHE_MAX_MB) -> int:
+    """
+    Delete the least recently used result files until the results folder is at most max_mb
+
+    Args:
+        path: Results folder
+        max_mb: Size limit in MB
+
+    Returns:
+        Number of deleted results
+    """
+    if not os.path.isdir(path):
+        return 0
+    files = [entry for entry in os.scandir(path) if entry.is_file()]
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    size = sum(entry.stat().st_size for entry in files)
+    deleted = 0
+    for entry in files:
+        if size <= max_mb * 1e6:
+            break
+        size -= entry.stat().st_size
+        os.remove(entry.path)
+        deleted += 1
+    return deleted
+
+
+def with_node_cache(builder, config: dict, module):
+    """
+    Add the node cache to a driver.Builder when the config asks for it (cache: true)
+
+    Args:
+        builder: driver.Builder of the pipeline
+        config: Pipeline config, cache_path (default data/cache/) sets the folder
+        module: Features module of the pipeline. Its CACHE_NODES are loaded from the cache when their code and inputs
+            are unchanged, its CACHE_RECOMPUTE nodes always run (their results are fingerprinted for the nodes after
+            them) and its other nodes are not cached. The config values are the inputs of the keys.
+
+    Returns:
+        The builder
+    """
+    if not config.get("cache", False):
+        return builder
+    cached = set(module.CACHE_NODES) | set(module.CACHE_RECOMPUTE)
+    disable = [name for name, function in inspect.getmembers(module, inspect.isfunction)
+               if function.__module__ == module.__name__ and not name.startswith("_") and name not in cached]
+    path = config.get("cache_path", CACHE_PATH)
+    os.makedirs(path, exist_ok=True)
+    return builder.with_cache(
+        path=path,
+        metadata_store=SQLiteMetadataStore(path=path),
+        result_store=LruFileResultStore(path=os.path.join(path, "results")),
+        default=module.CACHE_NODES,
+        recompute=module.CACHE_RECOMPUTE,
+        disable=disable,
+    )
+
+
+def report(dr, config: dict, logger=logger) -> None:
+    """
+    Log the nodes loaded from the cache by the last run and prune the results folder to cache_max_mb
+    """
+    if not config.get("cache", False):
+        return
+    logs = dr.cache.logs(run_id=dr.cache.last_run_id, level="info")
+    loaded = sorted(node for node, events in logs.items()
+                    if any(event.event_type == CachingEventType.GET_RESULT for event in events))
+    logger.info(f"Node cache: {len(loaded)} nodes loaded ({', '.join(loaded) or 'none'})")
+    path = os.path.join(config.get("cache_path", CACHE_PATH), "results")
+    deleted = prune(path, config.get("cache_max_mb", CACHE_MAX_MB))
+    if deleted:
+        logger.info(f"Node cache: {deleted} least recently used results deleted (cache_max_mb)")
+
@@ -0,0 +1,134 @@
+"""
+Optimizer engines of the calibration loop.
+
+Every engine searches the (depart offset, speed factor index) integer grid of the calib pipeline through the
+ask/tell interface of skopt.Optimizer:
+    - ask() / ask(n_points):  next point, or a list of n_points points, to simulate
+    - tell(x, y):             loss of one point, or of a list of points (seeds and warm-start points included)
+    - Xi, yi:                 all told points and losses, in order
+Engines (optimizer_engine in the calib config):
+    - skopt:    skopt.Optimizer with base_estimator and acq_func from the config, the surrogate (a GP by default)
+                is refit at every tell
+    - pattern:  PatternSearch, a coarse-to-fine pattern search in NumPy, constant work per ask/tell
+"""
+import itertools
+
+import numpy as np
+from skopt import Optimizer
+
+ENGINES = ("skopt", "pattern")
+
+
+def make_optimizer(engine, dimensions, base_estimator, acq_func, n_initial_points, random_state=None):
+    """
+    Optimizer of one vehicle
+
+    Args:
+        engine: "skopt" or "pattern"
+        dimensions: List of skopt.space.Integer bounds
+        base_estimator: Surrogate of the skopt engine, a name ("GP", "RF", "ET", "GBRT") or a regressor
+        acq_func: Acquisition function of the skopt engine
+        n_initial_points: Number of points before the optimizer uses what it learned (told points included)
+        random_state: Seed of the random samples
+
+    Returns:
+        Optimizer with ask(), tell(), Xi and yi
+    """
+    if engine == "skopt":
+        return Optimizer(dimensions=dimensions, base_estimator=base_estimator, acq_func=acq_func,
+                         n_initial_points=n_initial_points, random_state=random_state)
+    if engine == "pattern":
+        return PatternSearch(dimensions, n_initial_points=n_initial_points, random_state=random_state)
+    raise ValueError(f"Unknown optimizer engine '{engine}', expected one of {ENGINES}")
+
+
+class PatternSearch:
+    """
+    Coarse-to-fine pattern search on an integer grid
+
+    The first n_initial_points points are a coarse grid at the quartiles of every dimension, centre first.
+    Then the 3^d - 1 neighbours of the best point so far are polled at the current step (a quarter of the
+    range at first). A better neighbour becomes the new centre. When all neighbours have been tried, the step
+    is halved, down to 1. A converged search proposes random unseen points for the rest of the budget. Points
+    are never proposed twice.
+    """
+
+    def __init__(self, dimensions, n_initial_points=5, random_state=None):
+        """
+        Args:
+            dimensions: List of skopt.space.Integer bounds (anything with low and high)
+            n_initial_points: Number of points of the coarse grid, told points (e.g. seeds) count as well
+            random_state: Seed of the random points after convergence
+        """
+        self.low = np.array([dimension.low for dimension in dimensions])
+        self.high = np.array([dimension.high for dimension in dimensions])
+        self.rng = np.random.default_rng(random_state)
+        self.Xi = []
+        self.yi = []
+        self._n_initial_points = n_initial_points
+        self._step = np.maximum((self.high - self.low) // 4, 1)
+        self._seen = set()
+        self._pending = set()
+        fractions = itertools.product((0.5, 0.25, 0.75), repeat=len(self.low))
+        grid = [self._clip(self.low + np.array(f) * (self.high - self.low)) for f in fractions]
+        self._initial = sorted(grid, key=lambda x: sum(abs(x - (self.low + self.high) / 2)))
+        self._directions = sorted((np.array(d) for d in itertools.product((-1, 0, 1), repeat=len(self.low))
+                                   if any(d)), key=lambda d: sum(abs(d)))
+
+    def ask(self, n_points=None):
+        """
+        Next point, or a list of n_points points
+        """
+        points = [self._next() for _ in range(n_points or 1)]
+        return points if n_points else points[0]
+
+    def tell(self, x, y):
+        """
+        Loss of one point, or of a list of points
+        """
+        if len(x) and np.ndim(x[0]) > 0:
+            for x_one, y_one in zip(x, y):
+                self._tell(x_one, y_one)
+        else:
+            self._tell(x, y)
+
+    def _tell(self, x, y):
+        key = tuple(int(value) for value in x)
+        if key not in self._pending:
+            self._n_initial_points -= 1          # Told without being asked (seed or warm start)
+        self._pending.discard(key)
+        self._seen.add(key)
+        self.Xi.append(list(key))
+        self.yi.append(float(y))
+
+    def _next(self):
+        while self._n_initial_points > 0 and self._initial:
+            self._n_initial_points -= 1
+            point = tuple(int(value) for value in self._initial.pop(0))
+            if point not in self._seen:
+                return self._issue(point)
+
+        while True:
+            center = np.array(self.Xi[int(np.argmin(self.yi))]) if self.yi else self._clip((self.low + self.high) / 2)
+            for direction in self._directions:
+                point = tuple(int(value) for value in self._clip(center + direction * self._step))
+                if point not in self._seen:
+                    return self._issue(point)
+            if (self._step <= 1).all():
+                break
+            self._step = np.maximum(self._step // 2, 1)
+
+        # Converged: random unseen points, the centre again if the grid is exhausted
+        for _ in range(100):
+            point = tuple(int(value) for value in self.rng.integers(self.low, self.high + 1))
+            if point not in self._seen:
+                return self._issue(point)
+        return [int(value) for value in center]
+
+    def _issue(self, point):
+        self._seen.add(point)
+        self._pending.add(point)
+        return list(point)
+
+    def _clip(self, x):
+        return np.clip(np.round(x), self.low, self.high).astype(int)
@@ -0,0 +1,130 @@
+"""
+Per-phase timing of the calibration loop.
+
+The calib loop reports the time of every phase of every optimizer iteration to a PhaseTimer:
+    - ask_s / tell_s:        skopt acquisition optimization / surrogate refit
+    - load_state_s:          loadState of the base state
+    - save_state_s:          saveState of the iteration snapshot
+    - step_s, n_steps:       simulationStep loop until the vehicle passes the detector (incl. the TraCI getters)
+    - fcd_s:                 FCD getters (calibrated_data_FCD only)
+summary() adds up the optimizer (ask + tell) and simulation (state I/O, steps, FCD) time of the run.
+Every vehicle gets a summary row with the wall-clock and, when the calls are counted (sumo_backend.count_calls(), e.g.
+in the benchmarks), the number of TraCI calls that reach SUMO (src.tools.sumo_backend.sumo_calls(), subscription
+result reads are local and left out). After every vehicle a progress line with the ETA is logged.
+The rows are written as a sidecar next to calibrated_data_{postfix}.csv (csv, or parquet if pyarrow is installed).
+Recording is a few perf_counter() calls per iteration, cheap enough to leave on.
+"""
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from src.tools import sumo_backend
+
+logger = logging.getLogger("calib")
+
+COLUMNS = ["scope", "veh_id", "iteration", "ask_s", "tell_s", "load_state_s", "save_state_s", "step_s", "fcd_s",
+           "n_steps", "traci_calls", "wall_s"]
+OPTIMIZER_PHASES = ["ask_s", "tell_s"]
+SIMULATION_PHASES = ["load_state_s", "save_state_s", "step_s", "fcd_s"]
+
+
+class PhaseTimer:
+    """
+    Timing rows of one calibration run
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: Sidecar file, .csv or .parquet
+        """
+        self.path = path
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._vehicle_start = None
+        self._vehicle_calls = 0
+
+    def add(self, veh_id, iteration, **values):
+        """
+        Add seconds (or counts) to the phases of one iteration, e.g. add("3_w2e_out", 7, ask_s=0.12)
+        """
+        with self._lock:
+            row = self._rows.setdefault((veh_id, iteration), {"scope": "iteration", "veh_id": veh_id,
+                                                              "iteration": iteration})
+            for key, value in values.items():
+                row[key] = row.get(key, 0) + value
+
+    def start_vehicle(self):
+        self._vehicle_start = time.perf_counter()
+        self._vehicle_calls = sumo_backend.sumo_calls()
+
+    def end_vehicle(self, veh_id, done, total):
+        """
+        Add the summary row of a vehicle and log the progress
+
+        Args:
+            veh_id: Vehicle ID
+            done: Number of vehicles calibrated so far
+            total: Number of vehicles of the run
+        """
+        now = time.perf_counter()
+        self._rows[(veh_id, None)] = {
+            "scope": "vehicle",
+            "veh_id": veh_id,
+            "wall_s": now - self._vehicle_start,
+            "traci_calls": sumo_backend.sumo_calls() - self._vehicle_calls if sumo_backend.counting() else None,
+        }
+        elapsed = now - self._start
+        eta = elapsed / done * (total - done)
+        logger.info(f"Progress: {done}/{total} vehicles ({round(100 * done / total)}%), "
+                    f"{round(elapsed / done, 2)} s/vehicle, elapsed {_hms(elapsed)}, ETA {_hms(eta)}")
+
+    @property
+    def rows(self):
+        return list(self._rows.values())
+
+    def extend(self, rows):
+        """
+        Append rows recorded by another timer, e.g. in a shard worker
+        """
+        for row in rows:
+            self._rows[(row["veh_id"], row.get("iteration"), len(self._rows))] = row
+
+    def to_frame(self):
+        frame = pd.DataFrame(self.rows, columns=COLUMNS)
+        return frame.astype({"iteration": "Int64", "n_steps": "Int64", "traci_calls": "Int64"})
+
+    def write(self, path=None):
+        """
+        Write the sidecar file
+
+        Returns:
+            Path to the file
+        """
+        path = path or self.path
+        frame = self.to_frame()
+        if path.endswith(".parquet"):
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        return path
+
+    def summary(self):
+        """
+        Total seconds per phase over all iterations, with the optimizer (ask + tell) and simulation totals
+        """
+        frame = self.to_frame()
+        phases = [column for column in COLUMNS if column.endswith("_s") and column != "wall_s"]
+        totals = frame[frame["scope"] == "iteration"][phases].sum()
+        summary = totals.round(2).to_dict()
+        summary["optimizer_s"] = round(float(totals[OPTIMIZER_PHASES].sum()), 2)
+        summary["simulation_s"] = round(float(totals[SIMULATION_PHASES].sum()), 2)
+        return summary
+
+
+def _hms(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
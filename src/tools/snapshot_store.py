@@ -0,0 +1,301 @@
+"""
+Simulation state snapshots for the calibration loop.
+
+Every optimizer iteration loads the state before the current vehicle and saves the state one step after its
+departure. SUMO can only save/load states through files, so the store keeps these files in a RAM-backed folder
+(/dev/shm) by default, optionally gzip compressed, and owns their lifecycle:
+    - save(key) / load(key):  "base" is the state before the current vehicle, integers are iteration snapshots
+    - promote(key):           the best iteration snapshot becomes the new base, without a SUMO round trip
+    - evict():                drop all iteration snapshots of the vehicle that was just calibrated
+    - link_base(store):       share the base of another store (hard link), e.g. with a speculation worker
+    - close():                remove the snapshot folder (only if the store created it)
+generation identifies the base state: it changes whenever the base is saved or promoted, so results
+simulated from the base can be cached under it. The store also counts the state I/O so that the volume kept off the disk can be reported per vehicle.
+save/load accept a TraCI connection, so several SUMO instances can share the snapshots of one vehicle
+(batch evaluation, see batch_size in the calib pipeline).
+checkpoint(info) copies the base state and a JSON description of the run to the intermediate data folder,
+fsynced and atomically replaced, so that a crashed run can restore the base with restore_checkpoint() and go on.
+The previous checkpoint is kept in a second slot, restore_checkpoint() falls back to it if the newest state is corrupt.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import logging
+
+from src.tools.sumo_backend import traci
+
+logger = logging.getLogger("calib")
+
+SHM_DIR = "/dev/shm"
+
+BASE = "base"
+
+
+class SnapshotStore:
+    """
+    State snapshots of one calibration run (one postfix)
+    """
+
+    def __init__(self, path, postfix, snapshot_dir="shm", compress=False):
+        """
+        Args:
+            path: Intermediate data folder of the run
+            postfix: Postfix for filenames
+            snapshot_dir: "shm" for a RAM-backed folder (falls back to path if /dev/shm is missing),
+                          "path" for the intermediate data folder, or any other folder
+            compress: gzip the snapshots
+        """
+        self.path = path
+        self.postfix = postfix
+        self.snapshot_dir = snapshot_dir
+        self.compress = compress
+        self._owns_directory = False
+        if snapshot_dir == "shm" and os.path.isdir(SHM_DIR):
+            self.directory = tempfile.mkdtemp(prefix=f"hornsgatan_{postfix}_", dir=SHM_DIR) + os.sep
+            self._owns_directory = True
+        elif snapshot_dir in ("shm", "path"):
+            self.directory = path
+        else:
+            self.directory = os.path.join(snapshot_dir, "")
+            os.makedirs(self.directory, exist_ok=True)
+        self._keys = set()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.reset_stats()
+
+    def __getstate__(self):
+        # Stores are sent to worker processes, the lock is recreated there
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def spawn(self, postfix):
+        """
+        New store with the same settings for another postfix, e.g. a shard running in a worker process
+        """
+        return SnapshotStore(self.path, postfix, self.snapshot_dir, self.compress)
+
+    def file(self, key=BASE):
+        """
+        File name of a snapshot
+        """
+        suffix = ".gz" if self.compress else ""
+        if key == BASE:
+            return f"{self.directory}simulation_{self.postfix}.sumo.state{suffix}"
+        return f"{self.directory}simulation_{self.postfix}_{key}.sumo.state{suffix}"
+
+    def save(self, key=BASE, connection=None):
+        """
+        Save the state of connection (default: the current traci connection) as snapshot key
+        """
+        filename = self.file(key)
+        (connection or traci).simulation.saveState(filename)
+        with self._lock:
+            self._keys.add(key)
+            if key == BASE:
+                self.generation += 1
+            self.saves += 1
+            self.bytes_written += os.path.getsize(filename)
+
+    def load(self, key=BASE, connection=None):
+        """
+        Load snapshot key into connection (default: the current traci connection)
+        """
+        filename = self.file(key)
+        (connection or traci).simulation.loadState(filename)
+        with self._lock:
+            self.loads += 1
+            self.bytes_read += os.path.getsize(filename)
+
+    def promote(self, key):
+        """
+        Make snapshot key the new base state. Replaces loadState(key) + saveState(base)
+        """
+        os.replace(self.file(key), self.file(BASE))
+        self._keys.discard(key)
+        self._keys.add(BASE)
+        self.generation += 1
+
+    def link_base(self, source):
+        """
+        Make the base state of another store the base of this one, as a hard link instead of a copy (a copy across
+        file systems). Safe because a base is written only when SUMO starts, later it is replaced (promote) and the
+        link keeps the old state.
+        """
+        target = self.file(BASE)
+        _remove(target)
+        try:
+            os.link(source.file(BASE), target)
+        except OSError:
+            shutil.copyfile(source.file(BASE), target)
+        self._keys.add(BASE)
+        self.generation += 1
+
+    def evict(self):
+        """
+        Remove all iteration snapshots, only the base state is kept
+        """
+        for key in list(self._keys):
+            if key != BASE:
+                try:
+                    os.remove(self.file(key))
+                except FileNotFoundError:
+                    pass
+                self._keys.discard(key)
+
+    def persist(self, destination=None):
+        """
+        Copy the base state to durable storage (by default the intermediate data folder)
+
+        Returns:
+            Path to the copied state
+        """
+        destination = destination or f"{self.path}simulation_{self.postfix}.sumo.state" + (".gz" if self.compress else "")
+        if os.path.abspath(destination) != os.path.abspath(self.file(BASE)):
+            shutil.copyfile(self.file(BASE), destination)
+        return destination
+
+    def _checkpoint_file(self, suffix):
+        return f"{self.path}checkpoint_{self.postfix}{suffix}"
+
+    def _state_suffix(self, slot):
+        return f"_{slot}.sumo.state" + (".gz" if self.compress else "")
+
+    def checkpoint(self, info):
+        """
+        Durable checkpoint of the base state. The state is written first, into the slot the current JSON does
+        not point to, and the JSON last, so a crash at any time leaves the previous or the new checkpoint complete.
+        The state of the previous checkpoint is kept in the other slot and the JSON describes both, so a state
+        that is found corrupt later (the SHA-256 of the file no longer matches) falls back to the previous one.
+
+        Args:
+            info: JSON-serializable description of the run at this state (numpy scalars are converted)
+
+        Returns:
+            Path to the JSON file
+        """
+        previous = self.read_checkpoint()
+        # Two slots, the new state never overwrites the one the current JSON points to
+        slot = "b" if previous is not None and previous["state"].endswith(self._state_suffix("a")) else "a"
+        with open(self.file(BASE), "rb") as source:
+            data = source.read()
+        info = dict(info, state=os.path.basename(self._checkpoint_file(self._state_suffix(slot))),
+                    sha256=hashlib.sha256(data).hexdigest())
+        _durable_write(self.path + info["state"], data)
+        if previous is not None:
+            previous.pop("previous", None)
+            info["previous"] = previous
+        _durable_write(self._checkpoint_file(".json"), json.dumps(info, default=_json_default).encode())
+        return self._checkpoint_file(".json")
+
+    def read_checkpoint(self):
+        """
+        Returns:
+            info of the last checkpoint, or None if there is none
+        """
+        try:
+            with open(self._checkpoint_file(".json")) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def restore_checkpoint(self):
+        """
+        Make the state of the last checkpoint the base state. If its state file is missing or corrupt, the
+        checkpoint before it is restored instead.
+
+        Returns:
+            info of the restored checkpoint, or None if there is none
+        """
+        info = self.read_checkpoint()
+        if info is None:
+            return None
+        for slot in (info, info.get("previous")):
+            if slot is None:
+                continue
+            try:
+                with open(self.path + slot["state"], "rb") as file:
+                    data = file.read()
+            except FileNotFoundError:
+                logger.warning(f"Checkpoint state {slot['state']} is missing")
+                continue
+            if "sha256" in slot and hashlib.sha256(data).hexdigest() != slot["sha256"]:
+                logger.warning(f"Checkpoint state {slot['state']} is corrupt")
+                continue
+            with open(self.file(BASE), "wb") as file:
+                file.write(data)
+            self._keys.add(BASE)
+            self.generation += 1
+            slot.pop("previous", None)
+            return slot
+        raise RuntimeError(f"No intact checkpoint state of {self.postfix} in {self.path}")
+
+    def clear_checkpoint(self):
+        """
+        Remove the checkpoint, e.g. once the run is complete
+        """
+        info = self.read_checkpoint()
+        if info is not None:
+            for slot in ("a", "b"):
+                _remove(self._checkpoint_file(self._state_suffix(slot)))
+            _remove(self._checkpoint_file(".json"))
+
+    def close(self):
+        """
+        Remove the snapshots. The folder is only deleted if the store created it
+        """
+        self.evict()
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self._keys.clear()
+
+    def reset_stats(self):
+        self.saves = 0
+        self.loads = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def stats(self):
+        """
+        State I/O since the last reset_stats()
+        """
+        return {
+            "saves": self.saves,
+            "loads": self.loads,
+            "kB_written": round(self.bytes_written / 1024, 1),
+            "kB_read": round(self.bytes_read / 1024, 1),
+            "ram_backed": self._owns_directory,
+        }
+
+
+def _durable_write(filename, data):
+    # Write to a temporary file, fsync it and rename it over filename, then fsync the folder for the rename
+    with open(filename + ".tmp", "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(filename + ".tmp", filename)
+    folder = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(folder)
+    finally:
+        os.close(folder)
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def _json_default(value):
+    # numpy scalars (results of the optimizer and of pandas rows)
+    return value.item()
@@ -0,0 +1,184 @@
+"""
+Columnar Parquet storage of the pipeline hand-offs.
+
+With storage: parquet in the config (default csv), the data between the pipelines is written and read as Parquet
+(needs pyarrow):
+    - transform_raw_data/{dataFilename}_out.parquet:   one file
+    - daily_splitted_data/data_{date}.parquet/:        one dataset per date, partitioned by detector
+                                                       (detector_id=<detector>/part-<n>-0.parquet)
+    - calibration_data/calibrated_data_{postfix}.parquet: written at the end of the calib run, the csv stays the
+                                                       checkpoint of the run (resume)
+The columns get compact dtypes: detector_id and day are dictionary encoded (categorical in pandas), times are int64
+epoch seconds and speeds stay float64. A reader asks for its columns and for one detector, and opens only that
+partition of the day instead of parsing the whole day file.
+"""
+import os
+import shutil
+
+import pandas as pd
+
+FORMATS = ("csv", "parquet")
+
+# Compact dtypes of the known columns, the other columns keep theirs
+COMPACT_DTYPES = {
+    "detector_id": "category",
+    "time_detector_real": "int64",
+    "speed_detector_real": "float64",
+    "speed_detector_sim": "float64",
+    "day": "category",
+}
+
+PARTITION = "detector_id"
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("storage: parquet needs pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def check_format(storage):
+    if storage not in FORMATS:
+        raise ValueError(f"Unknown storage '{storage}', expected one of {FORMATS}")
+    return storage
+
+
+def compact(data):
+    """
+    Copy of data with the compact dtypes of COMPACT_DTYPES, dates as strings
+    """
+    data = data.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in data.columns})
+    if "date" in data.columns:
+        data["date"] = data["date"].astype(str)
+    return data
+
+
+def _table(data, schema=None):
+    pa, _ = _pyarrow()
+    return pa.Table.from_pandas(compact(data), schema=schema, preserve_index=False)
+
+
+def write_frame(data, path):
+    """
+    Write a DataFrame to one Parquet file
+
+    Returns:
+        Path to the file
+    """
+    _, pq = _pyarrow()
+    pq.write_table(_table(data), path)
+    return path
+
+
+def read_frame(path, columns=None):
+    return pd.read_parquet(path, columns=columns)
+
+
+class FrameWriter:
+    """
+    One Parquet file written a DataFrame (row group) at a time, for data that does not fit in memory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+        self._schema = None
+
+    def write(self, data):
+        pa, pq = _pyarrow()
+        if self._writer is None:
+            # The dictionary of a categorical column differs between chunks, the type (int32 indices) must not
+            table = _table(data)
+            self._schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                                      if pa.types.is_dictionary(field.type) else field for field in table.schema])
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(_table(data, self._schema))
+
+    def write_file(self, path):
+        """
+        Append the rows of a Parquet file, one row group at a time
+        """
+        _, pq = _pyarrow()
+        parquet_file = pq.ParquetFile(path)
+        for row_group in range(parquet_file.num_row_groups):
+            self.write(parquet_file.read_row_group(row_group).to_pandas())
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        return self.path
+
+
+def write_day(data, path, part=0):
+    """
+    Write the rows of one date to its dataset, partitioned by detector
+
+    Args:
+        data: Rows of one date
+        path: Dataset folder data_{date}.parquet
+        part: Number of the part, the files of earlier parts are kept (one part per chunk)
+    """
+    _, pq = _pyarrow()
+    # Rows of unknown nodes (no detector_id) have no partition, they stay in the transform_raw_data file only
+    data = data.dropna(subset=[PARTITION])
+    pq.write_to_dataset(_table(data), path, partition_cols=[PARTITION], basename_template=f"part-{part}-{{i}}.parquet",
+                        existing_data_behavior="overwrite_or_ignore")
+    return path
+
+
+def merge_days(paths, path):
+    """
+    Move the files of date datasets into one dataset, in the order of paths (file names prefixed with the position)
+
+    Args:
+        paths: Dataset folders of the same date, removed afterwards
+        path: Dataset folder of the merged date
+    """
+    for number, part_path in enumerate(paths):
+        for root, _, names in os.walk(part_path):
+            partition = os.path.relpath(root, part_path)
+            for name in sorted(names):
+                os.makedirs(os.path.join(path, partition), exist_ok=True)
+                os.replace(os.path.join(root, name), os.path.join(path, partition, f"{number:05d}-{name}"))
+        remove(part_path)
+    return path
+
+
+def read_day(path, detector=None, columns=None):
+    """
+    Read a date dataset, only the partition of detector if given
+
+    Args:
+        path: Dataset folder data_{date}.parquet
+        detector: Detector ID, None reads all detectors
+        columns: Columns to read, None reads all
+
+    Returns:
+        DataFrame with detector_id as a categorical column
+    """
+    filters = [(PARTITION, "==", detector)] if detector is not None else None
+    data = pd.read_parquet(path, columns=columns, filters=filters)
+    return data.reset_index(drop=True)
+
+
+def remove(path):
+    """
+    Remove a csv file or a Parquet file or dataset folder, if it exists
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def csv_to_parquet(csv_path):
+    """
+    Parquet copy of a csv file next to it (same name, .parquet)
+
+    Returns:
+        Path to the Parquet file
+    """
+    return write_frame(pd.read_csv(csv_path), os.path.splitext(csv_path)[0] + ".parquet")
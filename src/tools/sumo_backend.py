@@ -0,0 +1,203 @@
+"""
+SUMO backend selection for the calib and sim pipelines.
+
+Both pipelines talk to SUMO through the `traci` object of this module. It forwards every attribute
+to the selected backend module:
+    - "traci":   socket based TraCI, SUMO runs in its own process (default)
+    - "libsumo": SUMO is loaded into the Python process, no IPC per call.
+                 Only one simulation per process and no sumo-gui.
+
+With count_calls() (benchmarks only, off by default) every call through `traci` is counted per method, e.g.
+{"vehicle.getSpeed": 12, "simulationStep": 900}. Domains and connections handed out by `traci` (traci.simulation kept
+in a local variable, traci.getConnection(label)) count their calls too. getSubscriptionResults() and the other
+*SubscriptionResults getters are counted, but they are local reads without a round trip to SUMO, sumo_calls() leaves
+them out. simulated_seconds() adds up the simulation time advanced by simulationStep() calls (a simulationStep(target)
+jump counts all its seconds), read from the subscribed VAR_TIME before and after the step: steps of a connection
+without that subscription are not counted. Counting adds no call to SUMO. With counting off, `traci` hands out the
+backend attributes as they are.
+
+Usage:
+    from src.tools.sumo_backend import traci
+    sumo_backend.select("libsumo")
+    traci.start([...])
+"""
+import collections
+import importlib
+import inspect
+import logging
+import threading
+
+from traci import constants as tc
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("traci", "libsumo")
+
+_module = None
+_name = None
+_counting = False
+# Batch evaluation calls SUMO from several threads
+_lock = threading.Lock()
+_calls = collections.Counter()
+_simulated = [0.0]
+
+# Getters answered from the subscription results of the last step, without a call to SUMO
+LOCAL_CALLS = ("getSubscriptionResults", "getAllSubscriptionResults", "getContextSubscriptionResults",
+               "getAllContextSubscriptionResults")
+
+
+def select(name="traci"):
+    """
+    Select the backend used by all following traci.* calls
+
+    Args:
+        name: "traci" or "libsumo"
+
+    Returns:
+        The backend module
+    """
+    global _module, _name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown SUMO backend '{name}', expected one of {BACKENDS}")
+    if _module is not None and _name != name and _module.isLoaded():
+        raise RuntimeError(f"Cannot switch SUMO backend to '{name}' while a '{_name}' simulation is running")
+    _module = importlib.import_module(name)
+    _name = name
+    logger.info(f"SUMO backend: {name}")
+    return _module
+
+
+def name():
+    """
+    Name of the selected backend
+    """
+    if _module is None:
+        select()
+    return _name
+
+
+def count_calls(enabled=True):
+    """
+    Count the calls through traci from now on (or stop counting). Connections already handed out by
+    traci.getConnection() are not counted.
+    """
+    global _counting
+    _counting = enabled
+
+
+def counting():
+    """
+    True if the calls through traci are counted
+    """
+    return _counting
+
+
+def call_counts():
+    """
+    Number of calls per method since the last reset_call_counts(), e.g. {"simulationStep": 1200, ...}
+    """
+    return dict(_calls)
+
+
+def sumo_calls():
+    """
+    Number of calls that reach SUMO (all calls but the LOCAL_CALLS) since the last reset_call_counts()
+    """
+    return sum(count for method, count in _calls.items() if method.rpartition(".")[2] not in LOCAL_CALLS)
+
+
+def simulated_seconds():
+    """
+    Simulation time advanced by simulationStep() calls since the last reset_call_counts()
+    """
+    return _simulated[0]
+
+
+def reset_call_counts():
+    with _lock:
+        _calls.clear()
+        _simulated[0] = 0.0
+
+
+def _subscribed_time(target):
+    # VAR_TIME of the last step or subscribe(), a local read. None without a subscription to it
+    results = target.simulation.getSubscriptionResults()
+    return results.get(tc.VAR_TIME) if results else None
+
+
+class _Counted:
+    """
+    Counts the calls of a backend module, connection or domain and forwards them
+    """
+    def __init__(self, target, prefix=""):
+        self._target = target
+        self._prefix = prefix
+        # attribute -> (attribute of the target, wrapper), so that a wrapper is built once per attribute (bound
+        # methods are new objects on every access but compare equal)
+        self._wrappers = {}
+
+    def _get(self):
+        return self._target
+
+    def __getattr__(self, attr):
+        target = self._get()
+        value = getattr(target, attr)
+        cached = self._wrappers.get(attr)
+        if cached is not None and cached[0] == value:
+            return cached[1]
+        if hasattr(value, "subscribe"):
+            # A domain: traci.vehicle, traci.simulation, ...
+            wrapper = _Counted(value, f"{self._prefix}{attr}.")
+        elif not callable(value) or inspect.isclass(value):
+            # Constants and exception classes (traci.TraCIException)
+            return value
+        else:
+            wrapper = _counted(value, f"{self._prefix}{attr}", target)
+        self._wrappers[attr] = (value, wrapper)
+        return wrapper
+
+
+def _counted(function, method, target):
+    """
+    Counting wrapper of one method of a backend module, connection or domain
+    """
+    attr = method.rpartition(".")[2]
+
+    def counted(*args, **kwargs):
+        with _lock:
+            _calls[method] += 1
+        if attr == "simulationStep":
+            before = _subscribed_time(target)
+            result = function(*args, **kwargs)
+            after = _subscribed_time(target)
+            if before is not None and after is not None:
+                with _lock:
+                    _simulated[0] += after - before
+            return result
+        result = function(*args, **kwargs)
+        if attr == "getConnection":
+            return _Counted(result)
+        return result
+    return counted
+
+
+class _Backend(_Counted):
+    """
+    Forwards attribute access (traci.vehicle, traci.simulation, traci.TraCIException, ...) to the selected module,
+    through the counting wrappers with count_calls()
+    """
+    def __init__(self):
+        super().__init__(None)
+
+    def _get(self):
+        if _module is None:
+            select()
+        return _module
+
+    def __getattr__(self, attr):
+        if not _counting:
+            return getattr(self._get(), attr)
+        return super().__getattr__(attr)
+
+
+traci = _Backend()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The tests import the pipeline as the drivers do (from src.pipeline import ...), from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "sumo: starts a SUMO simulation (needs sumo on the PATH)")
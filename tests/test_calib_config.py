@@ -0,0 +1,80 @@
+"""
+Config values of the calib pipeline as they come from the YAML files
+"""
+import os
+
+import pytest
+import yaml
+from hamilton import driver
+
+from src.pipeline import driver_calib, features_calib
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config",
+                              "calib_example.yaml")
+
+# Thresholds written as integers in a config
+INTEGER_OPTIONS = {
+    "stop_time_tolerance": 2,
+    "stop_speed_tolerance": 1,
+    "stop_patience": 5,
+    "physics_depart_margin": 20,
+    "physics_speed_margin": 1,
+    "cluster_margin": 20,
+    "shard_tolerance": 1,
+    "speculative_tolerance": 1,
+}
+
+
+def build(config):
+    return driver.Builder().with_config(config).with_modules(features_calib).build()
+
+
+@pytest.fixture
+def example_config():
+    with open(EXAMPLE_CONFIG) as file:
+        return yaml.safe_load(file)
+
+
+@pytest.mark.parametrize("output", ["calibrated_data", "calibrated_data_sharded", "calibrated_data_clustered",
+                                    "calibrated_data_FCD"])
+def test_integer_thresholds_pass_validation(example_config, output):
+    build({**example_config, **INTEGER_OPTIONS}).validate_execution([output])
+
+
+def test_integer_stopping_rules():
+    dr = build({"iteration": 40, **INTEGER_OPTIONS})
+    assert dr.execute(["stopping_rules"])["stopping_rules"] == {
+        "max_iteration": 40, "time_tolerance": 2, "speed_tolerance": 1, "patience": 5}
+
+
+# A setting that turns each option of UNSUPPORTED_OPTIONS on, and the values that leave it off
+ON_VALUES = {"resume": True, "speculative": True, "n_shards": 4, "batch_size": 4, "warm_start": 3,
+             "lookahead": True, "clustered": True}
+OFF_VALUES = {"resume": [None, False], "speculative": [None, False], "n_shards": [None, 1], "batch_size": [None, 1],
+              "warm_start": [None, 0], "lookahead": [None, False], "clustered": [None, False]}
+
+
+def test_on_values_cover_the_unsupported_options():
+    assert set(ON_VALUES) == {option for options in driver_calib.UNSUPPORTED_OPTIONS.values() for option in options}
+
+
+@pytest.mark.parametrize("output, option", [(output, option) for output, options in
+                                            driver_calib.UNSUPPORTED_OPTIONS.items() for option in options])
+def test_unsupported_option_raises(output, option):
+    with pytest.raises(ValueError, match=rf"{output} does not support \['{option}'\]"):
+        driver_calib._check_options({option: ON_VALUES[option]}, output)
+
+
+@pytest.mark.parametrize("output, option", [(output, option) for output, options in
+                                            driver_calib.UNSUPPORTED_OPTIONS.items() for option in ON_VALUES
+                                            if option not in options])
+def test_supported_option_passes(output, option):
+    driver_calib._check_options({option: ON_VALUES[option]}, output)
+
+
+@pytest.mark.parametrize("output", driver_calib.UNSUPPORTED_OPTIONS)
+def test_options_turned_off_pass(output):
+    for option in driver_calib.UNSUPPORTED_OPTIONS[output]:
+        for value in OFF_VALUES[option]:
+            driver_calib._check_options({option: value}, output)
+    driver_calib._check_options({}, output)
@@ -0,0 +1,100 @@
+"""
+Pure helpers of the calib pipeline: interaction clusters, look-ahead target and the bounds of the optimizer
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.pipeline.features_calib import (SPEED_FACTOR_MAX, SPEED_FACTOR_MIN, SPEED_FACTOR_RESOLUTION,
+                                         _lookahead_target, _search_space, _transfer_points, interaction_clusters)
+
+NETWORK_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "map",
+                            "Hornsgatan.net.xml")
+# 30 s to the detector at speed factor 1; maxspeed is below the lane speed limit, so it is v_ref
+MAPPINGS = {"detector2lane": {"w2e_out": "151884974#0_0"}, "detector2traveltimetosensor": {"w2e_out": 30}}
+MAXSPEED = 5.0
+
+
+def clusters(times, cluster_margin=20, clustered=True):
+    trips = pd.DataFrame({"time_detector_real": times, "speed_detector_real": MAXSPEED})
+    return interaction_clusters(trips, "w2e_out", MAPPINGS, MAXSPEED, NETWORK_FILE, clustered=clustered,
+                                cluster_margin=cluster_margin)
+
+
+def test_clusters_off():
+    assert clusters([0, 100], clustered=False) is None
+
+
+def test_headway_of_exactly_travel_time_and_margin_stays_in_the_cluster():
+    # A new cluster needs a headway of more than 30 s travel time + 20 s margin
+    result = clusters([1000, 1050, 1100.5, 1150.5])
+    assert list(result["cluster"]) == [0, 0, 1, 1]
+    # The head of a cluster departs after the previous vehicle passed the detector
+    np.testing.assert_array_equal(result["depart_floor"], [-np.inf, np.nan, 1051, np.nan])
+
+
+@pytest.mark.parametrize("cluster_margin, expected", [(0, [0, 1, 2]), (25, [0, 0, 1]), (30.5, [0, 0, 0])])
+def test_cluster_margin(cluster_margin, expected):
+    assert list(clusters([1000, 1055, 1115], cluster_margin)["cluster"]) == expected
+
+
+def test_slow_vehicle_needs_a_longer_headway():
+    # At speed factor 0.6 the vehicle is 50 s on the way, a headway of 60 s is not enough with a 20 s margin
+    trips = pd.DataFrame({"time_detector_real": [1000, 1060], "speed_detector_real": [MAXSPEED, 0.6 * MAXSPEED]})
+    result = interaction_clusters(trips, "w2e_out", MAPPINGS, MAXSPEED, NETWORK_FILE, clustered=True)
+    assert list(result["cluster"]) == [0, 0]
+
+
+def test_lookahead_target_without_bounds():
+    assert _lookahead_target({"depart": 100, "speed_factor": 1.0}) is None
+    assert _lookahead_target({"depart": 100, "speed_factor": 1.0, "lookahead_distance": np.nan,
+                              "lookahead_speed": np.nan}) is None
+
+
+@pytest.mark.parametrize("distance, speed_factor, expected", [
+    (300, 1.0, 129),    # earliest arrival 130.0, jump to the step before
+    (307, 1.0, 129),    # earliest arrival 130.7, never past it
+    (300, 2.0, 114),    # faster vehicle arrives earlier
+    (5, 1.0, 99),       # arrival within the depart step, the target is not after the depart
+])
+def test_lookahead_target(distance, speed_factor, expected):
+    row = {"depart": 100, "speed_factor": speed_factor, "lookahead_distance": distance, "lookahead_speed": 10.0}
+    assert _lookahead_target(row) == expected
+
+
+def test_lookahead_target_after_the_end_of_the_simulation():
+    # A slow candidate on a long route gets a target after the last step, the step loop ends at the last vehicle
+    row = {"depart": 86000, "speed_factor": SPEED_FACTOR_MIN, "lookahead_distance": 1e5, "lookahead_speed": 1.0}
+    assert _lookahead_target(row) == int(86000 + 1e5 / SPEED_FACTOR_MIN) - 1
+
+
+def bounds(space):
+    return [(dimension.low, dimension.high) for dimension in space]
+
+
+def test_search_space_default_box():
+    space, seed = _search_space({}, depart_min=1000, depart_max=1100)
+    assert bounds(space) == [(0, 100), (SPEED_FACTOR_MIN * SPEED_FACTOR_RESOLUTION,
+                                        SPEED_FACTOR_MAX * SPEED_FACTOR_RESOLUTION)]
+    assert seed is None
+
+
+def test_search_space_seed_window_is_clipped_to_the_depart_chain():
+    row = {"seed_depart": 990, "depart_low": 950, "depart_high": 995, "seed_speed_factor": 0.5,
+           "speed_factor_low": 0.2, "speed_factor_high": 0.55}
+    space, seed = _search_space(row, depart_min=1000, depart_max=1100)
+    # The window before depart_min collapses to the first 2 s, the speed factor window to the lowest step
+    assert bounds(space) == [(0, 2), (12, 13)]
+    assert seed == [0, 12]
+
+
+def test_transfer_points_are_clipped_to_the_bounds():
+    space, _ = _search_space({}, depart_min=1000, depart_max=1100)
+    # (lead time, speed factor index, loss) of the previous vehicle, best loss first after sorting
+    warm = {"n_points": 3, "points": [(5, 200, 1.0), (500, 30, 0.5), (500, 30, 0.7), (60, 20, 2.0), (70, 20, 3.0)]}
+    points, values = _transfer_points(warm, {"time_detector_real": 1090}, 1000, space)
+    # lead 500 s is before depart_min, lead 5 s after depart_max: both clipped, the duplicate is dropped
+    assert points == [[0, 30], [85, 64], [30, 20]]
+    assert values == [0.5, 1.0, 2.0]
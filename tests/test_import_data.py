@@ -0,0 +1,28 @@
+"""
+Speeds of the import_data modes on a raw file with integer speeds only
+"""
+import pandas as pd
+
+from src.pipeline import features_import_data
+
+RAW = ("timestamp,node_id,avg_speed,lane\n"
+       "20200101T000011,an0005_r1,33,1\n"
+       "20200101T000014,an0005_r2,27,1\n"
+       "20200102T000011,an0005_r1,48,1\n")
+
+
+def test_speed_dtypes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for folder in ("raw_data", "transform_raw_data", "daily_splitted_data"):
+        (tmp_path / "data" / folder).mkdir(parents=True)
+    (tmp_path / "data" / "raw_data" / "raw.csv").write_text(RAW)
+    sensor_info = pd.DataFrame({"node_id": ["an0005_r1", "an0005_r2"], "detector_id": ["w2e_in", "e2w_in"]})
+
+    # The in-memory mode writes the speeds as the raw file has them, as it always did
+    raw = features_import_data.raw_data("raw")
+    assert raw["avg_speed"].dtype == "int64"
+    assert features_import_data.split_and_save_daily_chunked("raw", sensor_info, 0, chunksize=2) == \
+        ["data_2020-01-01.csv", "data_2020-01-02.csv"]
+    # The chunked modes read them as floats, the same in every chunk
+    day = (tmp_path / "data" / "daily_splitted_data" / "data_2020-01-01.csv").read_text().splitlines()
+    assert day[1:] == ["w2e_in,1577836811,33.0,Wednesday,2020-01-01", "e2w_in,1577836814,27.0,Wednesday,2020-01-01"]
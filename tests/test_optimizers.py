@@ -0,0 +1,80 @@
+"""
+Optimizer engines of the calibration loop (src.tools.optimizers)
+"""
+import numpy as np
+import pytest
+from skopt.space import Integer
+
+from src.tools import optimizers
+from src.tools.optimizers import PatternSearch, make_optimizer
+
+DIMENSIONS = [Integer(0, 40), Integer(5, 25)]
+
+
+def minimize(opt, loss, n_calls, n_points=None):
+    # The ask/tell loop of the calib pipeline, n_calls evaluations (iteration in the config)
+    for _ in range(0, n_calls, n_points or 1):
+        if n_points:
+            x = opt.ask(n_points=n_points)
+            opt.tell(x, [loss(point) for point in x])
+        else:
+            x = opt.ask()
+            opt.tell(x, loss(x))
+    return opt
+
+
+def distance(x, target=(13, 21)):
+    return float(np.sum(np.abs(np.array(x) - target)))
+
+
+@pytest.mark.parametrize("engine", optimizers.ENGINES)
+def test_make_optimizer(engine):
+    opt = make_optimizer(engine, DIMENSIONS, "GP", "LCB", n_initial_points=3, random_state=0)
+    minimize(opt, distance, 6)
+    assert len(opt.Xi) == len(opt.yi) == 6
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError, match=r"Unknown optimizer engine 'cmaes', expected one of \('skopt', 'pattern'\)"):
+        make_optimizer("cmaes", DIMENSIONS, "GP", "LCB", n_initial_points=3)
+
+
+@pytest.mark.parametrize("n_points", [None, 4])
+def test_pattern_search_stays_in_bounds(n_points):
+    # The optimum (50, 0) is outside the box, the search pushes against the bounds
+    opt = minimize(PatternSearch(DIMENSIONS, random_state=0), lambda x: distance(x, (50, 0)), 60, n_points)
+    points = np.array(opt.Xi)
+    assert (points >= [0, 5]).all() and (points <= [40, 25]).all()
+    assert opt.Xi[int(np.argmin(opt.yi))] == [40, 5]
+
+
+def test_pattern_search_halves_the_step_without_improvement():
+    opt = PatternSearch([Integer(0, 40), Integer(0, 40)], n_initial_points=1)
+    # A flat loss: the centre stays the best point, its neighbours are polled at steps 10, 5, 2 and 1
+    minimize(opt, lambda x: 1.0, 1 + 4 * 8)
+    assert opt.Xi[0] == [20, 20]
+    steps = [int(np.max(np.abs(np.array(x) - 20))) for x in opt.Xi[1:]]
+    assert steps == [10] * 8 + [5] * 8 + [2] * 8 + [1] * 8
+
+
+def test_pattern_search_moves_to_a_better_neighbour():
+    opt = minimize(PatternSearch(DIMENSIONS, n_initial_points=1), distance, 30)
+    assert opt.Xi[int(np.argmin(opt.yi))] == [13, 21]
+
+
+def test_pattern_search_stops_at_n_calls():
+    # More calls than the 3 x 3 grid has points: exactly n_calls points, the unseen ones first
+    opt = minimize(PatternSearch([Integer(0, 2), Integer(0, 2)], random_state=0), distance, 12)
+    assert len(opt.Xi) == len(opt.yi) == 12
+    assert len({tuple(x) for x in opt.Xi[:9]}) == 9
+
+
+def test_pattern_search_counts_told_points():
+    # Seeds and warm-start points told before the first ask take the place of coarse grid points
+    opt = PatternSearch(DIMENSIONS, n_initial_points=3)
+    opt.tell([[0, 5], [40, 25]], [5.0, 6.0])
+    x = opt.ask()
+    assert x == [20, 15]
+    opt.tell(x, 1.0)
+    # The coarse grid is done after one asked point, the next point is a neighbour of the best one
+    assert int(np.max(np.abs(np.array(opt.ask()) - [20, 15]))) == 10
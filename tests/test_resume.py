@@ -0,0 +1,162 @@
+"""
+Checkpoints of the calib run: the two slots of the store, and a run interrupted after some vehicles and resumed
+"""
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from hamilton import driver
+
+from benchmarks.bench_calib import synthetic_day
+from src.pipeline import features_calib
+from src.tools.snapshot_store import SnapshotStore
+from src.tools.sumo_backend import traci
+
+NETWORK_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "map",
+                            "Hornsgatan.net.xml")
+DETECTOR = "w2e_out"
+VEHICLES = 6
+
+
+def checkpoint_states(store, states):
+    # Checkpoint a fake base state per entry, n_done counting from 1
+    for n_done, state in enumerate(states, 1):
+        with open(store.file(), "wb") as file:
+            file.write(state)
+        store.checkpoint({"veh_id": f"{n_done}_{DETECTOR}", "n_done": n_done})
+
+
+def newest_state(store):
+    return store.path + store.read_checkpoint()["state"]
+
+
+def base_state(store):
+    with open(store.file(), "rb") as file:
+        return file.read()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(f"{tmp_path}/", "test", snapshot_dir="path")
+    yield store
+    store.close()
+
+
+def test_checkpoint_keeps_two_slots(store):
+    checkpoint_states(store, [b"state 1", b"state 2", b"state 3"])
+    assert len(glob.glob(f"{store.path}checkpoint_test_*.sumo.state")) == 2
+    with open(store.file(), "wb") as file:
+        file.write(b"later state")
+    assert store.restore_checkpoint()["n_done"] == 3
+    assert base_state(store) == b"state 3"
+
+
+@pytest.mark.parametrize("damage", ["corrupt", "missing"])
+def test_restore_falls_back_to_the_second_slot(store, damage):
+    checkpoint_states(store, [b"state 1", b"state 2", b"state 3"])
+    if damage == "corrupt":
+        with open(newest_state(store), "r+b") as file:
+            file.write(b"X")
+    else:
+        os.remove(newest_state(store))
+    info = store.restore_checkpoint()
+    assert info["n_done"] == 2 and "previous" not in info
+    assert base_state(store) == b"state 2"
+
+
+def test_restore_without_an_intact_slot(store):
+    checkpoint_states(store, [b"state 1", b"state 2"])
+    for state in glob.glob(f"{store.path}checkpoint_test_*.sumo.state"):
+        with open(state, "wb") as file:
+            file.write(b"")
+    with pytest.raises(RuntimeError, match="No intact checkpoint"):
+        store.restore_checkpoint()
+
+
+def test_clear_checkpoint(store):
+    assert store.restore_checkpoint() is None
+    checkpoint_states(store, [b"state 1", b"state 2"])
+    store.clear_checkpoint()
+    assert store.read_checkpoint() is None
+    assert glob.glob(f"{store.path}checkpoint_*") == []
+
+
+def test_truncate_csv(tmp_path):
+    path = tmp_path / "calibrated_data_test.csv"
+    path.write_text("veh_id,depart\n0_w2e_out,1000\n1_w2e_out,1003\n2_w2e_out,1006")
+    features_calib._truncate_csv(str(path), 2)
+    assert path.read_text() == "veh_id,depart\n0_w2e_out,1000\n1_w2e_out,1003\n"
+
+
+class Interrupt(Exception):
+    pass
+
+
+@pytest.fixture
+def calib_run(tmp_path, monkeypatch):
+    """
+    Run the calib DAG on a synthetic day of VEHICLES vehicles, checkpointed every 2 vehicles. run(resume, stop_after)
+    returns the IDs of the vehicles calibrated by the run, which raises Interrupt after stop_after of them.
+    """
+    pytest.importorskip("skopt")
+    if shutil.which("sumo") is None:
+        pytest.skip("sumo is not installed")
+    config = {"date": "test", "detector": DETECTOR, "iteration": 3, "init_number": VEHICLES,
+              "network_file": NETWORK_FILE, "base_estimator": "GP", "acq_func": "LCB", "n_initial_points": 2,
+              "no_speed": False, "snapshot_dir": "path", "checkpoint_every": 2}
+    for folder in ("path", "pathout", "pathin"):
+        config[folder] = f"{tmp_path}/{folder}/"
+        os.makedirs(config[folder])
+    synthetic_day(DETECTOR, VEHICLES, 600).to_csv(f"{config['pathin']}data_test.csv", index=False)
+    calibrate = features_calib._calibrate_single_vehicle
+
+    def run(resume=False, stop_after=None):
+        calibrated = []
+
+        def calibrate_until_interrupted(row, *args, **kwargs):
+            if len(calibrated) == stop_after:
+                raise Interrupt()
+            calibrated.append(row["id"])
+            return calibrate(row, *args, **kwargs)
+
+        monkeypatch.setattr(features_calib, "_calibrate_single_vehicle", calibrate_until_interrupted)
+        dr = driver.Builder().with_config(dict(config, resume=resume)).with_modules(features_calib).build()
+        try:
+            dr.execute(["calibrated_data"])
+        except Interrupt:
+            # The crash: SUMO is left running, the files as they are
+            traci.close()
+        return calibrated
+
+    run.output = f"{config['pathout']}calibrated_data_{DETECTOR}_test_{VEHICLES}.csv"
+    run.store = SnapshotStore(config["path"], f"{DETECTOR}_test_{VEHICLES}", snapshot_dir="path")
+    return run
+
+
+def read_rows(path):
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+@pytest.mark.sumo
+@pytest.mark.parametrize("corrupt_newest, n_restored", [(False, 4), (True, 2)])
+def test_resume_after_interrupt(calib_run, corrupt_newest, n_restored):
+    # Interrupted after 5 vehicles: checkpoints after vehicles 2 and 4, the row of vehicle 5 is written too
+    first = calib_run(stop_after=5)
+    interrupted = read_rows(calib_run.output)
+    assert len(interrupted) == 1 + 5
+    assert calib_run.store.read_checkpoint()["n_done"] == 4
+    if corrupt_newest:
+        with open(newest_state(calib_run.store), "r+b") as file:
+            file.write(b"X")
+
+    resumed = calib_run(resume=True)
+    # Cut back to the checkpoint and continued after it, every vehicle calibrated once
+    assert resumed[:5 - n_restored] == first[n_restored:]
+    result = pd.read_csv(calib_run.output)
+    assert list(result["veh_id"]) == first[:n_restored] + resumed
+    assert result["veh_id"].is_unique and len(result) == VEHICLES
+    assert read_rows(calib_run.output)[:1 + n_restored] == interrupted[:1 + n_restored]
+    assert calib_run.store.read_checkpoint() is None
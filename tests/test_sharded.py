@@ -0,0 +1,114 @@
+"""
+Shard windows and seam reconciliation of calibrated_data_sharded, with a stand-in for the SUMO shard runs
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.pipeline import features_calib
+from src.pipeline.features_calib import _shard_windows
+from src.tools.snapshot_store import SnapshotStore
+
+DAY_START = 1000
+
+
+def make_trips(times, travel=30):
+    times = np.asarray(times, dtype=float)
+    return pd.DataFrame({"id": [f"v{i}" for i in range(len(times))], "depart": times - travel,
+                         "time_detector_real": times})
+
+
+class FakeShard:
+    """
+    Stand-in for _calibrate_shard: every vehicle is calibrated exactly, except that a run starting cold (no replay)
+    after the start of the day misses the traffic before it, and its vehicles in the first cold_s seconds arrive
+    5 s late
+    """
+
+    def __init__(self, cold_s):
+        self.cold_s = cold_s
+        self.calls = []
+
+    def __call__(self, shard_trips, replay, store, **common):
+        self.calls.append((list(shard_trips["id"]), [r["veh_id"] for r in replay]))
+        first = shard_trips["time_detector_real"].min()
+        cold = not replay and first > DAY_START
+        results = []
+        for row in shard_trips.to_dict("records"):
+            late = 5.0 if cold and row["time_detector_real"] < first + self.cold_s else 0.0
+            results.append({"veh_id": row["id"], "depart": row["depart"], "speed_factor": 1.0,
+                            "time_detector_real": row["time_detector_real"],
+                            "time_detector_sim": row["time_detector_real"] + late})
+        store.close()
+        return results, []
+
+
+def run_sharded(tmp_path, monkeypatch, trips, fake, n_shards=3, shard_warmup=100):
+    monkeypatch.setattr(features_calib, "_calibrate_shard", fake)
+    monkeypatch.setattr(features_calib, "ProcessPoolExecutor", ThreadPoolExecutor)
+    path = f"{tmp_path}/"
+    output = features_calib.calibrated_data_sharded(
+        trips=trips, sumo_config="", detector_mappings={}, detector="w2e_out", maxspeed=13.89,
+        snapshot_store=SnapshotStore(path, "test", snapshot_dir="path"), postfix="test", pathout=path,
+        iteration=1, base_estimator="GP", acq_func="LCB", n_initial_points=1, no_speed=False, stopping_rules={},
+        physics_seeds=None, lookahead_bounds=None, phase_timer=None, n_shards=n_shards,
+        shard_warmup=shard_warmup, shard_tolerance=1.0)
+    return pd.read_csv(output)
+
+
+def test_windows_split_vehicles_evenly():
+    windows = _shard_windows(make_trips(range(DAY_START, DAY_START + 1200, 20)), 3)
+    assert [start for start, _ in windows] == [1000, 1400, 1800]
+    assert [end for _, end in windows] == [1400, 1800, np.inf]
+
+
+def test_vehicle_at_a_seam_belongs_to_the_later_window():
+    # v1 departs in the first window and passes the detector exactly at the seam
+    trips = make_trips([1000, 1100, 1100, 1200], travel=150)
+    windows = _shard_windows(trips, 2)
+    assert windows == [(1000, 1100), (1100, np.inf)]
+    owners = [[start <= t < end for start, end in windows].index(True) for t in trips["time_detector_real"]]
+    assert owners == [0, 1, 1, 1]
+
+
+def test_no_empty_windows():
+    # 4 shards of 5 vehicles, the three first chunks start at the same time and are merged
+    windows = _shard_windows(make_trips([1000, 1000, 1000, 1000, 1010]), 4)
+    assert windows == [(1000, 1010), (1010, np.inf)]
+    assert _shard_windows(make_trips([]), 4) == []
+
+
+def test_more_shards_than_vehicles():
+    windows = _shard_windows(make_trips([1000, 1050, 1200]), 8)
+    assert windows == [(1000, 1050), (1050, 1200), (1200, np.inf)]
+
+
+@pytest.mark.parametrize("cold_s, calls", [
+    (0, 3),      # no warm-up vehicle deviates, no seam is re-calibrated
+    (100, 5),    # the warm-up vehicles deviate, one round per seam
+    (600, 9),    # the owned vehicles deviate up to 470 s after the seam, three rounds per seam
+])
+def test_seams_match_the_serial_result(tmp_path, monkeypatch, cold_s, calls):
+    trips = make_trips(range(DAY_START, DAY_START + 2400, 20))
+    fake = FakeShard(cold_s)
+    results = run_sharded(tmp_path, monkeypatch, trips, fake)
+
+    assert len(fake.calls) == calls
+    assert list(results["veh_id"]) == list(trips["id"])
+    assert results["depart"].is_monotonic_increasing
+    np.testing.assert_array_equal(results["time_detector_sim"], trips["time_detector_real"])
+
+
+def test_seam_rounds_replay_the_warmup_before_them(tmp_path, monkeypatch):
+    trips = make_trips(range(DAY_START, DAY_START + 2400, 20))
+    fake = FakeShard(600)
+    run_sharded(tmp_path, monkeypatch, trips, fake)
+
+    times = trips.set_index("id")["time_detector_real"]
+    rounds = fake.calls[3:]
+    assert len(rounds) == 6
+    for head, replay in rounds:
+        start = times[head[0]]
+        assert replay == list(times[(times >= start - 100) & (times < start)].index)
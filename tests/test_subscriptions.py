@@ -0,0 +1,85 @@
+"""
+Detector and FCD values read through TraCI subscriptions against polling them with the getters, in one SUMO run
+"""
+import os
+import shutil
+
+import pytest
+
+from src.pipeline import features_calib
+from src.pipeline.features_calib import _record_fcd, _start_sumo, _subscribe
+from src.tools.fcd_trace import FcdTrace
+from src.tools import sumo_backend
+from src.tools.snapshot_store import SnapshotStore
+from src.tools.sumo_backend import traci
+from traci import constants as tc
+
+pytestmark = [pytest.mark.sumo, pytest.mark.skipif(shutil.which("sumo") is None, reason="sumo is not installed")]
+
+NETWORK_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "map",
+                            "Hornsgatan.net.xml")
+DETECTOR = "w2e_out"
+BEGIN = 1000
+
+
+def polled_fcd(simtime):
+    # The FCD rows as the calibration read them before the subscriptions, one getter per value
+    rows = []
+    for veh in traci.vehicle.getIDList():
+        x, y = traci.vehicle.getPosition(veh)
+        rows.append([int(simtime) - 1, veh, traci.vehicle.getSpeedFactor(veh), x, y,
+                     round(traci.vehicle.getAngle(veh), 2), round(traci.vehicle.getSpeed(veh), 2),
+                     round(traci.vehicle.getAcceleration(veh), 2), round(traci.vehicle.getLanePosition(veh), 2),
+                     traci.vehicle.getLaneID(veh), round(traci.vehicle.getNoiseEmission(veh), 2)])
+    return rows
+
+
+@pytest.fixture(params=sumo_backend.BACKENDS)
+def simulation(request, tmp_path):
+    sumo_backend.select(request.param)
+    path = f"{tmp_path}/"
+    mappings = features_calib.detector_mappings(NETWORK_FILE)
+    loop_file = features_calib.induction_loop_add_file(DETECTOR, mappings, "test", path)
+    config = os.path.join(path, "simulation_test.sumo.cfg")
+    with open(config, "w") as file:
+        file.write(f'<configuration><input><net-file value="{NETWORK_FILE}"/>'
+                   f'<additional-files value="{loop_file}"/></input>'
+                   f'<report><no-step-log value="true"/><no-warnings value="true"/></report></configuration>')
+    store = SnapshotStore(path, "test", snapshot_dir="path")
+    _start_sumo(config, BEGIN, DETECTOR, mappings, store)
+    # 12 vehicles 3 s apart, IDs whose string order differs from the numeric one (10_, 11_ before 2_)
+    for i in range(12):
+        traci.vehicle.add(f"{i}_{DETECTOR}", f"{DETECTOR}_route", depart=BEGIN + 3 * i, departPos="0",
+                          departSpeed="max", departLane=str(mappings["detector2laneN"][DETECTOR]))
+        traci.vehicle.setSpeedFactor(f"{i}_{DETECTOR}", 0.8 + 0.05 * i)
+        traci.vehicle.setLaneChangeMode(f"{i}_{DETECTOR}", 0)
+    yield
+    traci.close()
+    store.close()
+    sumo_backend.select("traci")
+
+
+def test_subscriptions_match_polling(simulation):
+    _subscribe(traci, DETECTOR, fcd=True)
+    simulation_domain, inductionloop = traci.simulation, traci.inductionloop
+    hit = set()
+    n_rows = 0
+    while simulation_domain.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
+        traci.simulationStep()
+        simtime = simulation_domain.getSubscriptionResults()[tc.VAR_TIME]
+        assert simtime == traci.simulation.getTime()
+
+        trace = FcdTrace()
+        _record_fcd(trace, inductionloop, DETECTOR, simtime)
+        assert list(trace.rows()) == polled_fcd(simtime)
+        n_rows += len(trace)
+
+        detector_values = inductionloop.getSubscriptionResults(DETECTOR)
+        vehicles = detector_values[tc.LAST_STEP_VEHICLE_ID_LIST]
+        assert list(vehicles) == list(traci.inductionloop.getLastStepVehicleIDs(DETECTOR))
+        assert detector_values[tc.LAST_STEP_MEAN_SPEED] == traci.inductionloop.getLastStepMeanSpeed(DETECTOR)
+        hit.update(vehicles)
+
+    # Every vehicle passed the detector and was in the FCD of several steps
+    assert len(hit) == 12
+    assert n_rows > 12 * 10